@@ -16,7 +16,10 @@
 """A set of actions for generating various types of completions using an LLMs."""
 
 import asyncio
+import hashlib
+import json
 import logging
+import os
 import random
 import re
 import sys
@@ -25,7 +28,7 @@ import uuid
 from ast import literal_eval
 from functools import lru_cache
 from time import time
-from typing import Callable, List, Optional, cast
+from typing import Callable, Dict, List, Optional, Tuple, cast
 
 from jinja2 import Environment, meta
 from langchain.llms import BaseLLM
@@ -41,6 +44,7 @@ from nemoguardrails.actions.llm.utils import (
     get_retrieved_relevant_chunks,
     get_top_k_nonempty_lines,
     llm_call,
+    normalize_user_message,
     strip_quotes,
 )
 from nemoguardrails.colang import parse_colang_file
@@ -49,9 +53,12 @@ from nemoguardrails.colang.v2_x.runtime.eval import eval_expression
 from nemoguardrails.context import (
     generation_options_var,
     llm_call_info_var,
+    llm_stats_var,
     raw_llm_request,
     streaming_handler_var,
 )
+from nemoguardrails.embeddings.basic import BasicEmbeddingsIndex
+from nemoguardrails.embeddings.centroids import IntentCentroidClassifier
 from nemoguardrails.embeddings.index import EmbeddingsIndex, IndexItem
 from nemoguardrails.kb.kb import KnowledgeBase
 from nemoguardrails.llm.params import llm_params
@@ -59,8 +66,13 @@ from nemoguardrails.llm.prompts import get_prompt
 from nemoguardrails.llm.taskmanager import LLMTaskManager
 from nemoguardrails.llm.types import Task
 from nemoguardrails.logging.explain import LLMCallInfo
+from nemoguardrails.logging.processing_log import processing_log_var
 from nemoguardrails.patch_asyncio import check_sync_call_from_async_loop
-from nemoguardrails.rails.llm.config import EmbeddingSearchProvider, RailsConfig
+from nemoguardrails.rails.llm.config import (
+    EmbeddingSearchProvider,
+    RailsConfig,
+    UserMessagesConfig,
+)
 from nemoguardrails.rails.llm.options import GenerationOptions
 from nemoguardrails.streaming import StreamingHandler
 from nemoguardrails.utils import new_event_dict
@@ -92,8 +104,14 @@ class LLMGenerationActions:
         self.user_messages = config.user_messages.copy()
         self.bot_messages = config.bot_messages.copy()
 
-        # If we have user messages, we build an index with them
+        # If we have user messages, we build an index with them, and a lookup of the
+        # normalized examples for the exact matches.
+        self.user_message_lookup: Dict[str, str] = {}
         self.user_message_index = None
+        self.user_intent_classifier: Optional[IntentCentroidClassifier] = None
+
+        # The bot intent which always follows a user intent in the flows, by user intent.
+        self.next_step_lookup: Dict[str, str] = {}
         self.bot_message_index = None
         self.flows_index = None
 
@@ -101,6 +119,10 @@ class LLMGenerationActions:
             get_embedding_search_provider_instance
         )
 
+        intent_detector = config.rails.dialog.user_messages.intent_detector
+        if intent_detector not in ["default", "centroids"]:
+            raise ValueError(f"Unknown intent detector: {intent_detector}")
+
         # There are still some edge cases not covered by nest_asyncio.
         # Using a separate thread always for now.
         loop = asyncio.get_event_loop()
@@ -207,6 +229,58 @@ class LLMGenerationActions:
             if flow.name.startswith("bot "):
                 self._extract_bot_message_example(flow)
 
+    async def _build_index(self, items: List[IndexItem]) -> EmbeddingsIndex:
+        """Creates and builds an embeddings index with the provided items.
+
+        If the persistence is enabled, and the index supports it, the index is loaded
+        from the cache directory if it was already built for the same items, the same
+        embedding model and the same index settings. Otherwise, it is built and saved.
+        """
+        esp_config = self.config.core.embedding_search_provider
+        index = self.get_embedding_search_provider_instance(esp_config)
+
+        if not esp_config.persistence.enabled or not isinstance(
+            index, BasicEmbeddingsIndex
+        ):
+            await index.add_items(items)
+            await index.build()
+            return index
+
+        # As part of the hash, we also include the embedding engine, the model and its
+        # parameters (e.g., the `base_url` of a deployment), and the settings of the
+        # index, to prevent the cache being used incorrectly when any of them changes.
+        # The API key does not change the embeddings, so it is not included.
+        md5_hash = hashlib.md5(
+            json.dumps(
+                [
+                    esp_config.name,
+                    index.embedding_engine,
+                    index.embedding_model,
+                    {k: v for k, v in index.embedding_params.items() if k != "api_key"},
+                    [
+                        index.n_trees,
+                        index.search_k,
+                        index.autotune,
+                        index.target_recall,
+                    ],
+                    [item.text for item in items],
+                ],
+                sort_keys=True,
+                default=str,
+            ).encode("utf-8")
+        ).hexdigest()
+        path = os.path.join(esp_config.persistence.cache_dir, md5_hash)
+
+        if await index.load(path):
+            log.info(f"Loaded the embeddings index from {path}.")
+            await index.add_items(items)
+        else:
+            await index.add_items(items)
+            await index.build()
+            await index.save(path)
+
+        return index
+
     async def _init_user_message_index(self):
         """Initializes the index of user messages."""
 
@@ -222,13 +296,76 @@ class LLMGenerationActions:
         if len(items) == 0:
             return
 
-        self.user_message_index = self.get_embedding_search_provider_instance(
-            self.config.core.embedding_search_provider
-        )
-        await self.user_message_index.add_items(items)
+        self.user_message_lookup = self._build_user_message_lookup(items)
 
         # NOTE: this should be very fast, otherwise needs to be moved to separate thread.
-        await self.user_message_index.build()
+        self.user_message_index = await self._build_index(items)
+
+        if self.config.rails.dialog.user_messages.intent_detector == "centroids":
+            self.user_intent_classifier = await self._build_user_intent_classifier(
+                items
+            )
+
+    async def _build_user_intent_classifier(
+        self, items: List[IndexItem]
+    ) -> IntentCentroidClassifier:
+        """Builds the classifier of the user intents from the user message index."""
+        if isinstance(self.user_message_index, BasicEmbeddingsIndex):
+            # The embeddings are already in the index, even if it was loaded.
+            items, embeddings = self.user_message_index.get_item_embeddings()
+        else:
+            embeddings = await self.user_message_index.get_embeddings(
+                [item.text for item in items]
+            )
+
+        classifier = IntentCentroidClassifier(
+            centroids_per_intent=self.config.rails.dialog.user_messages.centroids_per_intent
+        )
+        return classifier.fit([item.meta["intent"] for item in items], embeddings)
+
+    @staticmethod
+    def _build_user_message_lookup(items: List[IndexItem]) -> Dict[str, str]:
+        """Builds the lookup of the user intents by normalized user message.
+
+        The examples used for several intents are ambiguous, so they are left out.
+        """
+        lookup = {}
+        ambiguous = set()
+        for item in items:
+            key = normalize_user_message(item.text)
+            if lookup.get(key, item.meta["intent"]) != item.meta["intent"]:
+                ambiguous.add(key)
+            lookup[key] = item.meta["intent"]
+
+        for key in ambiguous:
+            del lookup[key]
+
+        return lookup
+
+    def _lookup_user_intent(self, text: str) -> Optional[str]:
+        """Looks up the user intent of an exact match of a user message example.
+
+        The lookups and the hits are recorded in the LLM stats and the processing log.
+        """
+        intent = self.user_message_lookup.get(normalize_user_message(text))
+
+        llm_stats = llm_stats_var.get()
+        if llm_stats:
+            llm_stats.inc("intent_exact_match_lookups")
+            if intent is not None:
+                llm_stats.inc("intent_exact_match_hits")
+
+        processing_log = processing_log_var.get()
+        if processing_log is not None:
+            processing_log.append(
+                {
+                    "type": "intent_exact_match",
+                    "timestamp": time(),
+                    "data": {"hit": intent is not None},
+                }
+            )
+
+        return intent
 
     async def _init_bot_message_index(self):
         """Initializes the index of bot messages."""
@@ -245,13 +382,8 @@ class LLMGenerationActions:
         if len(items) == 0:
             return
 
-        self.bot_message_index = self.get_embedding_search_provider_instance(
-            self.config.core.embedding_search_provider
-        )
-        await self.bot_message_index.add_items(items)
-
         # NOTE: this should be very fast, otherwise needs to be moved to separate thread.
-        await self.bot_message_index.build()
+        self.bot_message_index = await self._build_index(items)
 
     async def _init_flows_index(self):
         """Initializes the index of flows."""
@@ -259,6 +391,9 @@ class LLMGenerationActions:
         if not self.config.flows:
             return
 
+        if self.config.colang_version == "1.0":
+            self.next_step_lookup = self._build_next_step_lookup(self.config.flows)
+
         items = []
         for flow in self.config.flows:
             # We don't include the system flows in the index because we don't want
@@ -282,13 +417,69 @@ class LLMGenerationActions:
         if len(items) == 0:
             return
 
-        self.flows_index = self.get_embedding_search_provider_instance(
-            self.config.core.embedding_search_provider
+        # NOTE: this should be very fast, otherwise needs to be moved to separate thread.
+        self.flows_index = await self._build_index(items)
+
+    @staticmethod
+    def _build_next_step_lookup(flows: List[dict]) -> Dict[str, str]:
+        """Builds the lookup of the next bot intent by user intent, from the flows.
+
+        Only the user intents which are always followed by the same bot intent are
+        included, e.g., not the ones followed by an action or by a branching.
+        """
+        next_steps = {}
+        for flow in flows:
+            if flow.get("is_system_flow", False):
+                continue
+
+            elements = flow.get("elements", [])
+            for element, next_element in zip(elements, elements[1:] + [None]):
+                if element.get("_type") != "UserIntent" or element.get("intent_params"):
+                    continue
+
+                next_step = None
+                if (
+                    next_element is not None
+                    and next_element.get("_type") == "run_action"
+                    and next_element.get("action_name") == "utter"
+                ):
+                    next_step = next_element["action_params"]["value"]
+
+                next_steps.setdefault(element["intent_name"], set()).add(next_step)
+
+        return {
+            user_intent: steps.pop()
+            for user_intent, steps in next_steps.items()
+            if len(steps) == 1 and None not in steps
+        }
+
+    async def _lookup_next_step(self, user_intent: str) -> Optional[str]:
+        """Looks up the next bot intent for a user intent in the flows.
+
+        If the user intent is not in the flows, the next step of the closest user intent
+        in the flows index is used, if it is similar enough.
+        """
+        if user_intent in self.next_step_lookup:
+            return self.next_step_lookup[user_intent]
+
+        threshold = self.config.rails.dialog.next_steps.lookup_similarity_threshold
+        if threshold is None or not self.flows_index:
+            return None
+
+        results = await self.flows_index.search_with_scores(
+            text=f"user {user_intent}", max_results=10
         )
-        await self.flows_index.add_items(items)
+        for result, score in results:
+            line = result.text.strip()
+            if not line.startswith("user "):
+                continue
 
-        # NOTE: this should be very fast, otherwise needs to be moved to separate thread.
-        await self.flows_index.build()
+            # We only consider the closest user intent.
+            if score is not None and score >= threshold:
+                return self.next_step_lookup.get(line[5:])
+            return None
+
+        return None
 
     def _get_general_instructions(self):
         """Helper to extract the general instruction."""
@@ -328,6 +519,35 @@ class LLMGenerationActions:
 
         return sample_conversation
 
+    @staticmethod
+    def _is_confident_intent_match(
+        scored_results: List[Tuple[IndexItem, Optional[float]]],
+        user_messages_config: UserMessagesConfig,
+    ) -> bool:
+        """Checks if the closest user message can be used for the user intent, without
+        calling the LLM.
+
+        The closest user message must pass the similarity threshold, and be closer than
+        the closest user message with another intent by the similarity margin.
+        """
+        threshold = user_messages_config.embeddings_only_similarity_threshold
+        if threshold is None:
+            return True
+
+        top_item, top_score = scored_results[0]
+        if top_score is None or top_score < threshold:
+            return False
+
+        for item, score in scored_results[1:]:
+            if item.meta["intent"] != top_item.meta["intent"]:
+                return (
+                    score is not None
+                    and top_score - score
+                    >= user_messages_config.embeddings_only_similarity_margin
+                )
+
+        return True
+
     @action(is_system_action=True)
     async def generate_user_intent(
         self,
@@ -362,24 +582,72 @@ class LLMGenerationActions:
 
             log.info("Phase 1 :: Generating user intent")
 
+            # If the user message is one of the examples, we use its intent directly.
+            if config.rails.dialog.user_messages.exact_match:
+                user_intent = self._lookup_user_intent(event["text"])
+                if user_intent is not None:
+                    log.info(f"Exact match for user intent: {user_intent}")
+                    return ActionResult(
+                        events=[new_event_dict("UserIntent", intent=user_intent)]
+                    )
+
+            # If the centroids of the intents are used, we take the most likely intent,
+            # if it is likely enough.
+            if self.user_intent_classifier:
+                embedding = (
+                    await self.user_message_index.get_embeddings([event["text"]])
+                )[0]
+                user_intent, score = self.user_intent_classifier.classify(
+                    embedding, max_results=1
+                )[0]
+                if score >= config.rails.dialog.user_messages.centroids_min_score:
+                    log.info(f"Centroid match for user intent: {user_intent}")
+                    return ActionResult(
+                        events=[new_event_dict("UserIntent", intent=user_intent)]
+                    )
+
+                log.info(
+                    "The most likely intent is not likely enough, "
+                    "falling back to the default intent detection."
+                )
+
             # We search for the most relevant similar user utterance
             examples = ""
             potential_user_intents = []
 
             if self.user_message_index:
-                results = await self.user_message_index.search(
+                scored_results = await self.user_message_index.search_with_scores(
                     text=event["text"], max_results=5
                 )
+                results = [result for result, _ in scored_results]
 
                 # If the option to use only the embeddings is activated, we take the first
-                # canonical form.
-                if results and config.rails.dialog.user_messages.embeddings_only:
-                    return ActionResult(
-                        events=[
-                            new_event_dict(
-                                "UserIntent", intent=results[0].meta["intent"]
-                            )
-                        ]
+                # canonical form, if the match is confident enough.
+                user_messages_config = config.rails.dialog.user_messages
+                if results and user_messages_config.embeddings_only:
+                    if self._is_confident_intent_match(
+                        scored_results, user_messages_config
+                    ):
+                        return ActionResult(
+                            events=[
+                                new_event_dict(
+                                    "UserIntent", intent=results[0].meta["intent"]
+                                )
+                            ]
+                        )
+                    elif user_messages_config.embeddings_only_fallback_intent:
+                        return ActionResult(
+                            events=[
+                                new_event_dict(
+                                    "UserIntent",
+                                    intent=user_messages_config.embeddings_only_fallback_intent,
+                                )
+                            ]
+                        )
+
+                    log.info(
+                        "The closest user message is not similar enough, "
+                        "falling back to the LLM."
                     )
 
                 # We add these in reverse order so the most relevant is towards the end.
@@ -532,7 +800,10 @@ class LLMGenerationActions:
 
             output_events.append(new_event_dict("BotMessage", text=text))
 
-            return ActionResult(events=output_events)
+            return ActionResult(
+                events=output_events,
+                context_updates=self._get_streaming_context_updates(),
+            )
 
     async def _search_flows_index(self, text, max_results):
         """Search the index of flows."""
@@ -575,6 +846,15 @@ class LLMGenerationActions:
 
             user_intent = event["intent"]
 
+            # If the next step can be found in the flows, we don't need the LLM.
+            if self.config.rails.dialog.next_steps.lookup:
+                bot_intent = await self._lookup_next_step(user_intent)
+                if bot_intent is not None:
+                    log.info(f"Next step found in the flows: bot {bot_intent}")
+                    return ActionResult(
+                        events=[new_event_dict("BotIntent", intent=bot_intent)]
+                    )
+
             # We search for the most relevant similar flows
             examples = ""
             if self.flows_index:
@@ -677,6 +957,17 @@ class LLMGenerationActions:
 
         return ActionResult(return_value=None)
 
+    def _get_streaming_context_updates(self) -> dict:
+        """Returns the context updates for a bot message that is streamed.
+
+        When the output rails are run on the streamed chunks, they are skipped for the
+        full bot message.
+        """
+        if streaming_handler_var.get() and self.config.rails.output.streaming.enabled:
+            return {"skip_output_rails": True}
+
+        return {}
+
     def _render_string(
         self,
         template_str: str,
@@ -789,7 +1080,8 @@ class LLMGenerationActions:
                             ]
                             text = await _streaming_handler.wait()
                             return ActionResult(
-                                events=[new_event_dict("BotMessage", text=text)]
+                                events=[new_event_dict("BotMessage", text=text)],
+                                context_updates=self._get_streaming_context_updates(),
                             )
                         else:
                             if streaming_handler:
@@ -797,7 +1089,10 @@ class LLMGenerationActions:
                                     bot_message_event["text"]
                                 )
 
-                            return ActionResult(events=[bot_message_event])
+                            return ActionResult(
+                                events=[bot_message_event],
+                                context_updates=self._get_streaming_context_updates(),
+                            )
 
             # If we are in passthrough mode, we just use the input for prompting
             if self.config.passthrough:
@@ -920,6 +1215,8 @@ class LLMGenerationActions:
 
             log.info(f"Generated bot message: {bot_utterance}")
 
+        context_updates.update(self._get_streaming_context_updates())
+
         if bot_utterance:
             bot_utterance = clean_utterance_content(bot_utterance)
             # In streaming mode, we also push this.
@@ -14,6 +14,7 @@
 # limitations under the License.
 
 import re
+import string
 from typing import Any, List, Optional, Union
 
 from langchain.base_language import BaseLanguageModel
@@ -441,6 +442,15 @@ def get_top_k_nonempty_lines(s: str, k: int = 1) -> Optional[List[str]]:
     return lines[:k]
 
 
+def normalize_user_message(s: str) -> str:
+    """Helper that normalizes a user message for the exact matching of user intents.
+
+    The message is lowercased, the whitespace collapsed, and the leading and trailing
+    punctuation removed, e.g., "  Hi there! " becomes "hi there".
+    """
+    return " ".join(s.lower().split()).strip(string.punctuation + " ")
+
+
 def strip_quotes(s: str) -> str:
     """Helper that removes quotes from a string if the entire string is between quotes"""
     if s and s[0] == '"':
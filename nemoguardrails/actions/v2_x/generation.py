@@ -95,13 +95,7 @@ class LLMGenerationActionsV2dotx(LLMGenerationActions):
         if len(items) == 0:
             return None
 
-        flows_index = self.get_embedding_search_provider_instance(
-            self.config.core.embedding_search_provider
-        )
-        await flows_index.add_items(items)
-        await flows_index.build()
-
-        return flows_index
+        return await self._build_index(items)
 
     async def _init_flows_index(self) -> None:
         """Initializes the index of flows."""
@@ -720,6 +720,12 @@ class ColangParser:
             elif define_token in ["response"]:
                 modifiers["is_response"] = True
 
+            # For rails that alter the message they check, or that don't
+            elif define_token in ["mutating"]:
+                modifiers["mutating"] = True
+            elif define_token in ["read-only", "readonly", "read_only"]:
+                modifiers["mutating"] = False
+
             else:
                 raise Exception(f'Unknown token: "{define_token}"')
 
@@ -14,11 +14,40 @@
 # limitations under the License.
 
 import re
+from functools import lru_cache
+from typing import Any, List, Tuple
 
-from simpleeval import simple_eval
+from simpleeval import SimpleEval
 
 from nemoguardrails.colang.v1_0.runtime.utils import AttributeDict
 
+# The maximum number of compiled expressions that are cached.
+EXPRESSION_CACHE_SIZE = 1024
+
+_var_name_pattern = re.compile(r"\$([a-zA-Z_][a-zA-Z0-9_]*)")
+
+
+@lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def compile_expression(expr: str) -> Tuple[str, Any, List[str]]:
+    """Compiles an expression so that it can be evaluated multiple times.
+
+    The compiled expressions are cached, keyed by the source of the expression.
+    The cache statistics are available through `compile_expression.cache_info()`.
+
+    Args:
+        expr (str): The expression to be compiled.
+
+    Returns:
+        Tuple[str, Any, List[str]]: The updated expression where the `$` variables are
+          replaced with `var_` names, the parsed AST and the names of the variables.
+    """
+    # We search for all variable names starting with $, remove the $ and add
+    # the value in the globals dict for eval
+    var_names = list(dict.fromkeys(_var_name_pattern.findall(expr)))
+    updated_expr = _var_name_pattern.sub(r"var_\1", expr)
+
+    return updated_expr, SimpleEval.parse(updated_expr), var_names
+
 
 def eval_expression(expr, context):
     """
@@ -43,29 +72,23 @@ def eval_expression(expr, context):
 
         return expr
 
-    # We search for all variable names starting with $, remove the $ and add
-    # the value in the globals dict for eval
-    var_names = re.findall(r"\$([a-zA-Z_][a-zA-Z0-9_]*)", expr)
-    updated_expr = re.sub(r"\$([a-zA-Z_][a-zA-Z0-9_]*)", r"var_\1", expr)
-    expr_locals = {}
-
-    for var_name in var_names:
-        # if we've already computed the value, we skip
-        if f"var_{var_name}" in expr_locals:
-            continue
+    try:
+        updated_expr, parsed_expr, var_names = compile_expression(expr)
 
-        val = context.get(var_name)
+        expr_locals = {}
+        for var_name in var_names:
+            val = context.get(var_name)
 
-        # We transform dicts to AttributeDict so we can access their keys as attributes
-        # e.g. write things like $speaker.name
-        if isinstance(val, dict):
-            val = AttributeDict(val)
+            # We transform dicts to AttributeDict so we can access their keys as attributes
+            # e.g. write things like $speaker.name
+            if isinstance(val, dict):
+                val = AttributeDict(val)
 
-        expr_locals[f"var_{var_name}"] = val
+            expr_locals[f"var_{var_name}"] = val
 
-    # Finally, just evaluate the expression
-    try:
+        # Finally, just evaluate the expression
         # TODO: replace this with something even more restrictive.
-        return simple_eval(updated_expr, names=expr_locals, functions={"len": len})
+        s = SimpleEval(names=expr_locals, functions={"len": len})
+        return s.eval(updated_expr, previously_parsed=parsed_expr)
     except Exception as ex:
         raise Exception(f"Error evaluating '{expr}': {str(ex)}")
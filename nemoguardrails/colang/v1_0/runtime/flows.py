@@ -14,11 +14,14 @@
 # limitations under the License.
 
 """A simplified modeling of the CoFlows engine."""
+import copy
 import uuid
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from enum import Enum
+from itertools import islice
 from time import time
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from nemoguardrails.colang.v1_0.runtime.eval import eval_expression
 from nemoguardrails.colang.v1_0.runtime.sliding import slide
@@ -51,6 +54,10 @@ class FlowConfig:
     # Weather to allow multiple instances of the same flow
     allow_multiple: bool = False
 
+    # Whether this flow may alter the message it checks, when used as a rail.
+    # Only the rails declared as `read-only` can be run in parallel with other rails.
+    is_mutating: bool = True
+
     # The events that can trigger this flow to advance.
     trigger_event_types: List[str] = field(
         default_factory=lambda: [
@@ -94,6 +101,70 @@ class FlowState:
     interrupted_by = None
 
 
+class FlowConfigs(dict):
+    """The flow configurations, by id, keeping track of their changes.
+
+    The `version` is increased when a flow configuration is added, replaced or removed,
+    and the `num_replaced` when one is replaced or removed. This allows the index of the
+    flows and the state checkpoints to detect the changes without scanning the flows.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.version = 0
+        self.num_replaced = 0
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, key, value):
+        if key in self:
+            if self[key] is value:
+                return
+            self.num_replaced += 1
+        self.version += 1
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.version += 1
+        self.num_replaced += 1
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *args):
+        if key not in self:
+            return super().pop(key, *args)
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self):
+        key = next(reversed(self))
+        return key, self.pop(key)
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+
+def get_flow_configs_version(flow_configs: Dict[str, FlowConfig]) -> Tuple[int, int]:
+    """Gets the version of the flow configurations, as `(version, num_replaced)`.
+
+    For a plain dict, only the added flow configurations can be detected, using
+    its length.
+    """
+    if isinstance(flow_configs, FlowConfigs):
+        return flow_configs.version, flow_configs.num_replaced
+
+    return len(flow_configs), 0
+
+
 @dataclass
 class State:
     """A state of a flow-driven system."""
@@ -121,6 +192,241 @@ class State:
     # The updates to the context that should be applied before the next step
     context_updates: dict = field(default_factory=dict)
 
+    # The index of the flows that can be started by an event, if available.
+    flows_index: Optional["FlowsIndex"] = None
+
+
+# The types of elements that are skipped when sliding a flow.
+_SLIDING_ELEMENT_TYPES = [
+    "check",
+    "if",
+    "jump",
+    "while",
+    "continue",
+    "stop",
+    "break",
+    "set",
+]
+
+
+class FlowsIndex:
+    """An index of the flows that can be started by an event.
+
+    Flows whose first element can be matched directly are indexed by the event type
+    and, for `UserIntent`, `BotIntent` and `InternalSystemActionFinished` events, by the
+    intent or action name. Flows that start with sliding elements (e.g., `if`, `set`)
+    are always considered, because the element to be matched depends on the context.
+
+    The index is synced lazily with the flow configurations, using their version. The
+    new flow configurations are added, and the index is rebuilt if a flow configuration
+    was replaced or removed. For a plain dict, which has no version, only the added flow
+    configurations are detected.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._size = 0
+        self._source: Optional[Dict[str, FlowConfig]] = None
+        self._version: Optional[Tuple[int, int]] = None
+        self._positions: Dict[str, int] = {}
+        self._index: Dict[Tuple[str, Optional[str]], List[FlowConfig]] = {}
+        self._always_considered: List[FlowConfig] = []
+
+    def __len__(self):
+        return self._size
+
+    @staticmethod
+    def _get_index_keys(element: dict) -> List[Tuple[str, Optional[str]]]:
+        """Returns the keys of the events that could match the provided element.
+
+        This must be kept in sync with `_is_match`.
+        """
+        element_type = element["_type"]
+
+        if element_type == "UserIntent":
+            return [("UserIntent", element["intent_name"])]
+
+        if element_type == "run_action":
+            keys = [
+                ("InternalSystemActionFinished", element["action_name"]),
+                ("run_action", None),
+            ]
+            if element["action_name"] == "utter":
+                keys.append(("BotIntent", element["action_params"]["value"]))
+            return keys
+
+        return [(element_type, None)]
+
+    def _add_flow_config(self, flow_config: FlowConfig):
+        self._positions[flow_config.id] = self._size
+        self._size += 1
+
+        # Subflows can't be started on their own.
+        if flow_config.is_subflow:
+            return
+
+        elements = flow_config.elements
+        if (
+            not elements
+            or elements[0]["_type"] in _SLIDING_ELEMENT_TYPES
+            or "_label" in elements[0]
+        ):
+            self._always_considered.append(flow_config)
+            return
+
+        for key in self._get_index_keys(elements[0]):
+            self._index.setdefault(key, []).append(flow_config)
+
+    def sync(self, flow_configs: Dict[str, FlowConfig]):
+        """Syncs the index with the flow configurations.
+
+        The flow configurations added since the last sync are added to the index. If
+        one of the indexed flow configurations was replaced or removed, the index is
+        rebuilt.
+        """
+        version = get_flow_configs_version(flow_configs)
+        if flow_configs is self._source and version == self._version:
+            return
+
+        if (
+            flow_configs is not self._source
+            or self._version is None
+            or version[1] != self._version[1]
+        ):
+            self._reset()
+            self._source = flow_configs
+        self._version = version
+
+        for flow_config in islice(flow_configs.values(), self._size, None):
+            self._add_flow_config(flow_config)
+
+    def get_candidate_flow_configs(
+        self, flow_configs: Dict[str, FlowConfig], event: dict
+    ) -> List[FlowConfig]:
+        """Returns the flows that could be started by the provided event.
+
+        Args:
+            flow_configs (Dict[str, FlowConfig]): The flow configurations.
+            event (dict): The event.
+
+        Returns:
+            List[FlowConfig]: The candidate flows, in the order of the flow configurations.
+        """
+        self.sync(flow_configs)
+
+        event_type = event["type"]
+        if event_type in ["UserIntent", "BotIntent"]:
+            keys = [(event_type, event.get("intent")), (event_type, "...")]
+        elif event_type == "InternalSystemActionFinished":
+            keys = [(event_type, event.get("action_name"))]
+        else:
+            keys = [(event_type, None)]
+
+        candidates = list(self._always_considered)
+        for key in dict.fromkeys(keys):
+            candidates.extend(self._index.get(key, []))
+
+        # The order in which the flows are started matters, so we preserve it.
+        candidates.sort(key=lambda flow_config: self._positions[flow_config.id])
+
+        return candidates
+
+
+@dataclass
+class StateCheckpoint:
+    """A resumable snapshot of the state after processing a prefix of the events history."""
+
+    # The state after processing the first `history_length` events.
+    state: State
+
+    # The number of events from the history that have been processed.
+    history_length: int
+
+    # The last event from the history that was processed. It is used to check
+    # that a new history extends the same prefix.
+    last_event: Optional[dict]
+
+    # The last event in the actual history i.e., after applying 'hide_prev_turn'.
+    last_actual_event: Optional[dict]
+
+    # The version of the flow configurations when the checkpoint was created (see
+    # `get_flow_configs_version`). If flows are added (e.g., through `start_flow`) or
+    # replaced, the checkpoint is no longer valid.
+    flow_configs_version: Tuple[int, int]
+
+    # The context computed from the history i.e., the result of `compute_context`.
+    # It must not be altered once the checkpoint is created.
+    history_context: dict = field(default_factory=dict)
+
+
+class StateCheckpoints:
+    """A bounded LRU store of state checkpoints.
+
+    Checkpoints are keyed by the length of the history prefix and the identity
+    of its last event. Because the checkpoint keeps a reference to the last event,
+    the identity can't be reused by another event while the checkpoint is stored.
+
+    Each checkpoint holds a copy of the state i.e., the context and the flow states,
+    so the memory used is bounded by the number of checkpoints, not by their size.
+    """
+
+    def __init__(self, max_size: int = 1000):
+        self.max_size = max_size
+        self._checkpoints: OrderedDict = OrderedDict()
+
+    def __len__(self):
+        return len(self._checkpoints)
+
+    def add(self, checkpoint: StateCheckpoint):
+        """Stores a checkpoint, evicting the least recently used one if needed."""
+        if checkpoint.history_length == 0:
+            return
+
+        key = (checkpoint.history_length, id(checkpoint.last_event))
+        self._checkpoints[key] = checkpoint
+        self._checkpoints.move_to_end(key)
+
+        while len(self._checkpoints) > self.max_size:
+            self._checkpoints.popitem(last=False)
+
+    def find(
+        self,
+        history: List[dict],
+        flow_configs: Optional[Dict[str, FlowConfig]] = None,
+    ) -> Optional[StateCheckpoint]:
+        """Finds the checkpoint for the longest prefix of the provided history.
+
+        Args:
+            history (List[dict]): The history of events.
+            flow_configs (Optional[Dict[str, FlowConfig]]): The current flow configurations.
+              If provided, checkpoints created with different flows are skipped.
+
+        Returns:
+            Optional[StateCheckpoint]: The checkpoint, if any.
+        """
+        for length in range(len(history), 0, -1):
+            key = (length, id(history[length - 1]))
+            checkpoint = self._checkpoints.get(key)
+
+            if (
+                checkpoint is not None
+                and checkpoint.last_event is history[length - 1]
+                and (
+                    flow_configs is None
+                    or (
+                        checkpoint.state.flow_configs is flow_configs
+                        and checkpoint.flow_configs_version
+                        == get_flow_configs_version(flow_configs)
+                    )
+                )
+            ):
+                self._checkpoints.move_to_end(key)
+                return checkpoint
+
+        return None
+
 
 def _is_actionable(element: dict) -> bool:
     """Checks if the given element is actionable.
@@ -371,11 +677,26 @@ def compute_next_state(state: State, event: dict) -> State:
         flow_states=[],
         flow_configs=state.flow_configs,
         rails_config=state.rails_config,
+        flows_index=state.flows_index,
     )
 
     # The UID of the flow that will determine the next step
     new_state.next_step_by_flow_uid = None
 
+    # A `start_flow` event without a body starts an existing flow (including subflows)
+    # in isolation, i.e., the active flows are discarded. This is used to run flows in
+    # parallel, each one on a separate copy of the history.
+    if event["type"] == "start_flow" and "flow_body" not in event:
+        flow_state = FlowState(uid=str(uuid.uuid4()), flow_id=event["flow_id"], head=0)
+        new_state.flow_states.append(flow_state)
+
+        _slide_with_subflows(new_state, flow_state)
+
+        if flow_state.head < 0:
+            flow_state.status = FlowStatus.COMPLETED
+
+        return new_state
+
     # This is to handle an edge case in the simplified implementation
     extension_flow_completed = False
 
@@ -445,8 +766,16 @@ def compute_next_state(state: State, event: dict) -> State:
         # We copy the flow to the new state
         new_state.flow_states.append(flow_state)
 
-    # Next, we try to start new flows
-    for flow_config in state.flow_configs.values():
+    # Next, we try to start new flows. If we have an index, we only look at the flows
+    # that can be started by the current event.
+    if state.flows_index is not None:
+        candidate_flow_configs = state.flows_index.get_candidate_flow_configs(
+            state.flow_configs, event
+        )
+    else:
+        candidate_flow_configs = state.flow_configs.values()
+
+    for flow_config in candidate_flow_configs:
         # We don't allow subflow to start on their own
         if flow_config.is_subflow:
             continue
@@ -587,25 +916,64 @@ def _step_to_event(step: dict) -> dict:
         raise ValueError(f"Unknown next step type: {step_type}")
 
 
-def compute_next_steps(
+def _copy_state(state: State) -> State:
+    """Creates a copy of a state that can be advanced without altering the original.
+
+    The flow states and the context are copied, while the flow configurations and
+    the rails configuration are shared.
+
+    Args:
+        state (State): The state to be copied.
+
+    Returns:
+        State: The copy of the state.
+    """
+    new_state = copy.copy(state)
+    new_state.context = dict(state.context)
+    new_state.context_updates = dict(state.context_updates)
+
+    # We use `copy.copy` so that `interrupted_by`, which is not a dataclass field,
+    # is also copied.
+    new_state.flow_states = [copy.copy(flow_state) for flow_state in state.flow_states]
+
+    return new_state
+
+
+def _apply_event(state: State, event: dict) -> State:
+    """Applies a single event from the actual history to the state."""
+    state = compute_next_state(state, event)
+
+    # NOTE (Jul 24, Razvan): this is a quick fix. Will debug further.
+    if event["type"] == "BotIntent" and event["intent"] == "stop":
+        # Reset all flows
+        state.flow_states = []
+
+    return state
+
+
+def _compute_checkpoint(
     history: List[dict],
     flow_configs: Dict[str, FlowConfig],
     rails_config: "RailsConfig",
-    processing_log: List[dict],
-) -> List[dict]:
-    """Computes the next step in a flow-driven system given a history of events.
+    flows_index: Optional[FlowsIndex] = None,
+) -> StateCheckpoint:
+    """Computes the state for a history of events by replaying all of them.
 
     Args:
         history (List[dict]): The history of events.
         flow_configs (Dict[str, FlowConfig]): Flow configurations.
         rails_config (RailsConfig): Rails configuration.
-        processing_log (List[dict]): The processing log so far. This will be mutated.
+        flows_index (Optional[FlowsIndex]): The index of the flows, if available.
 
     Returns:
-            List[dict]: The list of computed next steps.
+        StateCheckpoint: The checkpoint after processing the full history.
     """
     state = State(
-        context={}, flow_states=[], flow_configs=flow_configs, rails_config=rails_config
+        context={},
+        flow_states=[],
+        flow_configs=flow_configs,
+        rails_config=rails_config,
+        flows_index=flows_index,
     )
 
     # First, we process the history and apply any alterations e.g. 'hide_prev_turn'
@@ -624,17 +992,100 @@ def compute_next_steps(
         else:
             actual_history.append(event)
 
-    steps_history = []
     for event in actual_history:
-        # We append the events to the steps history
-        steps_history.append(event)
+        state = _apply_event(state, event)
+
+    return StateCheckpoint(
+        state=state,
+        history_length=len(history),
+        last_event=history[-1] if history else None,
+        last_actual_event=actual_history[-1] if actual_history else None,
+        flow_configs_version=get_flow_configs_version(flow_configs),
+        history_context=compute_context(history),
+    )
+
+
+def _resume_checkpoint(
+    checkpoint: StateCheckpoint, history: List[dict]
+) -> Optional[StateCheckpoint]:
+    """Advances a checkpoint with the events from the history that follow it.
+
+    The stored checkpoint is not altered, so it can be resumed again by histories
+    that branch from the same prefix.
+
+    Args:
+        checkpoint (StateCheckpoint): A checkpoint for a prefix of the history.
+        history (List[dict]): The history of events.
+
+    Returns:
+        Optional[StateCheckpoint]: The checkpoint after processing the full history, or
+          None if the new events alter the previous history (i.e., 'hide_prev_turn').
+    """
+    new_events = history[checkpoint.history_length :]
+
+    # Hiding the previous turn needs the full actual history, so we don't resume.
+    for event in new_events:
+        if event["type"] == "hide_prev_turn":
+            return None
+
+    if not new_events:
+        return checkpoint
+
+    state = _copy_state(checkpoint.state)
+    history_context = dict(checkpoint.history_context)
+    for event in new_events:
+        state = _apply_event(state, event)
+        _update_context(history_context, event)
+
+    return StateCheckpoint(
+        state=state,
+        history_length=len(history),
+        last_event=history[-1],
+        last_actual_event=history[-1],
+        flow_configs_version=checkpoint.flow_configs_version,
+        history_context=history_context,
+    )
+
+
+def compute_next_steps(
+    history: List[dict],
+    flow_configs: Dict[str, FlowConfig],
+    rails_config: "RailsConfig",
+    processing_log: List[dict],
+    state_checkpoints: Optional[StateCheckpoints] = None,
+    flows_index: Optional[FlowsIndex] = None,
+) -> List[dict]:
+    """Computes the next step in a flow-driven system given a history of events.
 
-        state = compute_next_state(state, event)
+    Args:
+        history (List[dict]): The history of events.
+        flow_configs (Dict[str, FlowConfig]): Flow configurations.
+        rails_config (RailsConfig): Rails configuration.
+        processing_log (List[dict]): The processing log so far. This will be mutated.
+        state_checkpoints (Optional[StateCheckpoints]): If provided, the state is resumed
+          from the checkpoint of the longest known prefix of the history, and a checkpoint
+          for the full history is recorded.
+        flows_index (Optional[FlowsIndex]): If provided, it is used to only consider the
+          flows that can be started by each event.
 
-        # NOTE (Jul 24, Razvan): this is a quick fix. Will debug further.
-        if event["type"] == "BotIntent" and event["intent"] == "stop":
-            # Reset all flows
-            state.flow_states = []
+    Returns:
+            List[dict]: The list of computed next steps.
+    """
+    checkpoint = None
+    if state_checkpoints is not None:
+        prefix_checkpoint = state_checkpoints.find(history, flow_configs)
+        if prefix_checkpoint is not None:
+            checkpoint = _resume_checkpoint(prefix_checkpoint, history)
+
+    if checkpoint is None:
+        checkpoint = _compute_checkpoint(
+            history, flow_configs, rails_config, flows_index=flows_index
+        )
+
+    if state_checkpoints is not None:
+        state_checkpoints.add(checkpoint)
+
+    state = checkpoint.state
 
     next_steps = []
 
@@ -652,8 +1103,8 @@ def compute_next_steps(
         next_steps.append(next_step_event)
 
     # Finally, we check if there was an explicit "stop" request
-    if actual_history:
-        last_event = actual_history[-1]
+    last_event = checkpoint.last_actual_event
+    if last_event:
         if last_event["type"] == "BotIntent" and last_event["intent"] == "stop":
             # In this case, we remove any next steps
             next_steps = []
@@ -676,6 +1127,25 @@ def compute_next_steps(
     return next_steps
 
 
+def _update_context(context: dict, event: dict):
+    """Updates a context computed from a history of events with a new event.
+
+    Args:
+        context (dict): The context to be updated. This will be mutated.
+        event (dict): The new event.
+    """
+    if event["type"] == "ContextUpdate":
+        context.update(event["data"])
+
+    if event["type"] == "UserMessage":
+        context["last_user_message"] = event["text"]
+
+    elif event["type"] == "StartUtteranceBotAction":
+        context["last_bot_message"] = event["script"]
+
+    context["event"] = event
+
+
 def compute_context(history: List[dict]):
     """Computes the context given a history of events.
 
@@ -695,16 +1165,36 @@ def compute_context(history: List[dict]):
     }
 
     for event in history:
-        if event["type"] == "ContextUpdate":
-            context.update(event["data"])
+        _update_context(context, event)
 
-        if event["type"] == "UserMessage":
-            context["last_user_message"] = event["text"]
+    return context
+
+
+def get_context_snapshot(
+    history: List[dict], state_checkpoints: Optional[StateCheckpoints] = None
+) -> dict:
+    """Returns a snapshot of the context for a history of events.
+
+    When a checkpoint exists for a prefix of the history, only the events after
+    the prefix are applied, instead of computing the context from scratch.
+
+    Args:
+        history (List[dict]): The history of events.
+        state_checkpoints (Optional[StateCheckpoints]): The known state checkpoints.
+
+    Returns:
+        dict: A shallow copy of the computed context, which can be altered by the
+            caller without affecting the checkpoints.
+    """
+    checkpoint = None
+    if state_checkpoints is not None:
+        checkpoint = state_checkpoints.find(history, flow_configs=None)
 
-        elif event["type"] == "StartUtteranceBotAction":
-            context["last_bot_message"] = event["script"]
+    if checkpoint is None:
+        return compute_context(history)
 
-    if history:
-        context["event"] = history[-1]
+    context = dict(checkpoint.history_context)
+    for event in history[checkpoint.history_length :]:
+        _update_context(context, event)
 
     return context
@@ -13,26 +13,36 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
 import inspect
 import logging
 import uuid
 from textwrap import indent
 from time import time
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 from urllib.parse import urljoin
 
 import aiohttp
 from langchain.chains.base import Chain
 
-from nemoguardrails.actions.actions import ActionResult
+from nemoguardrails.actions.actions import ActionResult, action
 from nemoguardrails.colang import parse_colang_file
 from nemoguardrails.colang.runtime import Runtime
 from nemoguardrails.colang.v1_0.runtime.flows import (
     FlowConfig,
-    compute_context,
+    FlowConfigs,
+    FlowsIndex,
+    StateCheckpoints,
     compute_next_steps,
+    get_context_snapshot,
+)
+from nemoguardrails.context import (
+    generation_options_var,
+    llm_stats_var,
+    streaming_handler_var,
 )
 from nemoguardrails.logging.processing_log import processing_log_var
+from nemoguardrails.rails.llm.config import RailsConfig
 from nemoguardrails.utils import new_event_dict
 
 log = logging.getLogger(__name__)
@@ -41,6 +51,13 @@ log = logging.getLogger(__name__)
 class RuntimeV1_0(Runtime):
     """Runtime for executing the guardrails."""
 
+    def __init__(self, config: RailsConfig, verbose: bool = False):
+        super().__init__(config, verbose)
+
+        # The system actions that need access to the runtime.
+        self.register_action(self._run_input_rails_in_parallel)
+        self.register_action(self._run_output_rails_in_parallel)
+
     def _load_flow_config(self, flow: dict):
         """
         Load a flow configuration.
@@ -79,6 +96,8 @@ class RuntimeV1_0(Runtime):
                 flow["is_subflow"] = True
             if meta_data.get("allow_multiple"):
                 flow["allow_multiple"] = True
+            if "mutating" in meta_data:
+                flow["is_mutating"] = meta_data["mutating"]
 
             # Finally, remove the meta element
             elements = elements[1:]
@@ -92,6 +111,7 @@ class RuntimeV1_0(Runtime):
             is_subflow=flow.get("is_subflow", False),
             source_code=flow.get("source_code"),
             allow_multiple=flow.get("allow_multiple", False),
+            is_mutating=flow.get("is_mutating", True),
         )
 
         # We also compute what types of events can trigger this flow, in addition
@@ -117,7 +137,16 @@ class RuntimeV1_0(Runtime):
         Returns:
             None
         """
-        self.flow_configs = {}
+        self.flow_configs = FlowConfigs()
+
+        # The checkpoints of the state for the recently processed histories of events.
+        # This allows processing only the new events, instead of the full history.
+        self.state_checkpoints = StateCheckpoints(
+            max_size=self.config.core.state_checkpoints.max_size
+        )
+
+        # The index of the flows that can be started by each type of event.
+        self.flows_index = FlowsIndex()
 
         for flow in self.config.flows:
             self._load_flow_config(flow)
@@ -150,56 +179,221 @@ class RuntimeV1_0(Runtime):
             {"type": "event", "timestamp": time(), "data": events[-1]}
         )
 
-        while True:
-            last_event = events[-1]
-
-            log.info("Processing event: %s", last_event)
+        # The generation started concurrently with the input rails, if any.
+        speculation = None
 
-            event_type = last_event["type"]
-            log.info(
-                "Event :: %s %s",
-                event_type,
-                str({k: v for k, v in last_event.items() if k != "type"}),
-            )
+        try:
+            while True:
+                last_event = events[-1]
 
-            # If we need to execute an action, we start doing that.
-            if last_event["type"] == "StartInternalSystemAction":
-                next_events = await self._process_start_action(events)
+                log.info("Processing event: %s", last_event)
 
-            # If we need to start a flow, we parse the content and register it.
-            elif last_event["type"] == "start_flow":
-                next_events = await self._process_start_flow(
-                    events, processing_log=processing_log
+                event_type = last_event["type"]
+                log.info(
+                    "Event :: %s %s",
+                    event_type,
+                    str({k: v for k, v in last_event.items() if k != "type"}),
                 )
 
-            else:
-                # We need to slide all the flows based on the current event,
-                # to compute the next steps.
-                next_events = await self._compute_next_steps(
-                    events, processing_log=processing_log
-                )
+                # If we need to execute an action, we start doing that.
+                if last_event["type"] == "StartInternalSystemAction":
+                    next_events = None
+
+                    # If the generation was started speculatively, we use its result.
+                    if (
+                        speculation
+                        and last_event["action_name"] == "generate_user_intent"
+                    ):
+                        next_events = await self._use_speculative_generation(
+                            speculation, events, processing_log
+                        )
+                        speculation = None
+
+                    if next_events is None:
+                        next_events = await self._process_start_action(events)
+
+                # If we need to start a flow, we parse the content and register it.
+                elif last_event["type"] == "start_flow":
+                    next_events = await self._process_start_flow(
+                        events, processing_log=processing_log
+                    )
+
+                else:
+                    # When the input rails start, we can also start the generation.
+                    if event_type == "StartInputRails" and self._can_speculate():
+                        speculation = self._start_speculative_generation(events)
+
+                    # We need to slide all the flows based on the current event,
+                    # to compute the next steps.
+                    next_events = await self._compute_next_steps(
+                        events, processing_log=processing_log
+                    )
+
+                    if len(next_events) == 0:
+                        next_events = [new_event_dict("Listen")]
+
+                # Otherwise, we append the event and continue the processing.
+                events.extend(next_events)
+                new_events.extend(next_events)
+
+                for event in next_events:
+                    processing_log.append(
+                        {"type": "event", "timestamp": time(), "data": event}
+                    )
+
+                # If the next event is a listen, we stop the processing.
+                if next_events[-1]["type"] == "Listen":
+                    break
 
-                if len(next_events) == 0:
-                    next_events = [new_event_dict("Listen")]
+                # As a safety measure, we stop the processing if we have too many events.
+                if len(new_events) > 100:
+                    raise Exception("Too many events.")
 
-            # Otherwise, we append the event and continue the processing.
-            events.extend(next_events)
-            new_events.extend(next_events)
+        finally:
+            # If the speculative generation was not used, e.g., the input was
+            # blocked, we discard it.
+            if speculation:
+                await self._discard_speculative_generation(speculation)
 
-            for event in next_events:
-                processing_log.append(
-                    {"type": "event", "timestamp": time(), "data": event}
-                )
+        return new_events
 
-            # If the next event is a listen, we stop the processing.
-            if next_events[-1]["type"] == "Listen":
-                break
+    def _can_speculate(self) -> bool:
+        """Checks if the main LLM generation can start concurrently with the input rails.
 
-            # As a safety measure, we stop the processing if we have too many events.
-            if len(new_events) > 100:
-                raise Exception("Too many events.")
+        This is the case only in passthrough and single call mode, where the
+        `generate_user_intent` action generates the bot message directly.
+        """
+        if not self.config.rails.input.speculative_generation:
+            return False
 
-        return new_events
+        if not (
+            self.config.passthrough or self.config.rails.dialog.single_call.enabled
+        ):
+            return False
+
+        # When streaming, the chunks would reach the client before the input rails finish.
+        if streaming_handler_var.get():
+            return False
+
+        # If the dialog rails are disabled, the generation is not needed.
+        generation_options = generation_options_var.get()
+        if generation_options and not generation_options.rails.dialog:
+            return False
+
+        return True
+
+    def _start_speculative_generation(self, events: List[dict]) -> dict:
+        """Starts the `generate_user_intent` action before the input rails finish.
+
+        Args:
+            events (List[dict]): The list of events, up to the start of the input rails.
+
+        Returns:
+            dict: The speculative generation, i.e., the task, the context it was
+                started with and its processing log.
+        """
+        context = get_context_snapshot(events, self.state_checkpoints)
+        user_message = context.get("user_message")
+
+        # The generation sees the history as if the input rails had already finished.
+        speculative_events = events + [
+            new_event_dict("UserMessage", text=user_message),
+            new_event_dict(
+                "StartInternalSystemAction",
+                action_name="generate_user_intent",
+                action_params={},
+                action_result_key=None,
+                is_system_action=True,
+            ),
+        ]
+
+        # The LLM calls are recorded in a separate processing log, which is merged
+        # only if the generation is used. The log must not be empty for the calls
+        # to be recorded.
+        speculative_log = [
+            {"type": "event", "timestamp": time(), "data": speculative_events[-1]}
+        ]
+
+        # We record the context variables read by the generation, to check later
+        # that the input rails did not change them.
+        context = _ReadTrackingContext(context)
+
+        async def _generate() -> List[dict]:
+            processing_log_var.set(speculative_log)
+            return await self._process_start_action(speculative_events, context)
+
+        log.info("Starting the speculative generation.")
+
+        return {
+            "task": asyncio.create_task(_generate()),
+            "context": context,
+            "processing_log": speculative_log,
+        }
+
+    async def _use_speculative_generation(
+        self, speculation: dict, events: List[dict], processing_log: List[dict]
+    ) -> Optional[List[dict]]:
+        """Returns the result of the speculative generation, if it is still valid.
+
+        If the input rails altered the user message, or any other context variable
+        read by the generation (e.g., `$relevant_chunks`), the speculative generation
+        is discarded and None is returned, so that the generation is done again.
+
+        Args:
+            speculation (dict): The speculative generation.
+            events (List[dict]): The list of events, ending with the start of the
+                `generate_user_intent` action.
+            processing_log (List[dict]): The processing log so far. This will be mutated.
+
+        Returns:
+            Optional[List[dict]]: The list of next steps, or None.
+        """
+        context = get_context_snapshot(events, self.state_checkpoints)
+        changed_keys = speculation["context"].get_changed_keys(context)
+        if not changed_keys:
+            next_steps = await speculation["task"]
+
+            # The generation may have read other variables in the meantime.
+            changed_keys = speculation["context"].get_changed_keys(context)
+
+        if changed_keys:
+            log.info(
+                "The input rails altered %s, discarding the generation.",
+                ", ".join(f"${key}" for key in sorted(changed_keys)),
+            )
+            await self._discard_speculative_generation(speculation)
+            return None
+
+        # The result must look like the result of the actual action.
+        action_uid = events[-1]["action_uid"]
+        for event in next_steps:
+            if event["type"] == "InternalSystemActionFinished":
+                event["action_uid"] = action_uid
+
+        processing_log.extend(speculation["processing_log"][1:])
+
+        llm_stats = llm_stats_var.get()
+        if llm_stats:
+            llm_stats.inc("speculative_generations")
+            llm_stats.inc(
+                "speculative_tokens", _get_total_tokens(speculation["processing_log"])
+            )
+
+        return next_steps
+
+    async def _discard_speculative_generation(self, speculation: dict):
+        """Cancels the speculative generation, and records the wasted tokens."""
+        task = speculation["task"]
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        llm_stats = llm_stats_var.get()
+        if llm_stats:
+            wasted_tokens = _get_total_tokens(speculation["processing_log"])
+            llm_stats.inc("speculative_generations")
+            llm_stats.inc("speculative_wasted_generations")
+            llm_stats.inc("speculative_tokens", wasted_tokens)
+            llm_stats.inc("speculative_wasted_tokens", wasted_tokens)
 
     async def _compute_next_steps(
         self, events: List[dict], processing_log: List[dict]
@@ -219,6 +413,8 @@ class RuntimeV1_0(Runtime):
             self.flow_configs,
             rails_config=self.config,
             processing_log=processing_log,
+            state_checkpoints=self.state_checkpoints,
+            flows_index=self.flows_index,
         )
 
         # If there are any StartInternalSystemAction events, we mark if they are system actions or not
@@ -259,12 +455,16 @@ class RuntimeV1_0(Runtime):
             ]
         )
 
-    async def _process_start_action(self, events: List[dict]) -> List[dict]:
+    async def _process_start_action(
+        self, events: List[dict], context: Optional[dict] = None
+    ) -> List[dict]:
         """
         Start the specified action, wait for it to finish, and post back the result.
 
         Args:
             events (List[dict]): The list of events.
+            context (Optional[dict]): The context passed to the action. If not
+                provided, it is computed from the events.
 
         Returns:
             List[dict]: The list of next steps.
@@ -277,20 +477,23 @@ class RuntimeV1_0(Runtime):
         action_result_key = event["action_result_key"]
         action_uid = event["action_uid"]
 
-        context = {}
         action_meta = {}
 
         fn = self.action_dispatcher.get_action(action_name)
 
         # TODO: check action is available in action server
         if fn is None:
+            context = {}
             status = "failed"
             result = self._internal_error_action_result(
                 f"Action '{action_name}' not found."
             )
 
         else:
-            context = compute_context(events)
+            # The actions receive a copy of the context, which is computed
+            # incrementally from the checkpoint of the previous events.
+            if context is None:
+                context = get_context_snapshot(events, self.state_checkpoints)
 
             # We pass all the parameters that are passed explicitly to the action.
             kwargs = {**action_params}
@@ -485,6 +688,11 @@ class RuntimeV1_0(Runtime):
 
         event = events[-1]
 
+        # If we don't have a body, an existing flow is started, so we just compute
+        # the next steps.
+        if "flow_body" not in event:
+            return await self._compute_next_steps(events, processing_log=processing_log)
+
         flow_id = event["flow_id"]
 
         # Up to this point, the body will be the sequence of instructions.
@@ -514,3 +722,332 @@ class RuntimeV1_0(Runtime):
         )
 
         return next_steps
+
+    async def _run_flows_in_parallel(
+        self,
+        flows: List[str],
+        events: List[dict],
+        pre_events: Optional[List[dict]] = None,
+        post_events: Optional[List[dict]] = None,
+        triggered_flow_var: Optional[str] = None,
+    ) -> ActionResult:
+        """
+        Run flows in parallel.
+
+        Each flow is started in isolation, using a `start_flow` event, on a separate copy
+        of the history. As soon as one of the flows stops the processing (e.g., an input
+        rail that blocks the user message), the flows that are still running are cancelled.
+
+        The results are merged in the order of the flows, not in the order in which they
+        finish, so the resulting context updates (e.g., alterations of `$user_message`)
+        are deterministic. The flows after the one that stopped are ignored, like they
+        would not have been started when running sequentially.
+
+        Args:
+            flows (List[str]): The ids of the flows.
+            events (List[dict]): The list of events.
+            pre_events (Optional[List[dict]]): For each flow, an event to record in the
+              processing log before the processing of the flow. It is also returned
+              before the events of the flow.
+            post_events (Optional[List[dict]]): For each flow, an event to record in the
+              processing log after the flow has finished, if it did not stop. It is also
+              returned after the events of the flow.
+            triggered_flow_var (Optional[str]): The name of a context variable which is
+              set to the id of each flow while it runs. It is kept only for the flow that
+              stopped, if any.
+
+        Returns:
+            ActionResult: The context updates and the events resulting from the flows.
+        """
+        processing_logs = [[] for _ in flows]
+
+        async def _run_flow(i: int) -> List[dict]:
+            if pre_events:
+                processing_logs[i].append(
+                    {"type": "event", "timestamp": time(), "data": pre_events[i]}
+                )
+
+            flow_events = events.copy()
+            if triggered_flow_var:
+                flow_events.append(
+                    new_event_dict("ContextUpdate", data={triggered_flow_var: flows[i]})
+                )
+            flow_events.append(new_event_dict("start_flow", flow_id=flows[i]))
+            new_events = await self.generate_events(
+                flow_events, processing_log=processing_logs[i]
+            )
+
+            if post_events and not _is_stop(new_events):
+                processing_logs[i].append(
+                    {"type": "event", "timestamp": time(), "data": post_events[i]}
+                )
+
+            return new_events
+
+        tasks = [asyncio.ensure_future(_run_flow(i)) for i in range(len(flows))]
+        results: List[Optional[List[dict]]] = [None] * len(flows)
+        stop_index = None
+
+        pending = set(tasks)
+        try:
+            while pending and stop_index is None:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    i = tasks.index(task)
+                    results[i] = task.result()
+
+                    if _is_stop(results[i]) and (stop_index is None or i < stop_index):
+                        stop_index = i
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        processing_log = processing_log_var.get()
+        context_updates = {}
+        return_events = []
+
+        for i, new_events in enumerate(results):
+            # We skip the flows that were cancelled, and the ones after the flow that
+            # stopped.
+            if new_events is None or (stop_index is not None and i > stop_index):
+                continue
+
+            if processing_log is not None:
+                processing_log.extend(processing_logs[i])
+
+            # The events are ordered per flow, like when running sequentially.
+            if pre_events:
+                return_events.append(pre_events[i])
+
+            for event in new_events:
+                if event["type"] == "ContextUpdate":
+                    context_updates.update(event["data"])
+
+                # For the flow that stopped, we keep the bot intents and the
+                # alterations of the history. For the others, only the bot utterances
+                # are relevant, since their intents have already been handled.
+                elif event["type"] == "StartUtteranceBotAction" or (
+                    i == stop_index and event["type"] in ["BotIntent", "hide_prev_turn"]
+                ):
+                    return_events.append(event)
+
+            if post_events and i != stop_index:
+                return_events.append(post_events[i])
+
+        if triggered_flow_var:
+            context_updates[triggered_flow_var] = (
+                flows[stop_index] if stop_index is not None else None
+            )
+
+        return ActionResult(events=return_events, context_updates=context_updates)
+
+    async def _run_rails_in_parallel(
+        self,
+        flows: List[str],
+        events: List[dict],
+        rail_type: str,
+        parallel: bool = True,
+    ) -> ActionResult:
+        """
+        Run input or output rails in parallel.
+
+        The rails that may alter the message (i.e., not declared as `read-only`) are run
+        one at a time, in order, while the consecutive read-only rails between them are
+        run in parallel.
+        This way, each rail sees the same message as when running all the rails
+        sequentially.
+
+        Args:
+            flows (List[str]): The ids of the rails flows.
+            events (List[dict]): The list of events.
+            rail_type (str): The type of the rails, i.e., "input" or "output".
+            parallel (bool): If False, all the rails are run one at a time.
+
+        Returns:
+            ActionResult: The context updates and the events resulting from the rails.
+        """
+        event_prefix = rail_type.capitalize()
+
+        # We group the rails that can be run in parallel.
+        groups = []
+        for flow_id in flows:
+            if (
+                parallel
+                and groups
+                and not self.flow_configs[flow_id].is_mutating
+                and not self.flow_configs[groups[-1][-1]].is_mutating
+            ):
+                groups[-1].append(flow_id)
+            else:
+                groups.append([flow_id])
+
+        context_updates = {}
+        return_events = []
+
+        for group in groups:
+            # The rails in the next groups need to see the changes from the previous ones.
+            group_events = events
+            if context_updates:
+                group_events = events + [
+                    new_event_dict("ContextUpdate", data=dict(context_updates))
+                ]
+
+            result = await self._run_flows_in_parallel(
+                group,
+                group_events,
+                pre_events=[
+                    new_event_dict(f"Start{event_prefix}Rail", flow_id=flow_id)
+                    for flow_id in group
+                ],
+                post_events=[
+                    new_event_dict(f"{event_prefix}RailFinished", flow_id=flow_id)
+                    for flow_id in group
+                ],
+                triggered_flow_var=f"triggered_{rail_type}_rail",
+            )
+
+            context_updates.update(result.context_updates)
+            return_events.extend(result.events)
+
+            if _is_stop(result.events):
+                break
+
+        return ActionResult(events=return_events, context_updates=context_updates)
+
+    @action(name="run_input_rails_in_parallel", is_system_action=True)
+    async def _run_input_rails_in_parallel(
+        self, flows: List[str], events: List[dict]
+    ) -> ActionResult:
+        """
+        Run the input rails in parallel.
+
+        Args:
+            flows (List[str]): The ids of the input rails flows.
+            events (List[dict]): The list of events.
+
+        Returns:
+            ActionResult: The context updates and the events resulting from the rails.
+        """
+        return await self._run_rails_in_parallel(flows, events, rail_type="input")
+
+    @action(name="run_output_rails_in_parallel", is_system_action=True)
+    async def _run_output_rails_in_parallel(
+        self, flows: List[str], events: List[dict]
+    ) -> ActionResult:
+        """
+        Run the output rails in parallel.
+
+        Args:
+            flows (List[str]): The ids of the output rails flows.
+            events (List[dict]): The list of events.
+
+        Returns:
+            ActionResult: The context updates and the events resulting from the rails.
+        """
+        return await self._run_rails_in_parallel(flows, events, rail_type="output")
+
+    async def run_output_rails(
+        self, bot_message: str, events: List[dict]
+    ) -> ActionResult:
+        """
+        Run the output rails on a bot message, outside of the flows.
+
+        This is used to check the windows of a streamed bot message.
+
+        Args:
+            bot_message (str): The bot message.
+            events (List[dict]): The list of events.
+
+        Returns:
+            ActionResult: The context updates and the events resulting from the rails.
+              If a rail blocked the message, `triggered_output_rail` is set in the
+              context updates.
+        """
+        events = events + [
+            new_event_dict("ContextUpdate", data={"bot_message": bot_message})
+        ]
+
+        return await self._run_rails_in_parallel(
+            self.config.rails.output.flows,
+            events,
+            rail_type="output",
+            parallel=self.config.rails.output.parallel,
+        )
+
+
+class _ReadTrackingContext(dict):
+    """A context which records the variables that are read from it.
+
+    If the whole context is read, e.g., when it is iterated or copied, all the
+    variables are considered read.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.read_keys = {"user_message"}
+        self.read_all = False
+
+    def __getitem__(self, key):
+        self.read_keys.add(key)
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        self.read_keys.add(key)
+        return super().__contains__(key)
+
+    def get(self, key, default=None):
+        self.read_keys.add(key)
+        return super().get(key, default)
+
+    def __iter__(self):
+        self.read_all = True
+        return super().__iter__()
+
+    def keys(self):
+        self.read_all = True
+        return super().keys()
+
+    def values(self):
+        self.read_all = True
+        return super().values()
+
+    def items(self):
+        self.read_all = True
+        return super().items()
+
+    def copy(self):
+        self.read_all = True
+        return dict(super().items())
+
+    def get_changed_keys(self, context: dict) -> Set[str]:
+        """Returns the variables read so far which have a different value in a context."""
+        keys = self.read_keys
+        if self.read_all:
+            keys = keys | set(dict.keys(self)) | set(context)
+
+        return {key for key in keys if dict.get(self, key) != context.get(key)}
+
+
+def _get_total_tokens(processing_log: List[dict]) -> int:
+    """Returns the total number of tokens used by the LLM calls in a processing log."""
+    return sum(
+        entry["data"].total_tokens or 0
+        for entry in processing_log
+        if entry["type"] == "llm_call_info"
+    )
+
+
+def _is_stop(events: List[dict]) -> bool:
+    """Checks if a list of events stops the processing i.e., an explicit `stop` or
+    hiding the current turn, e.g., after an internal error."""
+    for event in events:
+        if event["type"] == "BotIntent" and event["intent"] == "stop":
+            return True
+        if event["type"] == "hide_prev_turn":
+            return True
+
+    return False
@@ -16,8 +16,8 @@
 import json
 import logging
 import re
-from functools import partial
-from typing import Any, Callable, Dict, List, Optional, Set
+from functools import lru_cache, partial
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 import simpleeval
 from simpleeval import EvalWithCompoundTypes
@@ -57,6 +57,99 @@ class ComparisonExpression:
         return self.operator(value)
 
 
+# The maximum number of compiled expressions that are cached.
+EXPRESSION_CACHE_SIZE = 1024
+
+# The pattern for string literals, including triple-quoted ones.
+_string_pattern = re.compile(
+    r'("""|\'\'\')((?:\\\1|(?!\1)[\s\S])*?)\1|("|\')((?:\\\3|(?!\3).)*?)\3'
+)
+
+# The pattern for expressions within curly brackets, ignoring double curly brackets.
+_inner_expression_pattern = re.compile(r"{(?!\{)([^{}]+)\}(?!\})")
+
+_var_name_pattern = re.compile(r"\$([a-zA-Z_][a-zA-Z0-9_]*)")
+
+
+@lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def _compile_string_expressions(expr: str) -> Optional[List[Tuple[str, List[str]]]]:
+    """Finds the string literals in an expression that need interpolation.
+
+    Returns:
+        None, if no string literal needs interpolation. Otherwise, the list of all
+        string literals together with their inner expressions.
+    """
+    string_expressions = []
+    needs_interpolation = False
+
+    for string_expression_match in _string_pattern.findall(expr):
+        character = string_expression_match[0] or string_expression_match[2]
+        string_expression = (
+            character
+            + (string_expression_match[1] or string_expression_match[3])
+            + character
+        )
+        inner_expressions = _inner_expression_pattern.findall(string_expression)
+        if inner_expressions or "{{" in string_expression or "}}" in string_expression:
+            needs_interpolation = True
+
+        string_expressions.append((string_expression, inner_expressions))
+
+    return string_expressions if needs_interpolation else None
+
+
+@lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def compile_expression(expr: str) -> Tuple[str, Any, List[str]]:
+    """Compiles an expression, without string interpolation, for evaluation.
+
+    The compiled expressions are cached, keyed by the source of the expression.
+    The cache statistics are available through `compile_expression.cache_info()`.
+
+    Returns:
+        The updated expression where the `$` variables are replaced with `var_` names,
+        the parsed AST and the names of the variables.
+    """
+    var_names = list(dict.fromkeys(_var_name_pattern.findall(expr)))
+    updated_expr = _var_name_pattern.sub(r"var_\1", expr)
+
+    return updated_expr, EvalWithCompoundTypes.parse(updated_expr), var_names
+
+
+def _interpolate_string_expressions(
+    expr: str, string_expressions: List[Tuple[str, List[str]]], context: dict
+) -> str:
+    """Evaluates the expressions within curly brackets in the string literals."""
+    string_expression_values = []
+    for string_expression, inner_expressions in string_expressions:
+        if inner_expressions:
+            inner_expression_values = []
+            for inner_expression in inner_expressions:
+                try:
+                    value = eval_expression(inner_expression, context)
+                except Exception as ex:
+                    raise ColangValueError(
+                        f"Error evaluating inner expression: '{inner_expression}'"
+                    ) from ex
+
+                value = str(value)
+
+                # Escape special characters
+                value = escape_special_string_characters(value)
+
+                inner_expression_values.append(value)
+            string_expression = _inner_expression_pattern.sub(
+                lambda x: inner_expression_values.pop(0),
+                string_expression,
+            )
+        string_expression = string_expression.replace("{{", "{").replace("}}", "}")
+        string_expression_values.append(string_expression)
+
+    return _string_pattern.sub(
+        lambda x: string_expression_values.pop(0),
+        expr,
+    )
+
+
 def eval_expression(expr: str, context: dict) -> Any:
     """Evaluates the provided expression in the given."""
     # If it's not a string, we should return it as such
@@ -69,65 +162,24 @@ def eval_expression(expr: str, context: dict) -> Any:
         return expr
 
     # We search for all expressions in strings within curly brackets and evaluate them first
-    # Find first all strings
-    string_pattern = (
-        r'("""|\'\'\')((?:\\\1|(?!\1)[\s\S])*?)\1|("|\')((?:\\\3|(?!\3).)*?)\3'
-    )
-    string_expressions_matches = re.findall(string_pattern, expr)
-    string_expression_values = []
-    for string_expression_match in string_expressions_matches:
-        character = string_expression_match[0] or string_expression_match[2]
-        string_expression = (
-            character
-            + (string_expression_match[1] or string_expression_match[3])
-            + character
-        )
-        if string_expression:
-            # Find expressions within curly brackets, ignoring double curly brackets
-            expression_pattern = r"{(?!\{)([^{}]+)\}(?!\})"
-            inner_expressions = re.findall(expression_pattern, string_expression)
-            if inner_expressions:
-                inner_expression_values = []
-                for inner_expression in inner_expressions:
-                    try:
-                        value = eval_expression(inner_expression, context)
-                    except Exception as ex:
-                        raise ColangValueError(
-                            f"Error evaluating inner expression: '{inner_expression}'"
-                        ) from ex
-
-                    value = str(value)
-
-                    # Escape special characters
-                    value = escape_special_string_characters(value)
-
-                    inner_expression_values.append(value)
-                string_expression = re.sub(
-                    expression_pattern,
-                    lambda x: inner_expression_values.pop(0),
-                    string_expression,
-                )
-            string_expression = string_expression.replace("{{", "{").replace("}}", "}")
-            string_expression_values.append(string_expression)
-    if string_expression_values:
-        expr = re.sub(
-            string_pattern,
-            lambda x: string_expression_values.pop(0),
-            expr,
-        )
+    string_expressions = _compile_string_expressions(expr)
+    if string_expressions is not None:
+        expr = _interpolate_string_expressions(expr, string_expressions, context)
+
+        # The interpolated expression depends on the values, so we don't cache it.
+        compile_fn = compile_expression.__wrapped__
+    else:
+        compile_fn = compile_expression
+
+    try:
+        updated_expr, parsed_expr, var_names = compile_fn(expr)
+    except Exception as e:
+        raise ColangValueError(f"Error evaluating '{expr}', {e}")
 
     # We search for all variable names starting with $, remove the $ and add
     # the value in the dict for eval
     expr_locals = {}
-    regex_pattern = r"\$([a-zA-Z_][a-zA-Z0-9_]*)"
-    var_names = re.findall(regex_pattern, expr)
-    updated_expr = re.sub(regex_pattern, r"var_\1", expr)
-
     for var_name in var_names:
-        # if we've already computed the value, we skip
-        if f"var_{var_name}" in expr_locals:
-            continue
-
         # Check if it is a global variable
         global_var_name = f"_global_{var_name}"
         if global_var_name in context:
@@ -179,7 +231,7 @@ def eval_expression(expr: str, context: dict) -> Any:
             names=expr_locals,
         )
 
-        result = s.eval(updated_expr)
+        result = s.eval(updated_expr, previously_parsed=parsed_expr)
 
         # Assign back changed values to dictionary variables
         for var_name, val in expr_locals.items():
@@ -0,0 +1,174 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Building Annoy indexes, and choosing the number of trees and `search_k` for them.
+
+The autotuning builds indexes with an increasing number of trees and, for each one,
+tries an increasing `search_k`, until the recall@k against an exact search, measured
+on a sample of the indexed vectors, reaches the target recall.
+"""
+import logging
+from dataclasses import dataclass
+from typing import Sequence, Tuple
+
+import numpy as np
+from annoy import AnnoyIndex
+
+log = logging.getLogger(__name__)
+
+# The number of trees tried by the autotuning, in increasing order.
+AUTOTUNE_N_TREES = [10, 25, 50, 100]
+
+# The values of `search_k` tried for each number of trees, as multiples of the default
+# `search_k` of Annoy for `AUTOTUNE_K` results, i.e., `n_trees * AUTOTUNE_K`.
+AUTOTUNE_SEARCH_K_FACTORS = [1, 2, 4, 8, 16, 32]
+
+# The number of results and the number of sampled queries used to measure the recall.
+AUTOTUNE_K = 10
+AUTOTUNE_NUM_QUERIES = 100
+
+# The indexes with at least this number of items are built using all the CPU cores.
+PARALLEL_BUILD_MIN_ITEMS = 10000
+
+
+@dataclass
+class AnnoyTuning:
+    """The parameters chosen for an Annoy index, and the recall@k they achieve."""
+
+    n_trees: int
+    search_k: int
+    recall: float
+
+
+def build_annoy_index(
+    positions: Sequence[int], vectors: Sequence[Sequence[float]], n_trees: int
+) -> AnnoyIndex:
+    """Builds an angular Annoy index, the vectors having the given positions as ids."""
+    index = AnnoyIndex(len(vectors[0]), "angular")
+    for i, vector in zip(positions, vectors):
+        index.add_item(i, vector)
+
+    # A multi-threaded build only pays off for the large indexes.
+    n_jobs = -1 if len(positions) >= PARALLEL_BUILD_MIN_ITEMS else 1
+    index.build(n_trees, n_jobs=n_jobs)
+
+    return index
+
+
+class RecallEvaluator:
+    """Measures the recall@k of an Annoy index against an exact search.
+
+    The queries are a sample of the indexed vectors, and the query vector itself is
+    excluded from both the expected and the actual results.
+    """
+
+    def __init__(
+        self,
+        positions: Sequence[int],
+        vectors: Sequence[Sequence[float]],
+        k: int = AUTOTUNE_K,
+        num_queries: int = AUTOTUNE_NUM_QUERIES,
+        seed: int = 0,
+    ):
+        self.k = min(k, len(positions) - 1)
+        self.positions = np.asarray(positions)
+
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1
+        matrix = matrix / norms
+
+        rng = np.random.default_rng(seed)
+        num_queries = min(num_queries, len(positions))
+        self.queries = rng.choice(len(positions), size=num_queries, replace=False)
+        self.query_vectors = [matrix[j].tolist() for j in self.queries]
+
+        self.expected = []
+        if self.k > 0:
+            scores = matrix[self.queries] @ matrix.T
+            for row, j in zip(scores, self.queries):
+                row[j] = -np.inf
+                top = np.argpartition(-row, self.k - 1)[: self.k]
+                self.expected.append(set(self.positions[top].tolist()))
+
+    def recall(self, index: AnnoyIndex, search_k: int = -1) -> float:
+        """Computes the average recall@k of the index, for the given `search_k`."""
+        if self.k <= 0:
+            return 1.0
+
+        recalls = []
+        for j, vector, expected in zip(self.queries, self.query_vectors, self.expected):
+            results = index.get_nns_by_vector(vector, self.k + 1, search_k=search_k)
+            results = [i for i in results if i != self.positions[j]][: self.k]
+            recalls.append(len(expected.intersection(results)) / self.k)
+
+        return float(np.mean(recalls))
+
+
+def autotune_annoy_index(
+    positions: Sequence[int],
+    vectors: Sequence[Sequence[float]],
+    target_recall: float,
+) -> Tuple[AnnoyIndex, AnnoyTuning]:
+    """Builds an Annoy index with the fewest trees and the smallest `search_k` meeting
+    the target recall@k.
+
+    If the target recall is not met, the index with the most trees is returned, along
+    with the `search_k` achieving the best recall.
+
+    Args:
+        positions: The ids of the vectors.
+        vectors: The vectors to index.
+        target_recall: The target recall@k, between 0 and 1.
+
+    Returns:
+        The index and the chosen parameters.
+    """
+    evaluator = RecallEvaluator(positions, vectors)
+
+    index, best = None, None
+    for n_trees in AUTOTUNE_N_TREES:
+        index = build_annoy_index(positions, vectors, n_trees)
+        best = None
+
+        for factor in AUTOTUNE_SEARCH_K_FACTORS:
+            search_k = factor * n_trees * AUTOTUNE_K
+            recall = evaluator.recall(index, search_k)
+            if best is None or recall > best.recall:
+                best = AnnoyTuning(n_trees=n_trees, search_k=search_k, recall=recall)
+
+            if recall >= target_recall:
+                return index, best
+
+    log.warning(
+        f"The target recall {target_recall} was not met, "
+        f"using {best.n_trees} trees with recall {best.recall:.3f}."
+    )
+
+    return index, best
+
+
+def get_search_k(search_k: int, n_trees: int, max_results: int) -> int:
+    """Get the `search_k` for a query, never below the default one of Annoy.
+
+    Args:
+        search_k: The configured `search_k`, or -1 to use the default one.
+        n_trees: The number of trees of the index.
+        max_results: The number of results of the query.
+    """
+    if search_k <= 0:
+        return -1
+
+    return max(search_k, n_trees * max_results)
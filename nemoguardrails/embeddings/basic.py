@@ -14,15 +14,37 @@
 # limitations under the License.
 
 import asyncio
-from typing import Any, Dict, List, Optional, Union
-
+import contextlib
+import json
+import logging
+import os
+import uuid
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
 from annoy import AnnoyIndex
 
-from nemoguardrails.embeddings.cache import cache_embeddings
+from nemoguardrails.embeddings.autotune import (
+    AnnoyTuning,
+    autotune_annoy_index,
+    build_annoy_index,
+    get_search_k,
+)
+from nemoguardrails.embeddings.batcher import get_embedding_batcher
+from nemoguardrails.embeddings.cache import EmbeddingsCache, cache_embeddings
 from nemoguardrails.embeddings.index import EmbeddingsIndex, IndexItem
 from nemoguardrails.embeddings.providers import EmbeddingModel, init_embedding_model
 from nemoguardrails.rails.llm.config import EmbeddingsCacheConfig
 
+log = logging.getLogger(__name__)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Normalizes the rows of a matrix to unit length, leaving zero rows unchanged."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
 
 class BasicEmbeddingsIndex(EmbeddingsIndex):
     """Basic implementation of an embeddings index.
@@ -30,6 +52,11 @@ class BasicEmbeddingsIndex(EmbeddingsIndex):
     It uses the `sentence-transformers/all-MiniLM-L6-v2` model to compute embeddings.
     Annoy is employed for efficient nearest-neighbor search.
 
+    Items can be added and removed after the index is built. The added items go to a
+    delta segment, searched exactly along with the built index, and the removed items
+    are filtered out of the results. When the delta segment and the removed items reach
+    `max_delta_size`, the index is rebuilt in the background with all the items.
+
     Attributes:
         embedding_model (str): The model for computing embeddings.
         embedding_engine (str): The engine for computing embeddings.
@@ -37,9 +64,17 @@ class BasicEmbeddingsIndex(EmbeddingsIndex):
         embedding_size (int): The size of the embeddings.
         cache_config (EmbeddingsCacheConfig): The cache configuration.
         embeddings (List[List[float]]): The computed embeddings.
-        use_batching: Whether to batch requests when computing the embeddings.
+        use_batching: Whether to batch the search queries with the ones of the other indexes
+            using the same embedding model, using the process-wide `EmbeddingBatcher`.
         max_batch_size: The maximum size of a batch.
         max_batch_hold: The maximum time a batch is held before being processed
+        max_delta_size: The number of items added or removed after the build that
+            triggers a background merge.
+        n_trees: The number of trees of the Annoy index.
+        search_k: The number of nodes inspected by a search, -1 for the Annoy default.
+        autotune: Whether to choose `n_trees` and `search_k` when the index is built,
+            to meet `target_recall`.
+        target_recall: The recall@10 against an exact search targeted by the autotuning.
     """
 
     embedding_model: str
@@ -51,47 +86,84 @@ class BasicEmbeddingsIndex(EmbeddingsIndex):
     use_batching: bool
     max_batch_size: int
     max_batch_hold: float
+    max_delta_size: int
+    n_trees: int
+    search_k: int
+    autotune: bool
+    target_recall: float
 
     def __init__(
         self,
         embedding_model=None,
         embedding_engine=None,
+        embedding_params: Optional[Dict[str, Any]] = None,
         index=None,
         cache_config: Union[EmbeddingsCacheConfig, Dict[str, Any]] = None,
         use_batching: bool = False,
         max_batch_size: int = 10,
         max_batch_hold: float = 0.01,
+        max_delta_size: int = 1000,
+        n_trees: int = 10,
+        search_k: int = -1,
+        autotune: bool = False,
+        target_recall: float = 0.95,
     ):
         """Initialize the BasicEmbeddingsIndex.
 
         Args:
             embedding_model (str, optional): The model for computing embeddings. Defaults to None.
             embedding_engine (str, optional): The engine for computing embeddings. Defaults to None.
+            embedding_params (Dict[str, Any], optional): The additional parameters of the
+                embedding model, e.g., the `api_key`. Defaults to None.
             index (AnnoyIndex, optional): The pre-existing index. Defaults to None.
             cache_config (EmbeddingsCacheConfig | Dict[str, Any], optional): The cache configuration. Defaults to None.
             use_batching: Whether to batch requests when computing the embeddings.
             max_batch_size: The maximum size of a batch.
             max_batch_hold: The maximum time a batch is held before being processed
+            max_delta_size: The number of items added or removed after the build that
+                triggers a background merge.
+            n_trees: The number of trees of the Annoy index.
+            search_k: The number of nodes inspected by a search, -1 for the Annoy default.
+            autotune: Whether to choose `n_trees` and `search_k` when the index is built.
+            target_recall: The recall@10 targeted by the autotuning.
         """
         self._model: Optional[EmbeddingModel] = None
         self._items = []
         self._embeddings = []
         self.embedding_model = embedding_model
         self.embedding_engine = embedding_engine
+        self.embedding_params = embedding_params or {}
         self._embedding_size = 0
         if isinstance(cache_config, Dict):
             self._cache_config = EmbeddingsCacheConfig(**cache_config)
         else:
             self._cache_config = cache_config or EmbeddingsCacheConfig()
-        self._index = index
-
-        # Data structures for batching embedding requests
-        self._req_queue = {}
-        self._req_results = {}
-        self._req_idx = 0
-        self._current_batch_finished_event = None
-        self._current_batch_full_event = None
-        self._current_batch_submitted = asyncio.Event()
+        # Created on first use by `cache_embeddings` and held for the lifetime of the index.
+        self._embeddings_cache: Optional[EmbeddingsCache] = None
+
+        # The built index covers the first `_num_indexed` items, and the items added
+        # afterwards are in the delta segment. The removed items are set to None.
+        self._index = None
+        self._num_indexed = 0
+        self._num_removed_indexed = 0
+
+        # Increased each time the index is replaced, so that a background merge does
+        # not replace an index that was set in the meantime.
+        self._index_version = 0
+        self._delta_matrix: Optional[np.ndarray] = None
+        self._delta_positions: List[int] = []
+        self._merge_task: Optional[asyncio.Future] = None
+        self.max_delta_size = max_delta_size
+
+        # The parameters of the Annoy index, possibly chosen by the autotuning.
+        self.n_trees = n_trees
+        self.search_k = search_k
+        self.autotune = autotune
+        self.target_recall = target_recall
+        self._tuning: Optional[AnnoyTuning] = None
+
+        if index is not None:
+            self._set_index(index, self._get_index_size(index))
 
         # Initialize the batching configuration
         self.use_batching = use_batching
@@ -121,12 +193,14 @@ class BasicEmbeddingsIndex(EmbeddingsIndex):
     @embeddings_index.setter
     def embeddings_index(self, index):
         """Setter to allow replacing the index dynamically."""
-        self._index = index
+        self._set_index(index, self._get_index_size(index) if index is not None else 0)
 
     def _init_model(self):
         """Initialize the model used for computing the embeddings."""
         self._model = init_embedding_model(
-            embedding_model=self.embedding_model, embedding_engine=self.embedding_engine
+            embedding_model=self.embedding_model,
+            embedding_engine=self.embedding_engine,
+            embedding_params=self.embedding_params,
         )
 
     @cache_embeddings
@@ -151,125 +225,428 @@ class BasicEmbeddingsIndex(EmbeddingsIndex):
         Args:
             item (IndexItem): The item to add to the index.
         """
-        self._items.append(item)
-
-        # If the index is already built, we skip this
-        if self._index is None:
-            self._embeddings.append((await self._get_embeddings([item.text]))[0])
+        await self.add_items([item])
 
-            # Update the embedding if it was not computed up to this point
-            self._embedding_size = len(self._embeddings[0])
-
-    async def add_items(self, items: List[IndexItem]):
+    async def add_items(
+        self,
+        items: List[IndexItem],
+        embeddings: Optional[List[Optional[List[float]]]] = None,
+    ):
         """Add multiple items to the index at once.
 
+        Before the index is built, the items are indexed by `build`. Once it is built,
+        the items are added to the delta segment, which is searched exactly, and merged
+        in the background when it has `max_delta_size` items.
+
         Args:
             items (List[IndexItem]): The list of items to add to the index.
+            embeddings (List[Optional[List[float]]], optional): The already known
+                embeddings of the items, e.g., from a previous build. The embeddings
+                which are None are computed.
         """
+        # If the index was loaded, the first items are the ones of the index, so we
+        # skip computing their embeddings.
+        num_loaded = min(len(items), max(0, self._num_indexed - len(self._items)))
+        if num_loaded:
+            self._items.extend(items[:num_loaded])
+            self._embeddings.extend([None] * num_loaded)
+            items = items[num_loaded:]
+
+        if not items:
+            return
+
+        embeddings = list(
+            embeddings[num_loaded:] if embeddings else [None] * len(items)
+        )
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            computed = await self._get_embeddings([items[i].text for i in missing])
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = embedding
+
         self._items.extend(items)
+        self._embeddings.extend(embeddings)
 
-        # If the index is already built, we skip this
-        if self._index is None:
-            self._embeddings.extend(
-                await self._get_embeddings([item.text for item in items])
-            )
+        # Update the embedding if it was not computed up to this point
+        self._embedding_size = len(embeddings[0])
 
-            # Update the embedding if it was not computed up to this point
-            self._embedding_size = len(self._embeddings[0])
+        if self._index is not None:
+            self._delta_matrix = None
+            self._maybe_merge()
 
-    async def build(self):
-        """Builds the Annoy index."""
-        self._index = AnnoyIndex(len(self._embeddings[0]), "angular")
-        for i in range(len(self._embeddings)):
-            self._index.add_item(i, self._embeddings[i])
-        self._index.build(10)
-
-    async def _run_batch(self):
-        """Runs the current batch of embeddings."""
-
-        # Wait up to `max_batch_hold` time or until `max_batch_size` is reached.
-        done, pending = await asyncio.wait(
-            [
-                asyncio.create_task(asyncio.sleep(self.max_batch_hold)),
-                asyncio.create_task(self._current_batch_full_event.wait()),
-            ],
-            return_when=asyncio.FIRST_COMPLETED,
+    async def remove_items(self, items: List[IndexItem]) -> int:
+        """Remove items from the index.
+
+        The items removed from the built index are excluded from the search results
+        until the next merge, which drops them.
+
+        Args:
+            items (List[IndexItem]): The items to remove.
+
+        Returns:
+            int: The number of removed items.
+        """
+        # The items are not hashable, so they are grouped by text.
+        items_by_text = {}
+        for item in items:
+            items_by_text.setdefault(item.text, []).append(item)
+
+        num_removed = 0
+        for i, item in enumerate(self._items):
+            if item is not None and item in items_by_text.get(item.text, ()):
+                self._items[i] = None
+                self._embeddings[i] = None
+                num_removed += 1
+
+                if i < self._num_indexed:
+                    self._num_removed_indexed += 1
+                else:
+                    self._delta_matrix = None
+
+        if num_removed and self._index is not None:
+            self._maybe_merge()
+
+        return num_removed
+
+    async def remove_item(self, item: IndexItem) -> int:
+        """Remove an item from the index.
+
+        Args:
+            item (IndexItem): The item to remove.
+
+        Returns:
+            int: The number of removed items.
+        """
+        return await self.remove_items([item])
+
+    def get_item_embeddings(self) -> Tuple[List[IndexItem], List[List[float]]]:
+        """Get the items of the index which are not removed, and their embeddings.
+
+        For a loaded index, the embeddings are read from the built index.
+        """
+        positions = [i for i, item in enumerate(self._items) if item is not None]
+
+        return [self._items[i] for i in positions], [
+            self._get_embedding(i) for i in positions
+        ]
+
+    def _get_embedding(self, i: int) -> List[float]:
+        """Get the embedding of an item, from the built index if it was loaded."""
+        if self._embeddings[i] is not None:
+            return self._embeddings[i]
+
+        return self._get_indexed_vector(i)
+
+    def _get_indexed_vector(self, i: int) -> List[float]:
+        """Get the vector of an item from the built index."""
+        return self._index.get_item_vector(i)
+
+    def _build_index(
+        self, size: int, positions: List[int], vectors: List[List[float]]
+    ) -> Tuple[Any, Optional[AnnoyTuning]]:
+        """Builds the Annoy index of the items at the given positions.
+
+        It can run in an executor thread, so the parameters chosen by the autotuning
+        are returned, and set together with the index, rather than set here.
+        """
+        if not self.autotune:
+            return build_annoy_index(positions, vectors, self.n_trees), None
+
+        return autotune_annoy_index(positions, vectors, self.target_recall)
+
+    def _get_index_size(self, index) -> int:
+        """Get the number of items covered by a built index."""
+        return index.get_n_items()
+
+    def _set_tuning(self, tuning: AnnoyTuning):
+        """Sets the parameters chosen by the autotuning."""
+        self._tuning = tuning
+        self.n_trees = tuning.n_trees
+        self.search_k = tuning.search_k
+
+    def _set_index(self, index, size: int, tuning: Optional[AnnoyTuning] = None):
+        """Sets the built index, covering the first `size` items."""
+        if tuning is not None:
+            self._set_tuning(tuning)
+
+        self._index = index
+        self._index_version += 1
+        self._num_indexed = size
+        self._num_removed_indexed = sum(
+            1 for item in self._items[:size] if item is None
         )
-        for task in pending:
-            task.cancel()
+        self._delta_matrix = None
 
-        # Reset the batch event
-        batch_event: asyncio.Event = self._current_batch_finished_event
-        self._current_batch_finished_event = None
+    def _get_build_input(self):
+        """Get the positions and the vectors of the items which are not removed."""
+        size = len(self._items)
+        positions = [i for i in range(size) if self._items[i] is not None]
+        vectors = [self._get_embedding(i) for i in positions]
 
-        # Create the actual batch to be send for computing
-        batch = []
-        batch_ids = list(self._req_queue.keys())
-        for req_id in batch_ids:
-            batch.append(self._req_queue[req_id])
+        return size, positions, vectors
 
-        # Empty the queue up to this point
-        self._req_queue = {}
+    def _set_compacted_index(
+        self,
+        index,
+        size: int,
+        positions: List[int],
+        tuning: Optional[AnnoyTuning] = None,
+    ):
+        """Sets an index built for the items at the given positions, out of the first
+        `size` items, which are moved to the front.
 
-        # We allow other batches to start
-        self._current_batch_submitted.set()
+        The slots of the removed items are dropped, and the items added after the first
+        `size` ones are kept, in the delta segment.
+        """
+        self._items = [self._items[i] for i in positions] + self._items[size:]
+        self._embeddings = [self._embeddings[i] for i in positions] + self._embeddings[
+            size:
+        ]
+        self._set_index(index, len(positions), tuning)
 
-        # print(f"Running batch of length {len(batch)}")
+    async def build(self):
+        """Builds the index with all the items, including the delta segment."""
+        size, positions, vectors = self._get_build_input()
+        if not size:
+            return
+
+        index, tuning = None, None
+        if positions:
+            index, tuning = self._build_index(
+                len(positions), list(range(len(positions))), vectors
+            )
+        self._set_compacted_index(index, size, positions, tuning)
 
-        # Compute the embeddings
-        embeddings = await self._get_embeddings(batch)
-        for i in range(len(embeddings)):
-            self._req_results[batch_ids[i]] = embeddings[i]
+    async def merge(self):
+        """Merges the delta segment into the built index, and drops the removed items.
 
-        # Signal that the batch has finished processing
-        batch_event.set()
+        The new index is built in the default executor, so the searches keep using the
+        current index and the delta segment until it is ready.
+        """
+        size, positions, vectors = self._get_build_input()
+        if not size:
+            return
+
+        index_version = self._index_version
+        index, tuning = None, None
+        if positions:
+            loop = asyncio.get_running_loop()
+            index, tuning = await loop.run_in_executor(
+                None,
+                self._build_index,
+                len(positions),
+                list(range(len(positions))),
+                vectors,
+            )
 
-    async def _batch_get_embeddings(self, text: str) -> List[float]:
-        # As long as the queue is full, we wait for the next batch
-        while len(self._req_queue) >= self.max_batch_size:
-            await self._current_batch_submitted.wait()
+        # The index might have been built again in the meantime.
+        if self._index_version == index_version:
+            self._set_compacted_index(index, size, positions, tuning)
+
+    def _maybe_merge(self):
+        """Starts a background merge if the delta segment is too large."""
+        num_pending = len(self._items) - self._num_indexed + self._num_removed_indexed
+        if num_pending < self.max_delta_size:
+            return
+
+        if self._merge_task is None or self._merge_task.done():
+            self._merge_task = asyncio.ensure_future(self.merge())
+            self._merge_task.add_done_callback(self._on_merge_done)
+
+    @staticmethod
+    def _on_merge_done(task: asyncio.Task):
+        """Logs the error of a background merge, which is not awaited otherwise."""
+        if not task.cancelled() and task.exception() is not None:
+            log.error(
+                "The background merge of the embeddings index failed.",
+                exc_info=task.exception(),
+            )
 
-        req_id = self._req_idx
-        self._req_idx += 1
-        self._req_queue[req_id] = text
+    async def save(self, path: str):
+        """Saves the built index, so that it can be loaded later using `load`.
 
-        if self._current_batch_finished_event is None:
-            self._current_batch_finished_event = asyncio.Event()
-            self._current_batch_full_event = asyncio.Event()
-            self._current_batch_submitted.clear()
-            asyncio.ensure_future(self._run_batch())
+        The files are written atomically, so several processes can save and load
+        the same index concurrently.
 
-        # We check if we reached the max batch size
-        if len(self._req_queue) >= self.max_batch_size:
-            self._current_batch_full_event.set()
+        Args:
+            path (str): The path of the index, without the extension.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+
+        # The embedding size is needed to load the index, so it is saved first.
+        with open(tmp_path, "w") as f:
+            f.write(str(self._embedding_size))
+        os.replace(tmp_path, f"{path}.esize")
+
+        # The parameters chosen by the autotuning are recorded next to the index. A
+        # previous record is removed, so it is not loaded with the new index.
+        if self._tuning is not None:
+            with open(tmp_path, "w") as f:
+                json.dump(self._tuning.__dict__, f)
+            os.replace(tmp_path, f"{path}.tuning.json")
+        else:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(f"{path}.tuning.json")
 
-        # Wait for the batch to finish
-        await self._current_batch_finished_event.wait()
+        self._index.save(tmp_path)
+        os.replace(tmp_path, f"{path}.ann")
 
-        # Remove the result and return it
-        result = self._req_results[req_id]
-        del self._req_results[req_id]
+    async def load(self, path: str) -> bool:
+        """Loads an index saved using `save`.
 
-        return result
+        The index file is memory mapped. The items must still be added, in the same
+        order, but the embeddings of the indexed items are not computed anymore.
 
-    async def search(self, text: str, max_results: int = 20) -> List[IndexItem]:
-        """Search the closest `max_results` items.
+        Args:
+            path (str): The path of the index, without the extension.
+
+        Returns:
+            bool: Whether the index was found.
+        """
+        if not os.path.exists(f"{path}.ann"):
+            return False
+
+        with open(f"{path}.esize", "r") as f:
+            self._embedding_size = int(f.read())
+
+        if os.path.exists(f"{path}.tuning.json"):
+            with open(f"{path}.tuning.json", "r") as f:
+                self._set_tuning(AnnoyTuning(**json.load(f)))
+
+        index = AnnoyIndex(self._embedding_size, "angular")
+        index.load(f"{path}.ann")
+        self._set_index(index, self._get_index_size(index))
+
+        return True
+
+    @cache_embeddings
+    async def _get_batched_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Compute embeddings for a list of texts using the shared batcher of the model."""
+        batcher = get_embedding_batcher(
+            embedding_model=self.embedding_model,
+            embedding_engine=self.embedding_engine,
+            max_batch_size=self.max_batch_size,
+            max_batch_hold=self.max_batch_hold,
+            model=self._model,
+            embedding_params=self.embedding_params,
+        )
+
+        # The index and the batcher share the same instance of the model.
+        if self._model is None:
+            self._model = batcher.model
+
+        return await batcher.encode_async(texts)
+
+    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Compute the embeddings of the texts, using batching if enabled.
 
         Args:
-            text (str): The text to search for.
-            max_results (int, optional): The maximum number of results to return. Defaults to 20.
+            texts (List[str]): The list of texts to compute embeddings for.
 
         Returns:
-            List[IndexItem]: The closest items found.
+            List[List[float]]: The computed embeddings.
         """
         if self.use_batching:
-            _embedding = await self._batch_get_embeddings(text)
+            return await self._get_batched_embeddings(texts)
         else:
-            _embedding = (await self._get_embeddings([text]))[0]
-
-        results = self._index.get_nns_by_vector(
-            _embedding,
+            return await self._get_embeddings(texts)
+
+    async def _get_query_embedding(self, text: str) -> List[float]:
+        """Compute the embedding for a search query, using batching if enabled."""
+        return (await self.get_embeddings([text]))[0]
+
+    def _search_index(
+        self, embedding: List[float], max_results: int
+    ) -> List[Tuple[int, float]]:
+        """Search the built index, returning the positions and the cosine similarities."""
+        results, distances = self._index.get_nns_by_vector(
+            embedding,
             max_results,
+            search_k=get_search_k(self.search_k, self.n_trees, max_results),
+            include_distances=True,
         )
 
-        return [self._items[i] for i in results]
+        # The angular distance is sqrt(2 - 2 * cos), for normalized vectors.
+        return [(i, 1 - d * d / 2) for i, d in zip(results, distances)]
+
+    def _search_delta(
+        self, embedding: List[float], max_results: int
+    ) -> List[Tuple[int, float]]:
+        """Search the items added since the index was built, exactly."""
+        if self._delta_matrix is None:
+            positions = [
+                i
+                for i in range(self._num_indexed, len(self._items))
+                if self._items[i] is not None
+            ]
+            if not positions:
+                return []
+
+            vectors = np.asarray(
+                [self._embeddings[i] for i in positions], dtype=np.float32
+            )
+            self._delta_positions = positions
+            self._delta_matrix = normalize_rows(vectors)
+
+        scores = self._delta_matrix @ normalize_rows(
+            np.asarray(embedding, dtype=np.float32)
+        )
+        results = np.argsort(-scores, kind="stable")[:max_results]
+
+        return [(self._delta_positions[i], float(scores[i])) for i in results]
+
+    async def _search(self, text: str, max_results: int) -> List[Tuple[int, float]]:
+        """Search the built index and the delta segment.
+
+        Returns:
+            The positions of the closest items and their cosine similarities.
+        """
+        embedding = await self._get_query_embedding(text)
+
+        results = []
+        if self._index is not None:
+            # The removed items are filtered out, so we fetch more results to compensate.
+            results = [
+                (i, score)
+                for i, score in self._search_index(
+                    embedding, max_results + self._num_removed_indexed
+                )
+                if self._items[i] is not None
+            ]
+
+        if len(self._items) > self._num_indexed:
+            results.extend(self._search_delta(embedding, max_results))
+            results.sort(key=lambda result: -result[1])
+
+        return results[:max_results]
+
+    async def search_with_scores(
+        self, text: str, max_results: int = 20
+    ) -> List[Tuple[IndexItem, float]]:
+        """Search the closest `max_results` items, along with their cosine similarity.
+
+        Args:
+            text (str): The text to search for.
+            max_results (int, optional): The maximum number of results to return. Defaults to 20.
+
+        Returns:
+            List[Tuple[IndexItem, float]]: The closest items found and their scores,
+                in decreasing order of similarity.
+        """
+        return [
+            (self._items[i], score)
+            for i, score in await self._search(text, max_results)
+        ]
+
+    async def search(self, text: str, max_results: int = 20) -> List[IndexItem]:
+        """Search the closest `max_results` items.
+
+        Args:
+            text (str): The text to search for.
+            max_results (int, optional): The maximum number of results to return. Defaults to 20.
+
+        Returns:
+            List[IndexItem]: The closest items found.
+        """
+        return [self._items[i] for i, _ in await self._search(text, max_results)]
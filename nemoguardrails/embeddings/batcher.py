@@ -0,0 +1,255 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from nemoguardrails.embeddings.providers import init_embedding_model
+from nemoguardrails.embeddings.providers.base import EmbeddingModel
+
+log = logging.getLogger(__name__)
+
+
+class _Batch:
+    """A batch of texts waiting for their embeddings."""
+
+    def __init__(self):
+        # The futures for the embeddings, by text, so that identical texts are computed once.
+        self.futures: Dict[str, asyncio.Future] = {}
+        self.enqueued_at: Dict[str, float] = {}
+        self.num_requested = 0
+        self.full = asyncio.Event()
+
+
+class EmbeddingBatcher:
+    """Micro-batcher for the embeddings of an embedding model.
+
+    The texts submitted concurrently, e.g., by several indexes or requests, are grouped
+    in batches of up to `max_batch_size` unique texts. A batch is computed as soon as it
+    is full, or `max_batch_hold` seconds after its first text was submitted.
+
+    Use `get_embedding_batcher` to get the process-wide batcher of an embedding model.
+
+    Attributes:
+        max_batch_size (int): The maximum number of unique texts in a batch.
+        max_batch_hold (float): The maximum time, in seconds, a batch is held before being computed.
+    """
+
+    def __init__(
+        self,
+        model: EmbeddingModel,
+        max_batch_size: int = 10,
+        max_batch_hold: float = 0.01,
+    ):
+        self._model = model
+        self.max_batch_size = max_batch_size
+        self.max_batch_hold = max_batch_hold
+
+        # The batch being filled, for each event loop.
+        self._current_batches: Dict[asyncio.AbstractEventLoop, _Batch] = {}
+
+        self._stats = {
+            "num_batches": 0,
+            "num_requested_texts": 0,
+            "num_computed_texts": 0,
+            "total_queue_delay": 0.0,
+            "max_queue_delay": 0.0,
+        }
+
+    @property
+    def model(self) -> EmbeddingModel:
+        """The embedding model used to compute the batches."""
+        return self._model
+
+    def _get_current_batch(self) -> _Batch:
+        loop = asyncio.get_running_loop()
+        batch = self._current_batches.get(loop)
+        if batch is None:
+            batch = _Batch()
+            self._current_batches[loop] = batch
+            asyncio.ensure_future(self._run_batch(loop, batch))
+
+        return batch
+
+    def _close_batch(self, loop: asyncio.AbstractEventLoop, batch: _Batch):
+        """Stops adding texts to a batch, so that the next ones go to a new batch."""
+        if self._current_batches.get(loop) is batch:
+            del self._current_batches[loop]
+
+    async def _run_batch(self, loop: asyncio.AbstractEventLoop, batch: _Batch):
+        """Computes a batch when it is full or when the hold time expires.
+
+        The futures of the batch are always resolved, so that the requests waiting
+        for them don't hang: with the error if the computation failed, or cancelled if
+        the batch itself was cancelled.
+        """
+        error: Optional[Exception] = None
+        try:
+            await self._compute_batch(loop, batch)
+        except Exception as ex:
+            error = ex
+        finally:
+            for future in batch.futures.values():
+                if not future.done():
+                    if error is None:
+                        future.cancel()
+                    else:
+                        future.set_exception(error)
+
+    async def _compute_batch(self, loop: asyncio.AbstractEventLoop, batch: _Batch):
+        try:
+            await asyncio.wait_for(batch.full.wait(), timeout=self.max_batch_hold)
+        except asyncio.TimeoutError:
+            pass
+        self._close_batch(loop, batch)
+
+        texts = list(batch.futures.keys())
+        started_at = time.monotonic()
+        queue_delays = [started_at - batch.enqueued_at[text] for text in texts]
+
+        self._stats["num_batches"] += 1
+        self._stats["num_requested_texts"] += batch.num_requested
+        self._stats["num_computed_texts"] += len(texts)
+        self._stats["total_queue_delay"] += sum(queue_delays)
+        self._stats["max_queue_delay"] = max(
+            self._stats["max_queue_delay"], *queue_delays
+        )
+        log.debug(
+            f"Computing a batch of {len(texts)} embeddings "
+            f"({batch.num_requested} requested)."
+        )
+
+        embeddings = await self._model.encode_async(texts)
+        if len(embeddings) != len(texts):
+            raise ValueError(
+                f"Expected {len(texts)} embeddings from the model, got {len(embeddings)}."
+            )
+
+        for text, embedding in zip(texts, embeddings):
+            future = batch.futures[text]
+            if not future.done():
+                future.set_result(embedding)
+
+    async def encode_async(self, texts: List[str]) -> List[List[float]]:
+        """Compute the embeddings for a list of texts, batched with the other requests.
+
+        Args:
+            texts (List[str]): The texts to compute the embeddings for.
+
+        Returns:
+            List[List[float]]: The embeddings, in the same order as the texts.
+        """
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            batch = self._get_current_batch()
+            batch.num_requested += 1
+
+            future = batch.futures.get(text)
+            if future is None:
+                future = loop.create_future()
+                batch.futures[text] = future
+                batch.enqueued_at[text] = time.monotonic()
+
+                if len(batch.futures) >= self.max_batch_size:
+                    self._close_batch(loop, batch)
+                    batch.full.set()
+
+            futures.append(future)
+
+        # The futures are shared with the other requests for the same texts, so they
+        # must not be cancelled if this request is cancelled.
+        return list(await asyncio.gather(*(asyncio.shield(f) for f in futures)))
+
+    def get_stats(self) -> Dict[str, float]:
+        """Get the metrics of the batcher.
+
+        Returns:
+            Dict[str, float]: The number of batches, requested and computed texts, the average
+                batch fill ratio (unique texts / max batch size), the average and maximum
+                queueing delay (in seconds) of the computed texts.
+        """
+        stats = dict(self._stats)
+        num_batches = stats["num_batches"]
+        num_computed_texts = stats["num_computed_texts"]
+
+        stats["avg_batch_fill_ratio"] = (
+            num_computed_texts / (num_batches * self.max_batch_size)
+            if num_batches
+            else 0.0
+        )
+        stats["avg_queue_delay"] = (
+            stats["total_queue_delay"] / num_computed_texts
+            if num_computed_texts
+            else 0.0
+        )
+
+        return stats
+
+
+# The process-wide batchers, by embedding engine and model.
+_embedding_batchers: Dict[Tuple, EmbeddingBatcher] = {}
+
+
+def get_embedding_batcher(
+    embedding_model: str,
+    embedding_engine: str,
+    max_batch_size: int = 10,
+    max_batch_hold: float = 0.01,
+    model: Optional[EmbeddingModel] = None,
+    embedding_params: Optional[Dict[str, Any]] = None,
+) -> EmbeddingBatcher:
+    """Get the process-wide batcher for an embedding model, creating it if needed.
+
+    The batch size, hold time and model are only used when the batcher is created, i.e.,
+    by the first index using the embedding model.
+
+    Args:
+        embedding_model (str): The path or name of the embedding model.
+        embedding_engine (str): The name of the embedding engine.
+        max_batch_size (int): The maximum number of unique texts in a batch.
+        max_batch_hold (float): The maximum time, in seconds, a batch is held before being computed.
+        model (EmbeddingModel, optional): An already loaded instance of the embedding model.
+            If not provided, the model is loaded.
+        embedding_params (Dict[str, Any], optional): The additional parameters of the
+            embedding model, e.g., the `api_key`.
+
+    Returns:
+        EmbeddingBatcher: The batcher of the embedding model.
+    """
+    embedding_params = embedding_params or {}
+
+    # The parameters can hold unhashable values (e.g., the headers), so they are serialized.
+    key = (
+        embedding_engine,
+        embedding_model,
+        json.dumps(embedding_params, sort_keys=True, default=str),
+    )
+
+    if key not in _embedding_batchers:
+        if model is None:
+            model = init_embedding_model(
+                embedding_model=embedding_model,
+                embedding_engine=embedding_engine,
+                embedding_params=embedding_params,
+            )
+        _embedding_batchers[key] = EmbeddingBatcher(
+            model, max_batch_size=max_batch_size, max_batch_hold=max_batch_hold
+        )
+
+    return _embedding_batchers[key]
@@ -13,17 +13,34 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
 import functools
 import hashlib
 import json
 import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import uuid
+import weakref
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from functools import singledispatchmethod
 from pathlib import Path
-from typing import Dict, List
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
 
 from nemoguardrails.rails.llm.config import EmbeddingsCacheConfig
 
+try:
+    import fcntl
+except ImportError:
+    # File locking is not available, e.g., on Windows.
+    fcntl = None
+
 log = logging.getLogger(__name__)
 
 
@@ -82,6 +99,42 @@ class CacheStore(ABC):
         """Clear the cache."""
         pass
 
+    def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        """Get multiple values from the cache, `None` for the missing keys.
+
+        Stores that can fetch several values at once should override this.
+        """
+        return [self.get(key) for key in keys]
+
+    def mset(self, keys: List[str], values: List[Any]):
+        """Set multiple values in the cache.
+
+        Stores that can store several values at once should override this.
+        """
+        for key, value in zip(keys, values):
+            self.set(key, value)
+
+    async def mget_async(self, keys: List[str]) -> List[Optional[Any]]:
+        """Get multiple values from the cache without blocking the event loop.
+
+        By default, `mget` is run in the default executor.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.mget, keys)
+
+    async def mset_async(self, keys: List[str], values: List[Any]):
+        """Set multiple values in the cache without blocking the event loop.
+
+        By default, `mset` is run in the default executor.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.mset, keys, values)
+
+    async def clear_async(self):
+        """Clear the cache without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.clear)
+
     @classmethod
     def from_name(cls, name):
         for subclass in cls.__subclasses__():
@@ -120,6 +173,17 @@ class InMemoryCacheStore(CacheStore):
     def clear(self):
         self._cache = {}
 
+    # The in-memory operations do not block, so there's no need for an executor.
+
+    async def mget_async(self, keys: List[str]) -> List[Optional[Any]]:
+        return self.mget(keys)
+
+    async def mset_async(self, keys: List[str], values: List[Any]):
+        self.mset(keys, values)
+
+    async def clear_async(self):
+        self.clear()
+
 
 class FilesystemCacheStore(CacheStore):
     """Filesystem cache store.
@@ -157,22 +221,278 @@ class FilesystemCacheStore(CacheStore):
         with open(file_path, "w") as file:
             json.dump(value, file)
 
+    def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        # We open the files directly, instead of checking first that they exist.
+        values = []
+        for key in keys:
+            try:
+                with open(self._get_file_path(key), "r") as file:
+                    values.append(json.load(file))
+            except FileNotFoundError:
+                values.append(None)
+
+        return values
+
     def clear(self):
         for file_path in self._cache_dir.glob("*"):
             file_path.unlink()
 
 
+class BinaryCacheStore(CacheStore):
+    """Binary cache store.
+
+    This cache store persists the embeddings between runs by appending them, as raw float32
+    (or float16) vectors, to a single data file which is memory mapped for reading. It is
+    much more compact than the `filesystem` store and does not need a file per entry.
+
+    Each record of the data file is made of a header (the length of the key and the size of
+    the vector), the key and the vector. The key-to-offset index is kept in memory and rebuilt
+    from the record headers when the store is opened. The data file can be shared by several
+    processes: a record which is not fully written yet is skipped until it is complete. A record
+    which was not fully written because a process crashed while appending is discarded when the
+    store is opened, while no other store is appending (using a lock file, where supported).
+    When a key is set again, the new record is appended and the previous one becomes garbage,
+    until `compact` is called. `compact` and `clear` replace the data file, which the other
+    stores detect and then index the new file from the start.
+
+    Only lists of floats can be stored.
+
+    Args:
+        cache_dir (str, optional): The directory of the data file. Defaults to ".cache/embeddings".
+        dtype (str, optional): The type used to store the vectors, "float32" or "float16". Defaults to "float32".
+
+    Example:
+        >>> cache_store = BinaryCacheStore(cache_dir='.cache/embeddings')
+        >>> cache_store.set('key', [0.5, 0.25])
+        >>> print(cache_store.get('key'))
+        [0.5, 0.25]
+    """
+
+    name = "binary"
+
+    _magic = b"NGEMB\x01"
+    _record_header = struct.Struct("<HI")
+
+    def __init__(self, cache_dir: str = None, dtype: str = "float32"):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported dtype for the binary cache store: {dtype}")
+
+        self._cache_dir = Path(cache_dir or ".cache/embeddings")
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        self._dtype = np.dtype(dtype).newbyteorder("<")
+        self._path = self._cache_dir / f"embeddings.{dtype}.bin"
+        self._lock_path = self._cache_dir / f"embeddings.{dtype}.lock"
+
+        # The key -> (offset of the vector, size of the vector) index.
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._scanned_size = 0
+        self._mmap: Optional[mmap.mmap] = None
+        # The (device, inode) of the mapped data file, to detect when it is replaced.
+        self._file_id: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+        # The incomplete records can only be discarded while no other store appends.
+        with self._lock, self._file_lock(exclusive=True) as locked:
+            self._init_data_file()
+            self._scan(repair=locked)
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """Locks the data file against the stores of the other processes.
+
+        The appends take a shared lock, and the operations which discard or rewrite records
+        take an exclusive lock. Yields False if file locking is not supported.
+        """
+        if fcntl is None:
+            yield False
+            return
+
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(
+                lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+            )
+            yield True
+
+    def _init_data_file(self):
+        if not self._path.exists() or self._path.stat().st_size < len(self._magic):
+            with open(self._path, "wb") as file:
+                file.write(self._magic)
+        else:
+            with open(self._path, "rb") as file:
+                if file.read(len(self._magic)) != self._magic:
+                    raise ValueError(f"{self._path} is not a binary embeddings cache.")
+
+        self._scanned_size = len(self._magic)
+
+    def _close_mmap(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _remap(self):
+        self._close_mmap()
+
+        with open(self._path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._file_id = (stat.st_dev, stat.st_ino)
+
+    def _scan(self, repair: bool = False):
+        """Indexes the records appended since the last scan, e.g., by other processes.
+
+        Args:
+            repair: Whether to discard the incomplete records at the end of the data file.
+                This must only be done while no other store appends to it.
+        """
+        stat = self._path.stat()
+        if (stat.st_dev, stat.st_ino) != self._file_id or (
+            stat.st_size < self._scanned_size
+        ):
+            # The data file was cleared or compacted by another store, so we start over.
+            self._index = {}
+            self._scanned_size = len(self._magic)
+        elif stat.st_size == self._scanned_size:
+            return
+
+        self._remap()
+        data = self._mmap
+        size = len(data)
+        offset = self._scanned_size
+        while offset + self._record_header.size <= size:
+            key_size, vector_size = self._record_header.unpack_from(data, offset)
+            key_offset = offset + self._record_header.size
+            vector_offset = key_offset + key_size
+            end = vector_offset + vector_size * self._dtype.itemsize
+
+            # An empty key or a truncated record means that the append did not complete.
+            if key_size == 0 or end > size:
+                break
+
+            key = data[key_offset:vector_offset].decode("utf-8")
+            self._index[key] = (vector_offset, vector_size)
+            offset = end
+
+        # Otherwise, the incomplete record may still be written by another process, so the
+        # next scan starts again from it.
+        if repair and offset < size:
+            log.warning(
+                f"Discarding {size - offset} bytes of incomplete records in {self._path}."
+            )
+            self._close_mmap()
+            os.truncate(self._path, offset)
+            self._remap()
+
+        self._scanned_size = offset
+
+    def _encode_records(self, keys: List[str], values: List[List[float]]) -> bytes:
+        chunks = []
+        for key, value in zip(keys, values):
+            key_bytes = str(key).encode("utf-8")
+            vector = np.asarray(value, dtype=self._dtype)
+            chunks.append(self._record_header.pack(len(key_bytes), len(vector)))
+            chunks.append(key_bytes)
+            chunks.append(vector.tobytes())
+
+        return b"".join(chunks)
+
+    def _replace_data_file(self, records: bytes):
+        """Atomically replaces the data file with a new one, containing the given records."""
+        tmp_path = self._path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as file:
+            file.write(self._magic)
+            file.write(records)
+            file.flush()
+            os.fsync(file.fileno())
+
+        self._close_mmap()
+        os.replace(tmp_path, self._path)
+
+        self._index = {}
+        self._scanned_size = len(self._magic)
+        self._scan()
+
+    def get(self, key):
+        return self.mget([key])[0]
+
+    def set(self, key, value):
+        self.mset([key], [value])
+
+    def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        with self._lock:
+            # This only costs a `stat` of the data file, if it did not change.
+            self._scan()
+
+            values = []
+            for key in keys:
+                location = self._index.get(str(key))
+                if location is None:
+                    values.append(None)
+                else:
+                    offset, size = location
+                    vector = np.frombuffer(
+                        self._mmap, dtype=self._dtype, count=size, offset=offset
+                    )
+                    values.append(vector.tolist())
+
+            return values
+
+    def mset(self, keys: List[str], values: List[Any]):
+        if not keys:
+            return
+
+        records = self._encode_records(keys, values)
+        with self._lock:
+            # A single append, so that a crash leaves at most one incomplete record at the end.
+            with self._file_lock(exclusive=False):
+                with open(self._path, "ab") as file:
+                    file.write(records)
+                    file.flush()
+                    os.fsync(file.fileno())
+
+            self._scan()
+
+    def compact(self):
+        """Rewrites the data file with only the latest record of each key.
+
+        The new data file is written next to the current one and atomically replaces it.
+        """
+        with self._lock, self._file_lock(exclusive=True):
+            self._scan()
+            keys = list(self._index.keys())
+            values = [
+                np.frombuffer(self._mmap, dtype=self._dtype, count=size, offset=offset)
+                for offset, size in self._index.values()
+            ]
+
+            records = self._encode_records(keys, values)
+            # The views on the memory map must be released before it is closed.
+            del values
+
+            self._replace_data_file(records)
+
+    def clear(self):
+        with self._lock, self._file_lock(exclusive=True):
+            self._replace_data_file(b"")
+
+
 class RedisCacheStore(CacheStore):
     """Redis cache store.
 
     This cache store keeps the cache in a Redis database. It can be used to share the cache between multiple machines.
+    The values are stored as JSON, under keys prefixed with `key_prefix`, so that `clear` only deletes
+    the keys of the cache and not the rest of the database.
+
+    The synchronous operations use a connection pool and the asynchronous ones use a `redis.asyncio`
+    client, with its own connection pool, created on the first use in each event loop.
 
     Args:
-        redis_client (redis.Redis, optional): The Redis client to use. If not provided, a new client will be created.
+        host (str, optional): The host of the Redis server. Defaults to "localhost".
+        port (int, optional): The port of the Redis server. Defaults to 6379.
+        db (int, optional): The Redis database. Defaults to 0.
+        key_prefix (str, optional): The prefix of the keys. Defaults to "nemoguardrails:embeddings:".
 
     Example:
-        >>> redis_client = redis.Redis(host='localhost', port=6379, db=0)
-        >>> cache_store = RedisCacheStore(redis_client=redis_client)
+        >>> cache_store = RedisCacheStore(host='localhost', port=6379, db=0)
         >>> cache_store.set('key', 'value')
         >>> print(cache_store.get('key'))
         value
@@ -180,19 +500,95 @@ class RedisCacheStore(CacheStore):
 
     name = "redis"
 
-    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0):
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        key_prefix: str = "nemoguardrails:embeddings:",
+    ):
         import redis
 
-        self._redis = redis.Redis(host=host, port=port, db=db)
+        self._connection_kwargs = {"host": host, "port": port, "db": db}
+        self._key_prefix = key_prefix
+        self._redis = redis.Redis(
+            connection_pool=redis.ConnectionPool(**self._connection_kwargs)
+        )
+
+        # An async client is bound to the event loop where it is used, so we keep one
+        # per event loop, which is dropped with the event loop.
+        self._async_redis_clients = weakref.WeakKeyDictionary()
+
+    def _get_async_redis(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_redis_clients.get(loop)
+        if client is None:
+            import redis.asyncio
+
+            client = redis.asyncio.Redis(**self._connection_kwargs)
+            self._async_redis_clients[loop] = client
+
+        return client
+
+    def _key(self, key: str) -> str:
+        return f"{self._key_prefix}{key}"
+
+    def _keys_pattern(self) -> str:
+        # The glob special characters in the prefix must be escaped.
+        return re.sub(r"([*?\[\]\\])", r"\\\1", self._key_prefix) + "*"
 
     def get(self, key):
-        return self._redis.get(key)
+        value = self._redis.get(self._key(key))
+        return json.loads(value) if value is not None else None
 
     def set(self, key, value):
-        self._redis.set(key, value)
+        self._redis.set(self._key(key), json.dumps(value))
+
+    def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        if not keys:
+            return []
+
+        return [
+            json.loads(value) if value is not None else None
+            for value in self._redis.mget([self._key(key) for key in keys])
+        ]
+
+    def mset(self, keys: List[str], values: List[Any]):
+        if not keys:
+            return
+
+        self._redis.mset(
+            {self._key(key): json.dumps(value) for key, value in zip(keys, values)}
+        )
 
     def clear(self):
-        self._redis.flushall()
+        keys = list(self._redis.scan_iter(match=self._keys_pattern(), count=1000))
+        for i in range(0, len(keys), 1000):
+            self._redis.delete(*keys[i : i + 1000])
+
+    async def mget_async(self, keys: List[str]) -> List[Optional[Any]]:
+        if not keys:
+            return []
+
+        values = await self._get_async_redis().mget([self._key(key) for key in keys])
+        return [json.loads(value) if value is not None else None for value in values]
+
+    async def mset_async(self, keys: List[str], values: List[Any]):
+        if not keys:
+            return
+
+        await self._get_async_redis().mset(
+            {self._key(key): json.dumps(value) for key, value in zip(keys, values)}
+        )
+
+    async def clear_async(self):
+        client = self._get_async_redis()
+        keys = [
+            key
+            async for key in client.scan_iter(match=self._keys_pattern(), count=1000)
+        ]
+        for i in range(0, len(keys), 1000):
+            await client.delete(*keys[i : i + 1000])
 
 
 class EmbeddingsCache:
@@ -212,7 +608,11 @@ class EmbeddingsCache:
         store_config = d.get("store_config")
         cache_store = CacheStore.from_name(d.get("store"))(**store_config)
 
-        return cls(key_generator=key_generator, cache_store=cache_store)
+        return cls(
+            key_generator=key_generator,
+            cache_store=cache_store,
+            store_config=store_config,
+        )
 
     @classmethod
     def from_config(cls, config: EmbeddingsCacheConfig):
@@ -241,18 +641,37 @@ class EmbeddingsCache:
 
     @get.register
     def _(self, texts: list):
-        cached = {}
+        unique_texts, keys = self._get_unique_keys(texts)
+        return self._get_cached(unique_texts, self._cache_store.mget(keys))
+
+    def _get_unique_keys(self, texts: List[str]):
+        # We fetch all the values at once, without duplicates.
+        unique_texts = list(dict.fromkeys(texts))
+        keys = [self._key_generator.generate_key(text) for text in unique_texts]
+        log.info(f"Fetching {len(keys)} keys from cache")
 
-        for text in texts:
-            result = self.get(text)
+        return unique_texts, keys
+
+    @staticmethod
+    def _get_cached(unique_texts: List[str], results: List[Any]):
+        cached = {}
+        for text, result in zip(unique_texts, results):
             if result is not None:
                 cached[text] = result
 
-        if len(cached) != len(texts):
-            log.info(f"Cache hit rate: {len(cached) / len(texts)}")
+        # The hit rate is computed over the unique texts.
+        if len(cached) != len(unique_texts):
+            log.info(f"Cache hit rate: {len(cached) / len(unique_texts)}")
 
         return cached
 
+    async def get_async(self, texts: List[str]) -> Dict[str, List[float]]:
+        """Get the cached embeddings for a list of texts, without blocking the event loop."""
+        unique_texts, keys = self._get_unique_keys(texts)
+        results = await self._cache_store.mget_async(keys)
+
+        return self._get_cached(unique_texts, results)
+
     @singledispatchmethod
     def set(self, texts):
         raise NotImplementedError
@@ -265,18 +684,43 @@ class EmbeddingsCache:
 
     @set.register
     def _(self, texts: list, values: List[List[float]]):
-        for text, value in zip(texts, values):
-            self.set(text, value)
+        keys = [self._key_generator.generate_key(text) for text in texts]
+        log.info(f"Storing {len(keys)} keys in cache")
+        self._cache_store.mset(keys, values)
+
+    async def set_async(self, texts: List[str], values: List[List[float]]):
+        """Store the embeddings for a list of texts, without blocking the event loop."""
+        keys = [self._key_generator.generate_key(text) for text in texts]
+        log.info(f"Storing {len(keys)} keys in cache")
+        await self._cache_store.mset_async(keys, values)
 
     def clear(self):
         self._cache_store.clear()
 
+    async def clear_async(self):
+        await self._cache_store.clear_async()
+
+
+def _get_embeddings_cache(obj) -> EmbeddingsCache:
+    """Get the embeddings cache of an object, creating it on the first use.
+
+    The cache is held by the object, so that the store, e.g., the Redis connection pool,
+    is created once and reused by all the calls.
+    """
+    embeddings_cache = getattr(obj, "_embeddings_cache", None)
+    if embeddings_cache is None:
+        embeddings_cache = EmbeddingsCache.from_config(obj.cache_config)
+        obj._embeddings_cache = embeddings_cache
+
+    return embeddings_cache
+
 
 def cache_embeddings(func):
     """Decorator to cache the embeddings.
 
     This decorator caches the embeddings in the cache store.
-    It uses the `cache_config` attribute of the class to configure the cache.
+    It uses the `cache_config` attribute of the class to configure the cache, which is created
+    on the first call and stored in the `_embeddings_cache` attribute of the instance.
 
     If the class does not have a `cache_config` attribute, it will use the `EmbeddingsCacheConfig` by default.
     This decorator can be applied to the `_get_embeddings` method of a subclass of `EmbeddingsIndex` that accepts a list of strings and returns a list of lists of floats.
@@ -300,26 +744,23 @@ def cache_embeddings(func):
 
     @functools.wraps(func)
     async def wrapper_decorator(self, texts):
-        results = []
-
-        embeddings_cache = EmbeddingsCache.from_config(self.cache_config)
-
         if not self.cache_config.enabled:
             # if cache is not enabled compute embeddings for the whole input
             return await func(self, texts)
 
-        cached_texts = {}
-        uncached_texts = []
+        embeddings_cache = _get_embeddings_cache(self)
 
-        cached_texts = embeddings_cache.get(texts)
-        uncached_texts = [text for text in texts if text not in cached_texts]
+        cached_texts = await embeddings_cache.get_async(texts)
+        uncached_texts = list(
+            dict.fromkeys(text for text in texts if text not in cached_texts)
+        )
 
         # Only call func for uncached texts
         if uncached_texts:
             uncached_results = await func(self, uncached_texts)
-            embeddings_cache.set(uncached_texts, uncached_results)
+            await embeddings_cache.set_async(uncached_texts, uncached_results)
+            cached_texts.update(zip(uncached_texts, uncached_results))
 
-        cached_texts.update(embeddings_cache.get(uncached_texts))
         # Reorder results to match the order of the input texts,
         results = [cached_texts.get(text) for text in texts]
         return results
@@ -0,0 +1,147 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Classification of the user intents using the centroids of their examples.
+
+Instead of searching the closest examples, each intent is represented by one or more
+centroids of the embeddings of its examples, so a query is scored against all the
+intents with a single matrix-vector product, whatever the number of examples, and the
+intents with many examples do not outweigh the others.
+"""
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from nemoguardrails.embeddings.basic import normalize_rows
+
+# The softmax temperatures tried when calibrating the scores.
+CALIBRATION_TEMPERATURES = [0.01, 0.02, 0.03, 0.05, 0.075, 0.1, 0.2, 0.5]
+
+
+def _kmeans(vectors: np.ndarray, k: int, num_iterations: int = 10) -> np.ndarray:
+    """Spherical k-means, initialized deterministically with the farthest points."""
+    centroids = [vectors[0]]
+    for _ in range(1, k):
+        similarities = vectors @ np.asarray(centroids).T
+        centroids.append(vectors[np.argmin(similarities.max(axis=1))])
+    centroids = np.asarray(centroids)
+
+    for _ in range(num_iterations):
+        labels = np.argmax(vectors @ centroids.T, axis=1)
+        for j in range(k):
+            if np.any(labels == j):
+                centroids[j] = vectors[labels == j].mean(axis=0)
+        centroids = normalize_rows(centroids)
+
+    return centroids
+
+
+def _softmax(scores: np.ndarray, temperature: float) -> np.ndarray:
+    scores = scores / temperature
+    scores = np.exp(scores - scores.max(axis=-1, keepdims=True))
+    return scores / scores.sum(axis=-1, keepdims=True)
+
+
+class IntentCentroidClassifier:
+    """Scores the user intents using the centroids of the embeddings of their examples.
+
+    The score of an intent is the cosine similarity with its closest centroid. The
+    scores of all the intents are turned into probabilities with a softmax, whose
+    temperature is calibrated on the examples, i.e., chosen to minimize their negative
+    log-likelihood.
+
+    Args:
+        centroids_per_intent: The maximum number of centroids per intent. The examples
+            of an intent are clustered using k-means if it is larger than 1.
+    """
+
+    def __init__(self, centroids_per_intent: int = 1):
+        self.centroids_per_intent = centroids_per_intent
+        self.intents: List[str] = []
+        self.temperature = CALIBRATION_TEMPERATURES[0]
+
+        # The centroids, sorted by intent, and the first row of each intent.
+        self._centroids = np.zeros((0, 0), dtype=np.float32)
+        self._offsets = np.zeros(0, dtype=np.int64)
+
+    def fit(
+        self, intents: Sequence[str], embeddings: Sequence[Sequence[float]]
+    ) -> "IntentCentroidClassifier":
+        """Computes the centroids of the intents, and calibrates the scores.
+
+        Args:
+            intents: The intent of each example.
+            embeddings: The embedding of each example.
+        """
+        vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+
+        intent_ids = {intent: i for i, intent in enumerate(dict.fromkeys(intents))}
+        self.intents = list(intent_ids)
+        labels = np.asarray([intent_ids[intent] for intent in intents])
+
+        centroids, offsets = [], []
+        for i in range(len(self.intents)):
+            intent_vectors = vectors[labels == i]
+            k = min(self.centroids_per_intent, len(intent_vectors))
+            offsets.append(sum(len(c) for c in centroids))
+            if k == 1:
+                centroids.append(normalize_rows(intent_vectors.mean(axis=0)[None]))
+            else:
+                centroids.append(_kmeans(intent_vectors, k))
+
+        self._centroids = np.ascontiguousarray(np.concatenate(centroids))
+        self._offsets = np.asarray(offsets)
+
+        self._calibrate(vectors, labels)
+
+        return self
+
+    def _calibrate(self, vectors: np.ndarray, labels: np.ndarray):
+        """Chooses the softmax temperature minimizing the NLL of the examples."""
+        scores = self._score(vectors)
+        best_nll = None
+        for temperature in CALIBRATION_TEMPERATURES:
+            probabilities = _softmax(scores, temperature)
+            nll = -np.mean(
+                np.log(probabilities[np.arange(len(labels)), labels] + 1e-12)
+            )
+            if best_nll is None or nll < best_nll:
+                best_nll, self.temperature = nll, temperature
+
+    def _score(self, vectors: np.ndarray) -> np.ndarray:
+        """The cosine similarity of each vector with the closest centroid of each intent."""
+        similarities = vectors @ self._centroids.T
+        return np.maximum.reduceat(similarities, self._offsets, axis=-1)
+
+    def classify(
+        self, embedding: Sequence[float], max_results: int = 5
+    ) -> List[Tuple[str, float]]:
+        """Scores the intents for a query.
+
+        Args:
+            embedding: The embedding of the query.
+            max_results: The maximum number of intents to return.
+
+        Returns:
+            The most likely intents and their probabilities, in decreasing order.
+        """
+        if not self.intents:
+            return []
+
+        vector = normalize_rows(np.asarray(embedding, dtype=np.float32)[None])
+        probabilities = _softmax(self._score(vector), self.temperature)[0]
+        results = np.argsort(-probabilities, kind="stable")[:max_results]
+
+        return [(self.intents[i], float(probabilities[i])) for i in results]
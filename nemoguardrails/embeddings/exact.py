@@ -0,0 +1,93 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import uuid
+from typing import List, Tuple
+
+import numpy as np
+
+from nemoguardrails.embeddings.basic import BasicEmbeddingsIndex, normalize_rows
+
+
+class ExactEmbeddingsIndex(BasicEmbeddingsIndex):
+    """Embeddings index performing an exact search.
+
+    The embeddings are stored in a contiguous float32 matrix with normalized rows,
+    and a search is a single matrix-vector product. For the small indexes, e.g., the
+    user messages, bot messages and flows, this is faster to build and to search
+    than an Annoy index, and the results are exact.
+
+    The embeddings are computed in the same way as for `BasicEmbeddingsIndex`,
+    including the caching and the batching.
+    """
+
+    def _build_index(self, size: int, positions: List[int], vectors: List[List[float]]):
+        """Builds the matrix of normalized embeddings, with zero rows for removed items."""
+        index = np.zeros((size, len(vectors[0])), dtype=np.float32)
+        index[positions] = normalize_rows(np.asarray(vectors, dtype=np.float32))
+
+        return index, None
+
+    def _get_index_size(self, index) -> int:
+        return len(index)
+
+    def _get_indexed_vector(self, i: int) -> List[float]:
+        return self._index[i].tolist()
+
+    def _search_index(
+        self, embedding: List[float], max_results: int
+    ) -> List[Tuple[int, float]]:
+        scores = self._index @ normalize_rows(np.asarray(embedding, dtype=np.float32))
+
+        if max_results < len(scores):
+            # We select the top results in linear time, and sort only those.
+            results = np.argpartition(-scores, max_results - 1)[:max_results]
+        else:
+            results = np.arange(len(scores))
+        results = results[np.argsort(-scores[results], kind="stable")]
+
+        return [(int(i), float(scores[i])) for i in results]
+
+    async def save(self, path: str):
+        """Saves the built index, so that it can be loaded later using `load`.
+
+        Args:
+            path (str): The path of the index, without the extension.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+
+        with open(tmp_path, "wb") as f:
+            np.save(f, self._index)
+        os.replace(tmp_path, f"{path}.npy")
+
+    async def load(self, path: str) -> bool:
+        """Loads an index saved using `save`, as a memory mapped matrix.
+
+        Args:
+            path (str): The path of the index, without the extension.
+
+        Returns:
+            bool: Whether the index was found.
+        """
+        if not os.path.exists(f"{path}.npy"):
+            return False
+
+        index = np.load(f"{path}.npy", mmap_mode="r")
+        self._embedding_size = index.shape[1]
+        self._set_index(index, len(index))
+
+        return True
@@ -14,7 +14,7 @@
 # limitations under the License.
 
 from dataclasses import dataclass, field
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 
 @dataclass
@@ -33,8 +33,13 @@ class EmbeddingsIndex:
     Methods:
         add_item(item: IndexItem) -> None: Adds a new item to the index.
         add_items(items: List[IndexItem]) -> None: Adds multiple items to the index.
+        remove_item(item: IndexItem) -> int: Removes an item from the index.
+        remove_items(items: List[IndexItem]) -> int: Removes multiple items from the index.
+        get_embeddings(texts: List[str]) -> List[List[float]]: Computes the embeddings of the texts.
         build() -> None: Builds the index after the items are added. This is optional and might not be needed for all implementations.
         search(text: str, max_results: int) -> List[IndexItem]: Searches the index for the closest matches to the provided text.
+        search_with_scores(text: str, max_results: int) -> List[Tuple[IndexItem, Optional[float]]]: Searches the index
+            for the closest matches to the provided text, along with their similarity scores.
     """
 
     @property
@@ -48,6 +53,10 @@ class EmbeddingsIndex:
     async def _get_embeddings(self, texts: List[str]):
         raise NotImplementedError
 
+    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Computes the embeddings of the texts, using the model of the index."""
+        return await self._get_embeddings(texts)
+
     async def add_item(self, item: IndexItem):
         """Adds a new item to the index."""
         raise NotImplementedError()
@@ -56,6 +65,14 @@ class EmbeddingsIndex:
         """Adds multiple items to the index."""
         raise NotImplementedError()
 
+    async def remove_item(self, item: IndexItem) -> int:
+        """Removes an item from the index, returning the number of removed items."""
+        raise NotImplementedError()
+
+    async def remove_items(self, items: List[IndexItem]) -> int:
+        """Removes multiple items from the index, returning the number of removed items."""
+        raise NotImplementedError()
+
     async def build(self):
         """Build the index, after the items are added.
 
@@ -65,3 +82,15 @@ class EmbeddingsIndex:
     async def search(self, text: str, max_results: int) -> List[IndexItem]:
         """Searches the index for the closest matches to the provided text."""
         raise NotImplementedError()
+
+    async def search_with_scores(
+        self, text: str, max_results: int
+    ) -> List[Tuple[IndexItem, Optional[float]]]:
+        """Searches the index for the closest matches to the provided text, along with
+        their similarity scores, in decreasing order of similarity.
+
+        The scores are the cosine similarities for the built-in indexes. The default
+        implementation relies on `search` and returns None scores, for the indexes which
+        do not compute them.
+        """
+        return [(item, None) for item in await self.search(text, max_results)]
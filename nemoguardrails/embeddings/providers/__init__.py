@@ -16,15 +16,20 @@
 
 from __future__ import annotations
 
-from typing import Optional, Type
+import inspect
+import json
+import logging
+from typing import Any, Dict, Optional, Type
 
 from . import fastembed, nim, openai, sentence_transformers
 from .base import EmbeddingModel
 from .registry import EmbeddingProviderRegistry
 
+log = logging.getLogger(__name__)
+
 # This is the executor that will be used for computing the embeddings.
-# Currently, we leave this as None, to use the default executor from asyncio.
-# In the future, we might want to customize.
+# When None, the default executor from asyncio is used. It can be customized
+# using `core.embeddings_executor` in the config (see `executor.py`).
 
 embeddings_executor = None
 
@@ -70,12 +75,46 @@ register_embedding_provider(nim.NIMEmbeddingModel)
 register_embedding_provider(nim.NVIDIAAIEndpointsEmbeddingModel)
 
 
-def init_embedding_model(embedding_model: str, embedding_engine: str) -> EmbeddingModel:
+def _get_supported_params(
+    model_cls: Type[EmbeddingModel], embedding_params: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Get the parameters declared by the constructor of an embedding model.
+
+    The parameters are all passed if the constructor accepts `**kwargs`. Otherwise,
+    the ones it does not declare are ignored, with a warning.
+    """
+    parameters = inspect.signature(model_cls.__init__).parameters
+    if any(p.kind == inspect.Parameter.VAR_KEYWORD for p in parameters.values()):
+        return embedding_params
+
+    supported_params = {
+        k: v
+        for k, v in embedding_params.items()
+        if k in parameters and k not in ["self", "embedding_model"]
+    }
+    ignored_params = sorted(set(embedding_params) - set(supported_params))
+    if ignored_params:
+        log.warning(
+            f"The parameters {ignored_params} are not supported by "
+            f"{model_cls.__name__} and are ignored."
+        )
+
+    return supported_params
+
+
+def init_embedding_model(
+    embedding_model: str,
+    embedding_engine: str,
+    embedding_params: Optional[Dict[str, Any]] = None,
+) -> EmbeddingModel:
     """Initialize the embedding model.
 
     Args:
         embedding_model (str): The path or name of the embedding model.
         embedding_engine (str): The name of the embedding engine.
+        embedding_params (Dict[str, Any], optional): The additional parameters of the
+            embedding model, e.g., the `api_key`, passed as keyword arguments. The ones
+            the embedding model does not declare are ignored.
 
     Returns:
         EmbeddingModel: An instance of the initialized embedding model.
@@ -83,11 +122,16 @@ def init_embedding_model(embedding_model: str, embedding_engine: str) -> Embeddi
     Raises:
         ValueError: If the embedding engine is invalid.
     """
-
+    embedding_params = embedding_params or {}
     model_key = f"{embedding_engine}-{embedding_model}"
+    if embedding_params:
+        model_key += f"-{json.dumps(embedding_params, sort_keys=True, default=str)}"
 
     if model_key not in _embedding_model_cache:
-        model = EmbeddingProviderRegistry().get(embedding_engine)(embedding_model)
+        model_cls = EmbeddingProviderRegistry().get(embedding_engine)
+        model = model_cls(
+            embedding_model, **_get_supported_params(model_cls, embedding_params)
+        )
         _embedding_model_cache[model_key] = model
 
     return _embedding_model_cache[model_key]
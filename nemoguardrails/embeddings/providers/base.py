@@ -48,3 +48,10 @@ class EmbeddingModel(ABC):
             List[List[float]]: The list of embeddings corresponding to the input documents.
         """
         raise NotImplementedError()
+
+    def load(self):
+        """Load the model, if it is loaded lazily.
+
+        The local models are only loaded when they are first used, so that a process
+        which computes the embeddings in a process pool does not load them itself.
+        """
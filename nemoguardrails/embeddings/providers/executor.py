@@ -0,0 +1,198 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""The executor used to compute the embeddings of the local (CPU) models.
+
+By default, the default executor of asyncio is used. Using `core.embeddings_executor`
+in `config.yml`, a dedicated thread pool or process pool can be used instead, so that
+the computation of the embeddings does not compete with the other users of the default
+executor.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Type
+
+from nemoguardrails.rails.llm.config import EmbeddingsExecutorConfig
+
+from .base import EmbeddingModel
+
+log = logging.getLogger(__name__)
+
+# The number of intra-op threads of the models, if pinned.
+_num_threads: Optional[int] = None
+
+# The configuration of the current executor, if any.
+_executor_config: Optional[EmbeddingsExecutorConfig] = None
+
+# The models loaded in a worker process, by class and name.
+_worker_models: Dict[Tuple[Type[EmbeddingModel], str], EmbeddingModel] = {}
+
+
+def get_num_threads() -> Optional[int]:
+    """Get the number of intra-op threads the models should use, if pinned."""
+    return _num_threads
+
+
+def set_num_threads(num_threads: Optional[int]):
+    """Pin the number of intra-op threads of the models.
+
+    It applies to the models created afterwards and, for PyTorch, to the whole process.
+    """
+    global _num_threads
+    _num_threads = num_threads
+
+    if num_threads:
+        os.environ["OMP_NUM_THREADS"] = str(num_threads)
+
+        # PyTorch is only configured if it is already used.
+        if "torch" in sys.modules:
+            sys.modules["torch"].set_num_threads(num_threads)
+
+
+def _get_worker_model(
+    model_cls: Type[EmbeddingModel], embedding_model: str
+) -> EmbeddingModel:
+    key = (model_cls, embedding_model)
+    if key not in _worker_models:
+        model = model_cls(embedding_model)
+        model.load()
+        _worker_models[key] = model
+
+    return _worker_models[key]
+
+
+def _init_worker(
+    num_threads: Optional[int], models: List[Tuple[Type[EmbeddingModel], str]]
+):
+    """Initializes a worker process, loading the models in advance."""
+    set_num_threads(num_threads)
+
+    for model_cls, embedding_model in models:
+        try:
+            _get_worker_model(model_cls, embedding_model)
+        except Exception as ex:
+            log.warning(f"Could not preload the embedding model {embedding_model}.")
+            log.debug(ex, exc_info=True)
+
+
+def _encode_in_worker(
+    model_cls: Type[EmbeddingModel], embedding_model: str, documents: List[str]
+) -> List[List[float]]:
+    return _get_worker_model(model_cls, embedding_model).encode(documents)
+
+
+def create_embeddings_executor(
+    config: EmbeddingsExecutorConfig,
+    models: Optional[List[Tuple[Type[EmbeddingModel], str]]] = None,
+) -> Optional[Executor]:
+    """Create the executor for computing the embeddings.
+
+    Args:
+        config: The configuration of the executor.
+        models: The (model class, model name) pairs to preload in the worker processes.
+
+    Returns:
+        The executor, or None to use the default executor of asyncio.
+    """
+    if config.type == "default":
+        return None
+    elif config.type == "thread":
+        return ThreadPoolExecutor(
+            max_workers=config.max_workers, thread_name_prefix="embeddings"
+        )
+    elif config.type == "process":
+        # The worker processes are spawned, as forking a process which already uses
+        # PyTorch or ONNX Runtime threads is not safe.
+        return ProcessPoolExecutor(
+            max_workers=config.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(config.num_threads, models or []),
+        )
+    else:
+        raise ValueError(f"Unknown embeddings executor type: {config.type}")
+
+
+def set_embeddings_executor(executor: Optional[Executor]):
+    """Set the executor used for computing the embeddings."""
+    from nemoguardrails.embeddings import providers
+
+    providers.embeddings_executor = executor
+
+
+def get_embeddings_executor() -> Optional[Executor]:
+    """Get the executor used for computing the embeddings."""
+    from . import embeddings_executor
+
+    return embeddings_executor
+
+
+def configure_embeddings_executor(
+    config: EmbeddingsExecutorConfig,
+    models: Optional[List[Tuple[Type[EmbeddingModel], str]]] = None,
+):
+    """Configure the process-wide executor for computing the embeddings.
+
+    The executor is shared by all the configurations, so only the first configuration
+    which is not `default` is used.
+
+    Args:
+        config: The configuration of the executor.
+        models: The (model class, model name) pairs to preload in the worker processes.
+    """
+    global _executor_config
+
+    if config.type == "default" and config.num_threads is None:
+        return
+
+    if _executor_config is not None:
+        if config != _executor_config:
+            log.warning(
+                "The embeddings executor is already configured, "
+                f"ignoring the configuration {config}."
+            )
+        return
+
+    _executor_config = config
+    set_num_threads(config.num_threads)
+    set_embeddings_executor(create_embeddings_executor(config, models))
+
+
+async def encode_in_executor(
+    model: EmbeddingModel, documents: List[str]
+) -> List[List[float]]:
+    """Compute the embeddings with `model.encode` in the embeddings executor.
+
+    With a process pool, the model is loaded in each worker process, using the class and
+    the `embedding_model` name of the model. The models which are loaded lazily are then
+    not loaded in the current process.
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_embeddings_executor()
+
+    if isinstance(executor, ProcessPoolExecutor):
+        return await loop.run_in_executor(
+            executor,
+            _encode_in_worker,
+            type(model),
+            model.embedding_model,
+            documents,
+        )
+    else:
+        return await loop.run_in_executor(executor, model.encode, documents)
@@ -13,16 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import asyncio
+import threading
+from functools import cached_property
 from typing import List
 
 from .base import EmbeddingModel
-
-
-def get_executor():
-    from . import embeddings_executor
-
-    return embeddings_executor
+from .executor import encode_in_executor, get_num_threads
 
 
 class FastEmbedEmbeddingModel(EmbeddingModel):
@@ -35,33 +31,63 @@ class FastEmbedEmbeddingModel(EmbeddingModel):
         embedding_model (str): The name or path of the pre-trained model.
 
     Attributes:
-        model: The model used for encoding sentences.
+        model: The model used for encoding sentences, loaded on the first use.
         embedding_size: The dimensionality of the sentence embeddings generated by the model.
     """
 
     engine_name = "FastEmbed"
 
     def __init__(self, embedding_model: str):
-        from fastembed import TextEmbedding as Embedding
+        # Fail early if FastEmbed is not installed.
+        import fastembed  # noqa: F401
 
-        # Enabling a short form model name for all-MiniLM-L6-v2.
-        if embedding_model == "all-MiniLM-L6-v2":
-            embedding_model = "sentence-transformers/all-MiniLM-L6-v2"
         self.embedding_model = embedding_model
+        self._model = None
+        self._lock = threading.Lock()
 
-        try:
-            self.model = Embedding(embedding_model)
-        except ValueError as ex:
-            # Sometimes the cached model in the temporary folder gets removed,
-            # but the folder still exists, which causes an error. In this case,
-            # we fall back to an explicit cache directory.
-            if "Could not find model.onnx in" in str(ex):
-                self.model = Embedding(embedding_model, cache_dir=".cache")
-            else:
-                raise ex
+    def load(self):
+        """Load the FastEmbed model, if not already loaded.
 
-        # Get the embedding dimension of the model
-        self.embedding_size = len(list(self.model.embed("test"))[0].tolist())
+        With a process pool executor, the model is only loaded in the worker processes.
+        """
+        with self._lock:
+            if self._model is not None:
+                return
+
+            from fastembed import TextEmbedding as Embedding
+
+            # Enabling a short form model name for all-MiniLM-L6-v2.
+            embedding_model = self.embedding_model
+            if embedding_model == "all-MiniLM-L6-v2":
+                embedding_model = "sentence-transformers/all-MiniLM-L6-v2"
+
+            # The number of intra-op threads of ONNX Runtime, if pinned.
+            kwargs = {"threads": get_num_threads()} if get_num_threads() else {}
+
+            try:
+                self._model = Embedding(embedding_model, **kwargs)
+            except ValueError as ex:
+                # Sometimes the cached model in the temporary folder gets removed,
+                # but the folder still exists, which causes an error. In this case,
+                # we fall back to an explicit cache directory.
+                if "Could not find model.onnx in" in str(ex):
+                    self._model = Embedding(
+                        embedding_model, cache_dir=".cache", **kwargs
+                    )
+                else:
+                    raise ex
+
+    @property
+    def model(self):
+        if self._model is None:
+            self.load()
+
+        return self._model
+
+    @cached_property
+    def embedding_size(self) -> int:
+        """The embedding dimension of the model."""
+        return len(list(self.model.embed("test"))[0].tolist())
 
     async def encode_async(self, documents: List[str]) -> List[List[float]]:
         """Encode a list of documents into their corresponding sentence embeddings.
@@ -72,11 +98,9 @@ class FastEmbedEmbeddingModel(EmbeddingModel):
         Returns:
             List[List[float]]: The list of sentence embeddings, where each embedding is a list of floats.
         """
-
-        loop = asyncio.get_running_loop()
-        result = await loop.run_in_executor(get_executor(), self.model.embed, documents)
-
-        return [x.tolist() for x in result]
+        # `embed` returns a generator, so `encode` is used to compute all the
+        # embeddings in the executor.
+        return await encode_in_executor(self, documents)
 
     def encode(self, documents: List[str]) -> List[List[float]]:
         """Encode a list of documents into their corresponding sentence embeddings.
@@ -13,9 +13,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 from typing import List
 
+import httpx
+
 from .base import EmbeddingModel
+from .remote import LoopScopedClient, encode_in_batches
+
+DEFAULT_BASE_URL = "https://integrate.api.nvidia.com/v1"
 
 
 class NIMEmbeddingModel(EmbeddingModel):
@@ -25,20 +31,26 @@ class NIMEmbeddingModel(EmbeddingModel):
 
     Args:
         embedding_model (str): The name embedding model to be used.
+        **kwargs: The additional parameters of `NVIDIAEmbeddings`, e.g., the `api_key`
+            and the `base_url`.
 
     Attributes:
         model: The name of the model to be called for creating embeddings.
         embedding_size: The dimensionality of the embeddings generated by the model.
+        max_batch_size: The maximum number of documents in a request.
+        max_concurrency: The maximum number of concurrent requests of `encode_async`.
     """
 
     engine_name = "nim"
+    max_batch_size = 50
+    max_concurrency = 8
 
-    def __init__(self, embedding_model: str):
+    def __init__(self, embedding_model: str, **kwargs):
         try:
             from langchain_nvidia_ai_endpoints import NVIDIAEmbeddings
 
             self.model = embedding_model
-            self.document_embedder = NVIDIAEmbeddings(model=embedding_model)
+            self.document_embedder = NVIDIAEmbeddings(model=embedding_model, **kwargs)
 
         except ImportError:
             raise ImportError(
@@ -46,6 +58,44 @@ class NIMEmbeddingModel(EmbeddingModel):
                 "`pip install langchain-nvidia-ai-endpoints`."
             )
 
+        # The async requests are made directly to the OpenAI-compatible API of the
+        # model, using a persistent connection pool.
+        self.base_url = (
+            kwargs.get("base_url")
+            or getattr(self.document_embedder, "base_url", None)
+            or os.environ.get("NVIDIA_BASE_URL")
+            or DEFAULT_BASE_URL
+        ).rstrip("/")
+        self.api_key = kwargs.get("api_key") or os.environ.get("NVIDIA_API_KEY")
+        self.async_client = LoopScopedClient(self._create_async_client)
+
+    def _create_async_client(self) -> httpx.AsyncClient:
+        headers = {"Accept": "application/json"}
+        api_key = self.api_key
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+
+        return httpx.AsyncClient(
+            headers=headers,
+            timeout=httpx.Timeout(60.0),
+            limits=httpx.Limits(max_connections=self.max_concurrency),
+        )
+
+    async def _encode_batch_async(self, documents: List[str]) -> List[List[float]]:
+        response = await self.async_client.get().post(
+            f"{self.base_url}/embeddings",
+            json={
+                "input": documents,
+                "model": self.model,
+                "input_type": "passage",
+                "encoding_format": "float",
+            },
+        )
+        response.raise_for_status()
+
+        data = sorted(response.json()["data"], key=lambda record: record["index"])
+        return [record["embedding"] for record in data]
+
     async def encode_async(self, documents: List[str]) -> List[List[float]]:
         """Encode a list of documents into their corresponding sentence embeddings.
 
@@ -55,9 +105,12 @@ class NIMEmbeddingModel(EmbeddingModel):
         Returns:
             List[List[float]]: The list of sentence embeddings, where each embedding is a list of floats.
         """
-
-        result = await self.document_embedder.aembed_documents(documents)
-        return result
+        return await encode_in_batches(
+            self._encode_batch_async,
+            documents,
+            max_batch_size=self.max_batch_size,
+            max_concurrency=self.max_concurrency,
+        )
 
     def encode(self, documents: List[str]) -> List[List[float]]:
         """Encode a list of documents into their corresponding sentence embeddings.
@@ -12,16 +12,10 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-import asyncio
-from contextvars import ContextVar
 from typing import List
 
 from .base import EmbeddingModel
-
-# We set the OpenAI async client in an asyncio context variable because we need it
-# to be scoped at the asyncio loop level. The client caches it somewhere, and if the loop
-# is changed, it will fail.
-async_client_var: ContextVar = ContextVar("async_client", default=None)
+from .remote import LoopScopedClient, encode_in_batches, split_documents
 
 
 class OpenAIEmbeddingModel(EmbeddingModel):
@@ -33,12 +27,16 @@ class OpenAIEmbeddingModel(EmbeddingModel):
     Attributes:
         model (str): The name of the embedding model.
         embedding_size (int): The size of the embeddings.
+        max_batch_size (int): The maximum number of documents in a request.
+        max_concurrency (int): The maximum number of concurrent requests of `encode_async`.
 
     Methods:
         encode: Encode a list of documents into embeddings.
     """
 
     engine_name = "openai"
+    max_batch_size = 2048
+    max_concurrency = 8
 
     def __init__(
         self,
@@ -60,6 +58,7 @@ class OpenAIEmbeddingModel(EmbeddingModel):
 
         self.model = embedding_model
         self.client = OpenAI()
+        self.async_client = LoopScopedClient(AsyncOpenAI)
 
         self.embedding_size_dict = {
             "text-embedding-ada-002": 1536,
@@ -83,24 +82,19 @@ class OpenAIEmbeddingModel(EmbeddingModel):
             List[List[float]]: The encoded embeddings.
 
         """
-        loop = asyncio.get_running_loop()
-        embeddings = await loop.run_in_executor(None, self.encode, documents)
-
-        # NOTE: The async implementation below has some edge cases because of
-        # httpx and async and returns "Event loop is closed." errors. Falling back to
-        # a thread-based implementation for now.
-
-        # # We do lazy initialization of the async client to make sure it's on the correct loop
-        # async_client = async_client_var.get()
-        # if async_client is None:
-        #     async_client = AsyncOpenAI()
-        #     async_client_var.set(async_client)
-        #
-        # # Make embedding request to OpenAI API
-        # res = await async_client.embeddings.create(input=documents, model=self.model)
-        # embeddings = [record.embedding for record in res.data]
-
-        return embeddings
+        return await encode_in_batches(
+            self._encode_batch_async,
+            documents,
+            max_batch_size=self.max_batch_size,
+            max_concurrency=self.max_concurrency,
+        )
+
+    async def _encode_batch_async(self, documents: List[str]) -> List[List[float]]:
+        # Make embedding request to OpenAI API
+        res = await self.async_client.get().embeddings.create(
+            input=documents, model=self.model
+        )
+        return [record.embedding for record in res.data]
 
     def encode(self, documents: List[str]) -> List[List[float]]:
         """Encode a list of documents into embeddings.
@@ -113,8 +107,10 @@ class OpenAIEmbeddingModel(EmbeddingModel):
 
         """
 
-        # Make embedding request to OpenAI API
-        res = self.client.embeddings.create(input=documents, model=self.model)
-        embeddings = [record.embedding for record in res.data]
+        embeddings = []
+        for batch in split_documents(documents, self.max_batch_size):
+            # Make embedding request to OpenAI API
+            res = self.client.embeddings.create(input=batch, model=self.model)
+            embeddings.extend(record.embedding for record in res.data)
 
         return embeddings
@@ -0,0 +1,86 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Helpers for the embedding models served by a remote API, e.g., OpenAI or NIM."""
+import asyncio
+import weakref
+from typing import Any, Awaitable, Callable, List
+
+
+def split_documents(documents: List[str], max_batch_size: int) -> List[List[str]]:
+    """Split a list of documents in batches of at most `max_batch_size` documents."""
+    return [
+        documents[i : i + max_batch_size]
+        for i in range(0, len(documents), max_batch_size)
+    ]
+
+
+async def encode_in_batches(
+    encode_batch: Callable[[List[str]], Awaitable[List[List[float]]]],
+    documents: List[str],
+    max_batch_size: int,
+    max_concurrency: int,
+) -> List[List[float]]:
+    """Encode a list of documents using concurrent requests of at most `max_batch_size` documents.
+
+    Args:
+        encode_batch: The function making a request for a batch of documents.
+        documents: The documents to encode.
+        max_batch_size: The maximum number of documents in a request.
+        max_concurrency: The maximum number of concurrent requests.
+
+    Returns:
+        The embeddings, in the same order as the documents.
+    """
+    batches = split_documents(documents, max_batch_size)
+    if len(batches) <= 1:
+        return await encode_batch(documents) if documents else []
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _encode_batch(batch: List[str]) -> List[List[float]]:
+        async with semaphore:
+            return await encode_batch(batch)
+
+    results = await asyncio.gather(*[_encode_batch(batch) for batch in batches])
+
+    return [embedding for result in results for embedding in result]
+
+
+class LoopScopedClient:
+    """Holds one async client per event loop.
+
+    Async HTTP clients keep a connection pool bound to the event loop where they were
+    created, so they can't be shared with other loops, e.g., the one used to build the
+    knowledge base in a separate thread. The clients are reused for all the requests made
+    from the same loop, and dropped with it.
+
+    Args:
+        factory: The function creating a new client.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._clients = weakref.WeakKeyDictionary()
+
+    def get(self) -> Any:
+        """Get the client for the running event loop, creating it if needed."""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._factory()
+            self._clients[loop] = client
+
+        return client
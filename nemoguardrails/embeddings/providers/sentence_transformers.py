@@ -13,16 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import asyncio
+import threading
+from functools import cached_property
 from typing import List
 
 from .base import EmbeddingModel
-
-
-def get_executor():
-    from . import embeddings_executor
-
-    return embeddings_executor
+from .executor import encode_in_executor, get_num_threads, set_num_threads
 
 
 class SentenceTransformerEmbeddingModel(EmbeddingModel):
@@ -35,7 +31,7 @@ class SentenceTransformerEmbeddingModel(EmbeddingModel):
         embedding_model (str): The name or path of the pre-trained sentence-transformers model.
 
     Attributes:
-        model: The sentence-transformers model used for encoding sentences.
+        model: The sentence-transformers model used for encoding sentences, loaded on the first use.
         embedding_size: The dimensionality of the sentence embeddings generated by the model.
     """
 
@@ -43,7 +39,7 @@ class SentenceTransformerEmbeddingModel(EmbeddingModel):
 
     def __init__(self, embedding_model: str):
         try:
-            from sentence_transformers import SentenceTransformer
+            import sentence_transformers  # noqa: F401
         except ImportError:
             raise ImportError(
                 "Could not import sentence-transformers, please install it with "
@@ -51,16 +47,45 @@ class SentenceTransformerEmbeddingModel(EmbeddingModel):
             )
 
         try:
-            from torch import cuda
+            import torch  # noqa: F401
         except ImportError:
             raise ImportError(
                 "Could not import torch, please install it with `pip install torch`."
             )
 
-        device = "cuda" if cuda.is_available() else "cpu"
-        self.model = SentenceTransformer(embedding_model, device=device)
-        # Get the embedding dimension of the model
-        self.embedding_size = self.model.get_sentence_embedding_dimension()
+        # Pin the intra-op threads, now that PyTorch is imported.
+        set_num_threads(get_num_threads())
+
+        self.embedding_model = embedding_model
+        self._model = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Load the sentence-transformers model, if not already loaded.
+
+        With a process pool executor, the model is only loaded in the worker processes.
+        """
+        with self._lock:
+            if self._model is not None:
+                return
+
+            from sentence_transformers import SentenceTransformer
+            from torch import cuda
+
+            device = "cuda" if cuda.is_available() else "cpu"
+            self._model = SentenceTransformer(self.embedding_model, device=device)
+
+    @property
+    def model(self):
+        if self._model is None:
+            self.load()
+
+        return self._model
+
+    @cached_property
+    def embedding_size(self) -> int:
+        """The embedding dimension of the model."""
+        return self.model.get_sentence_embedding_dimension()
 
     async def encode_async(self, documents: List[str]) -> List[List[float]]:
         """Encode a list of documents into their corresponding sentence embeddings.
@@ -71,13 +96,7 @@ class SentenceTransformerEmbeddingModel(EmbeddingModel):
         Returns:
             List[List[float]]: The list of sentence embeddings, where each embedding is a list of floats.
         """
-
-        loop = asyncio.get_running_loop()
-        result = await loop.run_in_executor(
-            get_executor(), self.model.encode, documents
-        )
-
-        return result.tolist()
+        return await encode_in_executor(self, documents)
 
     def encode(self, documents: List[str]) -> List[List[float]]:
         """Encode a list of documents into their corresponding sentence embeddings.
@@ -20,6 +20,7 @@ import typer
 
 from nemoguardrails.eval.evaluate_factcheck import FactCheckEvaluation
 from nemoguardrails.eval.evaluate_hallucination import HallucinationRailsEvaluation
+from nemoguardrails.eval.evaluate_intent_detectors import IntentDetectorsEvaluation
 from nemoguardrails.eval.evaluate_moderation import ModerationRailsEvaluation
 from nemoguardrails.eval.evaluate_topical import TopicalRailsEvaluation
 from nemoguardrails.logging.verbose import set_verbose
@@ -116,6 +117,78 @@ def topical(
     topical_eval.evaluate_topical_rails()
 
 
+@app.command()
+def intent_detectors(
+    config: str = typer.Option(
+        default="",
+        exists=True,
+        help="Path to a directory containing configuration files of the Guardrails application for evaluation.",
+    ),
+    detector: List[str] = typer.Option(
+        default=["knn_llm", "knn", "centroids"],
+        help="The intent detectors to compare: `knn_llm`, `knn` or `centroids`.",
+    ),
+    test_percentage: float = typer.Option(
+        default=0.3,
+        help="Percentage of the samples for an intent to be used as test set.",
+    ),
+    max_tests_intent: int = typer.Option(
+        default=3,
+        help="Maximum number of test samples per intent to be used when testing. "
+        "If value is 0, no limit is used.",
+    ),
+    max_samples_intent: int = typer.Option(
+        default=0,
+        help="Maximum number of samples per intent used as examples. "
+        "If value is 0, all samples are used.",
+    ),
+    centroids_per_intent: int = typer.Option(
+        default=1, help="The maximum number of centroids per intent."
+    ),
+    random_seed: int = typer.Option(
+        default=None, help="Random seed used by the evaluation."
+    ),
+    output_dir: str = typer.Option(
+        default=None, help="Output directory for predictions."
+    ),
+):
+    """Compares the accuracy and the latency of the user intent detectors.
+
+    The user messages of the Guardrails application are split into examples and a test set,
+    and the user intent of each test message is generated using the closest examples and the LLM
+    (`knn_llm`), the closest example only (`knn`), or the centroids of the examples (`centroids`).
+
+    Args:
+        config (str): Path to a directory containing configuration files of the Guardrails application for evaluation.
+        detector (List[str], optional): The intent detectors to compare. Defaults to all of them.
+        test_percentage (float, optional): Percentage of the samples for an intent to be used as test set. Defaults to 0.3.
+        max_tests_intent (int, optional): Maximum number of test samples per intent to be used when testing.
+            If value is 0, no limit is used. Defaults to 3.
+        max_samples_intent (int, optional): Maximum number of samples per intent used as examples.
+            If value is 0, all samples are used. Defaults to 0.
+        centroids_per_intent (int, optional): The maximum number of centroids per intent. Defaults to 1.
+        random_seed (int, optional): Random seed used by the evaluation. Defaults to None.
+        output_dir (str, optional): Output directory for predictions. Defaults to None.
+    """
+    if config == "":
+        typer.echo("Please provide a value for the config path.")
+        raise typer.Exit(1)
+
+    typer.echo(f"Starting the intent detectors evaluation for app: {config}...")
+
+    intent_detectors_eval = IntentDetectorsEvaluation(
+        config=config,
+        detectors=detector,
+        test_set_percentage=test_percentage,
+        max_tests_per_intent=max_tests_intent,
+        max_samples_per_intent=max_samples_intent,
+        centroids_per_intent=centroids_per_intent,
+        random_seed=random_seed,
+        output_dir=output_dir,
+    )
+    intent_detectors_eval.evaluate_intent_detectors()
+
+
 @app.command()
 def moderation(
     config: str = typer.Option(
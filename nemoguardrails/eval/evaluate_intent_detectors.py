@@ -0,0 +1,193 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import random
+import textwrap
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from nemoguardrails import LLMRails, RailsConfig
+from nemoguardrails.eval.evaluate_topical import (
+    _split_test_set_from_config,
+    sync_wrapper,
+)
+
+# The settings of `rails.dialog.user_messages` for each intent detector.
+INTENT_DETECTORS = {
+    # The closest examples are used as few-shot examples for the LLM.
+    "knn_llm": {"intent_detector": "default", "embeddings_only": False},
+    # The intent of the closest example is used.
+    "knn": {"intent_detector": "default", "embeddings_only": True},
+    # The most likely intent according to the centroids of the examples is used.
+    "centroids": {"intent_detector": "centroids", "centroids_min_score": 0.0},
+}
+
+
+class IntentDetectorsEvaluation:
+    """Helper class for comparing the accuracy and the latency of the intent detectors.
+
+    The user messages of a Guardrails app are split into examples and a test set, as
+    for the topical rails evaluation, and the user intent of each test message is
+    generated with each intent detector.
+    """
+
+    def __init__(
+        self,
+        config: str,
+        detectors: Optional[List[str]] = None,
+        test_set_percentage: Optional[float] = 0.3,
+        max_tests_per_intent: Optional[int] = 3,
+        max_samples_per_intent: Optional[int] = 0,
+        centroids_per_intent: Optional[int] = 1,
+        random_seed: Optional[int] = None,
+        output_dir: Optional[str] = None,
+    ):
+        """An intent detectors evaluation has the following parameters:
+
+        - config: The Guardrails app to be evaluated.
+        - detectors: The intent detectors to compare, among `knn_llm`, `knn` and `centroids`.
+        - test_set_percentage: Percentage of the samples for an intent to be used as test set.
+        - max_tests_per_intent: Maximum number of test samples per intent. If the value is 0,
+        this parameter is not used.
+        - max_samples_per_intent: Maximum number of examples per intent. If the value is 0,
+        all samples not in test set are used.
+        - centroids_per_intent: The maximum number of centroids per intent.
+        - random_seed: Random seed used by the evaluation.
+        - output_dir: Output directory for predictions.
+        """
+        self.config_path = config
+        self.detectors = detectors or list(INTENT_DETECTORS.keys())
+        self.test_set_percentage = test_set_percentage
+        self.max_tests_per_intent = max_tests_per_intent
+        self.max_samples_per_intent = max_samples_per_intent
+        self.centroids_per_intent = centroids_per_intent
+        self.random_seed = random_seed
+        self.output_dir = output_dir
+
+        for detector in self.detectors:
+            if detector not in INTENT_DETECTORS:
+                raise ValueError(f"Unknown intent detector: {detector}")
+
+        if self.random_seed:
+            random.seed(self.random_seed)
+
+        self._initialize_rails_apps()
+
+    def _initialize_rails_apps(self):
+        """Initializes a Rails app for each intent detector, with the same test split."""
+        self.test_set: Dict[str, List[str]] = {}
+        rails_config = RailsConfig.from_path(config_path=self.config_path)
+        _split_test_set_from_config(
+            rails_config,
+            test_set_percentage=self.test_set_percentage,
+            max_samples_per_intent=self.max_samples_per_intent,
+            test_set=self.test_set,
+            random_seed=self.random_seed,
+        )
+
+        for intent, samples in self.test_set.items():
+            if 0 < self.max_tests_per_intent < len(samples):
+                self.test_set[intent] = samples[: self.max_tests_per_intent]
+
+        self.rails_apps = {}
+        for detector in self.detectors:
+            config = rails_config.copy(deep=True)
+            user_messages_config = config.rails.dialog.user_messages
+            user_messages_config.centroids_per_intent = self.centroids_per_intent
+            for key, value in INTENT_DETECTORS[detector].items():
+                setattr(user_messages_config, key, value)
+
+            self.rails_apps[detector] = LLMRails(config)
+
+    @staticmethod
+    async def _generate_user_intent(rails_app: LLMRails, text: str) -> Optional[str]:
+        result = await rails_app.llm_generation_actions.generate_user_intent(
+            events=[{"type": "UserMessage", "text": text}],
+            context={},
+            config=rails_app.config,
+        )
+        for event in result.events:
+            if event["type"] == "UserIntent":
+                return event["intent"]
+
+        return None
+
+    @sync_wrapper
+    async def evaluate_intent_detectors(self) -> Dict[str, dict]:
+        """Runs the evaluation, and returns the accuracy and the latency of each detector."""
+        total_test_samples = sum(len(samples) for samples in self.test_set.values())
+        print(
+            textwrap.dedent(
+                f"""Started processing rails app from path: {self.config_path}.
+                Number of intents: {len(self.test_set.keys())}.
+                Number of test samples: {total_test_samples}.
+                Intent detectors: {", ".join(self.detectors)}."""
+            )
+        )
+
+        results = {}
+        predictions = []
+        for detector, rails_app in self.rails_apps.items():
+            num_correct = 0
+            latencies = []
+            for intent, samples in self.test_set.items():
+                for sample in samples:
+                    t0 = time.perf_counter()
+                    generated_intent = await self._generate_user_intent(
+                        rails_app, sample
+                    )
+                    latencies.append(time.perf_counter() - t0)
+
+                    num_correct += generated_intent == intent
+                    predictions.append(
+                        {
+                            "detector": detector,
+                            "UtteranceUserActionFinished": sample,
+                            "UserIntent": intent,
+                            "generated_user_intent": generated_intent,
+                        }
+                    )
+
+            results[detector] = {
+                "accuracy": num_correct / max(1, len(latencies)),
+                "p50": float(np.percentile(latencies, 50)) if latencies else 0.0,
+                "p99": float(np.percentile(latencies, 99)) if latencies else 0.0,
+            }
+
+        self._print_evaluation_results(results)
+
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+            output_path = os.path.join(self.output_dir, "intent_detectors_results.json")
+            with open(output_path, "w") as f:
+                json.dump({"results": results, "predictions": predictions}, f, indent=4)
+
+                print(f"Predictions written to file {output_path}")
+
+        return results
+
+    @staticmethod
+    def _print_evaluation_results(results: Dict[str, dict]):
+        """Prints a summary of the evaluation results."""
+        print(f"{'detector':>10} {'accuracy':>9} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+        for detector, stats in results.items():
+            print(
+                f"{detector:>10} {stats['accuracy']:>9.3f} "
+                f"{1000 * stats['p50']:>9.3f} {1000 * stats['p99']:>9.3f}"
+            )
@@ -14,11 +14,16 @@
 # limitations under the License.
 
 import hashlib
+import json
 import logging
 import os
+import uuid
 from time import time
-from typing import Callable, List, Optional, cast
+from typing import Callable, Dict, List, Optional
 
+import numpy as np
+
+from nemoguardrails.embeddings.basic import BasicEmbeddingsIndex
 from nemoguardrails.embeddings.index import EmbeddingsIndex, IndexItem
 from nemoguardrails.kb.utils import split_markdown_in_topic_chunks
 from nemoguardrails.rails.llm.config import EmbeddingSearchProvider, KnowledgeBaseConfig
@@ -99,8 +104,67 @@ class KnowledgeBase:
             chunks = split_markdown_in_topic_chunks(doc)
             self.chunks.extend(chunks)
 
+    def _get_chunk_embeddings_path(self) -> str:
+        """Get the path of the chunk embeddings computed with the model of the index.
+
+        The engine and the model are taken from the index, because they are not set in
+        the parameters of the provider when the default embedding model is used. The
+        API key does not change the embeddings, so it is not included.
+        """
+        md5_hash = hashlib.md5(
+            json.dumps(
+                [
+                    self.config.embedding_search_provider.name,
+                    self.index.embedding_engine,
+                    self.index.embedding_model,
+                    {
+                        k: v
+                        for k, v in self.index.embedding_params.items()
+                        if k != "api_key"
+                    },
+                ],
+                sort_keys=True,
+                default=str,
+            ).encode("utf-8")
+        ).hexdigest()
+
+        return os.path.join(CACHE_FOLDER, f"kb_chunks_{md5_hash}.npz")
+
+    @staticmethod
+    def _load_chunk_embeddings(path: str) -> Dict[str, np.ndarray]:
+        """Loads the embeddings of the chunks of a previous build, by chunk hash."""
+        if not os.path.exists(path):
+            return {}
+
+        with np.load(path) as data:
+            return dict(zip(data["hashes"].tolist(), data["embeddings"]))
+
+    @staticmethod
+    def _save_chunk_embeddings(
+        path: str, hashes: List[str], embeddings: List[List[float]]
+    ):
+        """Saves the embeddings of the chunks, by chunk hash.
+
+        Only the current chunks are saved, so the file does not grow with the edits.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                hashes=np.asarray(hashes),
+                embeddings=np.asarray(embeddings, dtype=np.float32),
+            )
+        os.replace(tmp_path, path)
+
     async def build(self):
-        """Builds the knowledge base index."""
+        """Builds the knowledge base index.
+
+        For the default and exact embedding search providers, the index is cached. If
+        the chunks have changed since the last build, the embeddings of the unchanged
+        chunks are reused, and only the new or changed chunks are embedded.
+        """
         t0 = time()
         index_items = []
         all_text_items = []
@@ -114,66 +178,57 @@ class KnowledgeBase:
         if not index_items:
             return
 
+        self.index = self._get_embeddings_search_instance(
+            self.config.embedding_search_provider
+        )
+
+        if not isinstance(self.index, BasicEmbeddingsIndex):
+            await self.index.add_items(index_items)
+            await self.index.build()
+            log.info(f"Building the Knowledge Base index took {time() - t0} seconds.")
+            return
+
         # We compute the md5
         # As part of the hash, we also include the embedding engine and the model
         # to prevent the cache being used incorrectly when the embedding model changes.
-        hash_prefix = self.config.embedding_search_provider.parameters.get(
-            "embedding_engine", ""
-        ) + self.config.embedding_search_provider.parameters.get("embedding_model", "")
+        hash_prefix = self.index.embedding_engine + self.index.embedding_model
 
         md5_hash = hashlib.md5(
             (hash_prefix + "".join(all_text_items)).encode("utf-8")
         ).hexdigest()
-        cache_file = os.path.join(CACHE_FOLDER, f"{md5_hash}.ann")
-        embedding_size_file = os.path.join(CACHE_FOLDER, f"{md5_hash}.esize")
+        cache_path = os.path.join(CACHE_FOLDER, md5_hash)
 
         # If we have already computed this before, we use it
-        if (
-            self.config.embedding_search_provider.name == "default"
-            and os.path.exists(cache_file)
-            and os.path.exists(embedding_size_file)
-        ):
-            from annoy import AnnoyIndex
-
-            from nemoguardrails.embeddings.basic import BasicEmbeddingsIndex
-
-            log.info(cache_file)
-            self.index = cast(
-                BasicEmbeddingsIndex,
-                self._get_embeddings_search_instance(
-                    self.config.embedding_search_provider
-                ),
-            )
-
-            with open(embedding_size_file, "r") as f:
-                embedding_size = int(f.read())
-
-            ann_index = AnnoyIndex(embedding_size, "angular")
-            ann_index.load(cache_file)
-
-            self.index.embeddings_index = ann_index
-
+        if await self.index.load(cache_path):
+            log.info(f"Loaded the Knowledge Base index from {cache_path}.")
             await self.index.add_items(index_items)
         else:
-            self.index = self._get_embeddings_search_instance(
-                self.config.embedding_search_provider
+            # Otherwise, we reuse the embeddings of the chunks which have not changed,
+            # and only rebuild the index.
+            chunk_hashes = [
+                hashlib.md5(text.encode("utf-8")).hexdigest() for text in all_text_items
+            ]
+            chunk_embeddings_path = self._get_chunk_embeddings_path()
+            cached_embeddings = self._load_chunk_embeddings(chunk_embeddings_path)
+            embeddings = [
+                cached_embeddings.get(chunk_hash) for chunk_hash in chunk_hashes
+            ]
+            num_reused = sum(1 for embedding in embeddings if embedding is not None)
+            log.info(
+                f"Reusing the embeddings of {num_reused} out of "
+                f"{len(embeddings)} Knowledge Base chunks."
             )
-            await self.index.add_items(index_items)
-            await self.index.build()
 
-            # For the default Embedding Search provider, which uses annoy, we also
-            # persist the index after it's computed.
-            if self.config.embedding_search_provider.name == "default":
-                from nemoguardrails.embeddings.basic import BasicEmbeddingsIndex
-
-                # We also save the file for future use
-                os.makedirs(CACHE_FOLDER, exist_ok=True)
-                basic_index = cast(BasicEmbeddingsIndex, self.index)
-                basic_index.embeddings_index.save(cache_file)
+            await self.index.add_items(index_items, embeddings=embeddings)
+            await self.index.build()
 
-                # And, explicitly save the size as we need it when we reload
-                with open(embedding_size_file, "w") as f:
-                    f.write(str(basic_index.embedding_size))
+            # We also save the index and the chunk embeddings for future use.
+            await self.index.save(cache_path)
+            self._save_chunk_embeddings(
+                chunk_embeddings_path,
+                chunk_hashes,
+                self.index.get_item_embeddings()[1],
+            )
 
         log.info(f"Building the Knowledge Base index took {time() - t0} seconds.")
 
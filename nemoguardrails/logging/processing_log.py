@@ -36,13 +36,19 @@ def compute_generation_log(processing_log: List[dict]) -> GenerationLog:
     generation_log = GenerationLog()
 
     # The list of actions to ignore during the processing.
-    ignored_actions = ["create_event"]
+    ignored_actions = [
+        "create_event",
+        "run_input_rails_in_parallel",
+        "run_output_rails_in_parallel",
+    ]
     ignored_flows = [
         "process user input",
         "run input rails",
+        "run input rails in parallel",
         "run dialog rails",
         "process bot message",
         "run output rails",
+        "run output rails in parallel",
     ]
     generation_flows = [
         "generate bot message",
@@ -58,6 +64,10 @@ def compute_generation_log(processing_log: List[dict]) -> GenerationLog:
     executed_action = None
     last_timestamp = None
 
+    # The marker events of the rails run in parallel are recorded when the rails run,
+    # and again when they are returned by the action, so we keep only the first ones.
+    rail_event_uids = set()
+
     for event in processing_log:
         last_timestamp = event["timestamp"]
 
@@ -116,6 +126,18 @@ def compute_generation_log(processing_log: List[dict]) -> GenerationLog:
             event_data = event["data"]
             event_type = event_data["type"]
 
+            if event_type in [
+                "StartInputRail",
+                "StartOutputRail",
+                "InputRailFinished",
+                "OutputRailFinished",
+            ]:
+                uid = event_data.get("uid")
+                if uid is not None:
+                    if uid in rail_event_uids:
+                        continue
+                    rail_event_uids.add(uid)
+
             if event_type == "StartInputRails":
                 input_rails_started_at = event["timestamp"]
 
@@ -178,6 +200,11 @@ def compute_generation_log(processing_log: List[dict]) -> GenerationLog:
         elif event["type"] == "llm_call_info":
             executed_action.llm_calls.append(event["data"])
 
+        elif event["type"] == "intent_exact_match":
+            generation_log.stats.intent_exact_match_lookups += 1
+            if event["data"]["hit"]:
+                generation_log.stats.intent_exact_match_hits += 1
+
     # If at the end of the processing we still have an active rail, it is because
     # we have hit a stop. In this case, we take the last timestamp as the timestamp for
     # finishing the rail.
@@ -31,6 +31,14 @@ class LLMStats:
             "total_prompt_tokens": 0,
             "total_completion_tokens": 0,
             "latencies": [],
+            # The generations started concurrently with the input rails.
+            "speculative_generations": 0,
+            "speculative_wasted_generations": 0,
+            "speculative_tokens": 0,
+            "speculative_wasted_tokens": 0,
+            # The exact matches of the user message examples.
+            "intent_exact_match_lookups": 0,
+            "intent_exact_match_hits": 0,
         }
 
     def inc(self, name: str, value: Union[float, int] = 1):
@@ -49,6 +57,23 @@ class LLMStats:
     def get_stats(self):
         return self._stats
 
+    def get_wasted_tokens_rate(self) -> float:
+        """The fraction of the tokens used by the discarded speculative generations."""
+        if not self._stats["total_tokens"]:
+            return 0.0
+
+        return self._stats["speculative_wasted_tokens"] / self._stats["total_tokens"]
+
+    def get_intent_exact_match_hit_rate(self) -> float:
+        """The fraction of the user intents found by an exact match of an example."""
+        if not self._stats["intent_exact_match_lookups"]:
+            return 0.0
+
+        return (
+            self._stats["intent_exact_match_hits"]
+            / self._stats["intent_exact_match_lookups"]
+        )
+
     def reset(self):
         self._stats = self._get_empty_stats()
 
@@ -60,4 +85,18 @@ class LLMStats:
             f"{self._stats['total_prompt_tokens']} total prompt tokens, "
             f"{self._stats['total_completion_tokens']} total completion tokens, "
             f"{[round(x, 2) for x in self._stats['latencies']]} as latencies"
+            + (
+                f", {self._stats['speculative_wasted_generations']}/"
+                f"{self._stats['speculative_generations']} speculative generations "
+                f"wasted, {round(100 * self.get_wasted_tokens_rate(), 2)}% wasted tokens"
+                if self._stats["speculative_generations"]
+                else ""
+            )
+            + (
+                f", {self._stats['intent_exact_match_hits']}/"
+                f"{self._stats['intent_exact_match_lookups']} user intents "
+                f"matched exactly ({round(100 * self.get_intent_exact_match_hit_rate(), 2)}%)"
+                if self._stats["intent_exact_match_lookups"]
+                else ""
+            )
         )
@@ -16,7 +16,7 @@
 """Module for the configuration of rails."""
 import logging
 import os
-from typing import Any, Dict, List, Optional, Set, Tuple, Union
+from typing import Any, Dict, List, Literal, Optional, Set, Tuple, Union
 
 import yaml
 from pydantic import BaseModel, ValidationError, root_validator
@@ -201,6 +201,21 @@ class EmbeddingsCacheConfig(BaseModel):
         return self.dict()
 
 
+class EmbeddingsIndexPersistenceConfig(BaseModel):
+    """Configuration for persisting the built embeddings indexes."""
+
+    enabled: bool = Field(
+        default=False,
+        description="Whether the built indexes should be saved, and loaded on the "
+        "next start instead of computing the embeddings again.",
+    )
+    cache_dir: str = Field(
+        default=".cache",
+        description="The directory where the indexes are saved. It can be shared by "
+        "several processes. Relative paths are relative to the current directory.",
+    )
+
+
 class EmbeddingSearchProvider(BaseModel):
     """Configuration of a embedding search provider."""
 
@@ -210,6 +225,11 @@ class EmbeddingSearchProvider(BaseModel):
     )
     parameters: Dict[str, Any] = Field(default_factory=dict)
     cache: EmbeddingsCacheConfig = Field(default_factory=EmbeddingsCacheConfig)
+    persistence: EmbeddingsIndexPersistenceConfig = Field(
+        default_factory=EmbeddingsIndexPersistenceConfig,
+        description="Only supported by the `default` and `exact` providers, for the "
+        "user messages, bot messages and flows indexes.",
+    )
 
 
 class KnowledgeBaseConfig(BaseModel):
@@ -223,6 +243,54 @@ class KnowledgeBaseConfig(BaseModel):
     )
 
 
+class EmbeddingsExecutorConfig(BaseModel):
+    """Configuration of the executor used to compute the embeddings of the local models."""
+
+    type: str = Field(
+        default="default",
+        description="The type of executor: `default` (the default executor of asyncio), "
+        "`thread` (a dedicated thread pool) or `process` (a pool of processes, with the "
+        "embedding models preloaded in each worker).",
+    )
+    max_workers: int = Field(
+        default=1,
+        description="The number of threads or processes of the executor.",
+    )
+    num_threads: Optional[int] = Field(
+        default=None,
+        description="The number of intra-op threads used by each embedding model "
+        "(PyTorch or ONNX Runtime). If not set, the library default is used.",
+    )
+
+
+class EventsHistoryCacheConfig(BaseModel):
+    """Configuration of the cache of the events history associated with the messages."""
+
+    max_size_bytes: Optional[int] = Field(
+        default=256 * 1024 * 1024,
+        ge=0,
+        description="The maximum estimated size of the cached events, in bytes. The least "
+        "recently used entries are evicted above it. If not set, the size is not bounded.",
+    )
+    ttl: Optional[float] = Field(
+        default=24 * 60 * 60,
+        ge=0,
+        description="The number of seconds after which an entry that was not accessed "
+        "expires. If not set, the entries don't expire.",
+    )
+
+
+class StateCheckpointsConfig(BaseModel):
+    """Configuration of the checkpoints of the Colang 1.0 state."""
+
+    max_size: int = Field(
+        default=1000,
+        ge=0,
+        description="The maximum number of checkpoints, each holding a copy of the "
+        "context and the flow states. The least recently used ones are evicted above it.",
+    )
+
+
 class CoreConfig(BaseModel):
     """Settings for core internal mechanics."""
 
@@ -230,6 +298,21 @@ class CoreConfig(BaseModel):
         default_factory=EmbeddingSearchProvider,
         description="The search provider used to search the most similar canonical forms/flows.",
     )
+    embeddings_executor: EmbeddingsExecutorConfig = Field(
+        default_factory=EmbeddingsExecutorConfig,
+        description="The executor used to compute the embeddings of the FastEmbed and "
+        "SentenceTransformers models. It is shared by all the configurations in a process.",
+    )
+    events_history_cache: EventsHistoryCacheConfig = Field(
+        default_factory=EventsHistoryCacheConfig,
+        description="The cache of the events history associated with the messages, used "
+        "to process only the new messages of a conversation.",
+    )
+    state_checkpoints: StateCheckpointsConfig = Field(
+        default_factory=StateCheckpointsConfig,
+        description="The checkpoints of the Colang 1.0 state for the recently processed "
+        "histories of events, used to process only the new events.",
+    )
 
 
 class InputRails(BaseModel):
@@ -240,6 +323,53 @@ class InputRails(BaseModel):
         description="The names of all the flows that implement input rails.",
     )
 
+    parallel: bool = Field(
+        default=False,
+        description="If True, the input rails that don't alter the user message are "
+        "executed in parallel, and as soon as one of them blocks the input, the "
+        "others are cancelled.",
+    )
+
+    speculative_generation: bool = Field(
+        default=False,
+        description="If True, in passthrough and single call mode, the main LLM "
+        "generation starts concurrently with the input rails. The generation is "
+        "discarded if the input rails block, or alter the user message or any other "
+        "context variable read by the generation.",
+    )
+
+
+class OutputRailsStreamingConfig(BaseModel):
+    """Configuration for running the output rails on a streamed bot message."""
+
+    enabled: bool = Field(
+        default=False,
+        description="If True, the streamed chunks are grouped into windows, which are "
+        "checked with the output rails before being sent.",
+    )
+    window_unit: Literal["tokens", "sentences"] = Field(
+        default="tokens",
+        description="The unit for the size of the windows, "
+        "i.e., `tokens` (streamed chunks) or `sentences`.",
+    )
+    window_size: int = Field(
+        default=200,
+        description="The number of tokens/sentences in a window.",
+    )
+    window_overlap: int = Field(
+        default=50,
+        description="The number of tokens/sentences from the previous windows that "
+        "are also included, as context, when checking a window.",
+    )
+    on_violation: Literal["message", "error", "stop"] = Field(
+        default="message",
+        description="What to do when a window is blocked, after the previous ones have "
+        "been sent: `message` stops the streaming and sends the response of the rail "
+        "that blocked it (e.g., the refusal message), `error` stops the streaming and "
+        "raises a `StreamingViolationError` to the consumer of the stream, and `stop` "
+        "only stops the streaming.",
+    )
+
 
 class OutputRails(BaseModel):
     """Configuration of output rails."""
@@ -249,6 +379,18 @@ class OutputRails(BaseModel):
         description="The names of all the flows that implement output rails.",
     )
 
+    parallel: bool = Field(
+        default=False,
+        description="If True, the output rails that don't alter the bot message are "
+        "executed in parallel, and as soon as one of them blocks the message, the "
+        "others are cancelled.",
+    )
+
+    streaming: OutputRailsStreamingConfig = Field(
+        default_factory=OutputRailsStreamingConfig,
+        description="Configuration for running the output rails in streaming mode.",
+    )
+
 
 class RetrievalRails(BaseModel):
     """Configuration of retrieval rails."""
@@ -288,10 +430,71 @@ class SingleCallConfig(BaseModel):
 class UserMessagesConfig(BaseModel):
     """Configuration for how the user messages are interpreted."""
 
+    exact_match: bool = Field(
+        default=False,
+        description="Whether to use the canonical form of the user message examples which match "
+        "the user input exactly, after normalization, without computing embeddings or calling the LLM.",
+    )
     embeddings_only: bool = Field(
         default=False,
         description="Whether to use only embeddings for computing the user canonical form messages.",
     )
+    embeddings_only_similarity_threshold: Optional[float] = Field(
+        default=None,
+        ge=0,
+        le=1,
+        description="The minimum cosine similarity of the closest user message for using its "
+        "canonical form with `embeddings_only`. If not met, the fallback intent or the LLM is used. "
+        "If not set, the canonical form of the closest user message is always used.",
+    )
+    embeddings_only_similarity_margin: float = Field(
+        default=0.0,
+        ge=0,
+        description="The minimum difference between the similarity of the closest user message "
+        "and the one of the closest user message with another canonical form, with "
+        "`embeddings_only_similarity_threshold`.",
+    )
+    embeddings_only_fallback_intent: Optional[str] = Field(
+        default=None,
+        description="The canonical form used when the similarity threshold is not met. "
+        "If not set, the LLM is used to generate the canonical form.",
+    )
+    intent_detector: str = Field(
+        default="default",
+        description="The detector of the user intents: `default` searches the closest examples "
+        "and, unless `embeddings_only` is set, uses the LLM. `centroids` scores the intents using the "
+        "centroids of the embeddings of their examples, and falls back to the default detector "
+        "if the probability of the best intent is below `centroids_min_score`.",
+    )
+    centroids_per_intent: int = Field(
+        default=1,
+        ge=1,
+        description="The maximum number of centroids per intent, for the `centroids` intent detector.",
+    )
+    centroids_min_score: float = Field(
+        default=0.5,
+        ge=0,
+        le=1,
+        description="The minimum probability of the best intent for the `centroids` intent detector.",
+    )
+
+
+class NextStepsConfig(BaseModel):
+    """Configuration for how the next steps are generated."""
+
+    lookup: bool = Field(
+        default=False,
+        description="Whether to take the next step from the flows, when a user intent is always "
+        "followed by the same bot intent, before calling the LLM.",
+    )
+    lookup_similarity_threshold: Optional[float] = Field(
+        default=0.9,
+        ge=0,
+        le=1,
+        description="For the user intents which are not in the flows, the minimum similarity of "
+        "the closest user intent of the flows, for using its next step. If not set, only the "
+        "user intents of the flows are looked up.",
+    )
 
 
 class DialogRails(BaseModel):
@@ -305,6 +508,10 @@ class DialogRails(BaseModel):
         default_factory=UserMessagesConfig,
         description="Configuration for how the user messages are interpreted.",
     )
+    next_steps: NextStepsConfig = Field(
+        default_factory=NextStepsConfig,
+        description="Configuration for how the next steps are generated.",
+    )
 
 
 class FactCheckingRailConfig(BaseModel):
@@ -0,0 +1,259 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bounded cache for the events history associated with sequences of messages."""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# The default maximum size of the cache, in bytes (256MB).
+DEFAULT_MAX_SIZE_BYTES = 256 * 1024 * 1024
+
+# The default number of seconds after which an entry that was not accessed expires.
+DEFAULT_TTL = 24 * 60 * 60
+
+
+def _get_message_key_item(msg: dict) -> str:
+    """Returns the content of a message that is relevant for the cache key."""
+    role = msg.get("role")
+    if role == "context":
+        return "context:" + json.dumps(msg.get("content"))
+    elif role == "event":
+        return "event:" + json.dumps(msg.get("event"))
+    else:
+        return f"{role}:{msg.get('content')}"
+
+
+def get_prefix_hashes(messages: List[dict]) -> List[bytes]:
+    """Computes the hashes of all the prefixes of a sequence of messages.
+
+    The hash of a prefix is computed from the hash of the previous prefix and the
+    current message, so the hashes of all prefixes are computed in O(n).
+
+    Args:
+        messages: The list of messages.
+
+    Returns:
+        The list of hashes, where the i-th element is the hash of `messages[0:i+1]`.
+    """
+    prefix_hashes = []
+    prefix_hash = b""
+
+    for msg in messages:
+        h = hashlib.blake2b(prefix_hash, digest_size=16)
+        h.update(_get_message_key_item(msg).encode("utf-8"))
+        prefix_hash = h.digest()
+        prefix_hashes.append(prefix_hash)
+
+    return prefix_hashes
+
+
+def _estimate_size(events: List[dict]) -> int:
+    """Estimates the size in bytes of a list of events."""
+    return len(json.dumps(events, default=str))
+
+
+@dataclass
+class _CacheEntry:
+    events: List[dict]
+    size_bytes: int
+    last_access: float
+
+
+class EventsHistoryCache:
+    """A cache for the events history associated with sequences of messages.
+
+    The entries are keyed by the hash of the sequence of messages. The longest
+    prefix of a sequence of messages for which there is an entry is found in O(n).
+
+    Entries are evicted in least-recently-used order when the total estimated size
+    exceeds `max_size_bytes`, and when they have not been accessed for `ttl` seconds.
+    The size of an entry is estimated from its JSON serialization; since the entries
+    for consecutive turns share the same event objects, the actual memory usage is lower.
+    """
+
+    def __init__(
+        self,
+        max_size_bytes: Optional[int] = DEFAULT_MAX_SIZE_BYTES,
+        ttl: Optional[float] = DEFAULT_TTL,
+    ):
+        """Initializes the cache.
+
+        Args:
+            max_size_bytes: The maximum estimated size of the cached events. If None,
+              the size is not bounded.
+            ttl: The number of seconds after which an entry that was not accessed
+              expires. If None, the entries don't expire.
+        """
+        self.max_size_bytes = max_size_bytes
+        self.ttl = ttl
+
+        self._entries: "OrderedDict[bytes, _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key: bytes):
+        entry = self._entries.pop(key)
+        self.size_bytes -= entry.size_bytes
+        self.evictions += 1
+
+    def _evict(self, now: float):
+        """Evicts the expired entries and the ones over the size budget."""
+        # The entries are in access order, so the expired ones are first.
+        if self.ttl is not None:
+            while self._entries:
+                key, entry = next(iter(self._entries.items()))
+                if now - entry.last_access <= self.ttl:
+                    break
+                self._remove(key)
+
+        if self.max_size_bytes is not None:
+            while self._entries and self.size_bytes > self.max_size_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _find_prefix_entry(
+        self, prefix_hashes: List[bytes], events: List[dict]
+    ) -> Optional[_CacheEntry]:
+        """Finds the entry of the longest proper prefix, if its events prefix `events`."""
+        for key in reversed(prefix_hashes[:-1]):
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+
+            n = len(entry.events)
+            if n <= len(events) and (
+                n == 0
+                or entry.events[-1] is events[n - 1]
+                or entry.events[-1] == events[n - 1]
+            ):
+                return entry
+            return None
+
+        return None
+
+    def set(self, messages: List[dict], events: List[dict]):
+        """Stores the events history for a sequence of messages.
+
+        The events history of a conversation usually extends the one of the previous
+        turn, in which case only the size of the new events is estimated.
+
+        Args:
+            messages: The list of messages.
+            events: The list of events corresponding to the messages.
+        """
+        if not messages:
+            return
+
+        prefix_hashes = get_prefix_hashes(messages)
+        key = prefix_hashes[-1]
+        now = time.time()
+
+        with self._lock:
+            prefix_entry = self._find_prefix_entry(prefix_hashes, events)
+
+        if prefix_entry is not None:
+            n = len(prefix_entry.events)
+            size_bytes = prefix_entry.size_bytes + _estimate_size(events[n:])
+        else:
+            size_bytes = _estimate_size(events)
+        entry = _CacheEntry(events=events, size_bytes=size_bytes, last_access=now)
+
+        with self._lock:
+            if key in self._entries:
+                self.size_bytes -= self._entries.pop(key).size_bytes
+
+            self._entries[key] = entry
+            self.size_bytes += entry.size_bytes
+            self._evict(now)
+
+    def get_longest_prefix(
+        self, messages: List[dict]
+    ) -> Tuple[int, Optional[List[dict]]]:
+        """Finds the events history for the longest cached prefix of the messages.
+
+        Args:
+            messages: The list of messages.
+
+        Returns:
+            The length of the prefix and the corresponding list of events, or
+            (0, None) if no prefix is cached.
+        """
+        prefix_hashes = get_prefix_hashes(messages)
+        now = time.time()
+
+        with self._lock:
+            self._evict(now)
+
+            for p in range(len(prefix_hashes), 0, -1):
+                key = prefix_hashes[p - 1]
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.last_access = now
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return p, entry.events
+
+            self.misses += 1
+
+        return 0, None
+
+    def get(self, messages: List[dict]) -> Optional[List[dict]]:
+        """Returns the events history for exactly the provided messages, if cached."""
+        if not messages:
+            return None
+
+        key = get_prefix_hashes(messages)[-1]
+        now = time.time()
+
+        with self._lock:
+            self._evict(now)
+
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            entry.last_access = now
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return entry.events
+
+    def clear(self):
+        """Removes all the entries from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def get_stats(self) -> dict:
+        """Returns the metrics of the cache."""
+        return {
+            "size": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -15,6 +15,7 @@
 
 """LLM Rails entry point."""
 import asyncio
+import contextlib
 import importlib.util
 import logging
 import os
@@ -30,7 +31,7 @@ from nemoguardrails.actions.llm.generation import LLMGenerationActions
 from nemoguardrails.actions.llm.utils import get_colang_history
 from nemoguardrails.actions.v2_x.generation import LLMGenerationActionsV2dotx
 from nemoguardrails.colang import parse_colang_file
-from nemoguardrails.colang.v1_0.runtime.flows import compute_context
+from nemoguardrails.colang.v1_0.runtime.flows import get_context_snapshot
 from nemoguardrails.colang.v1_0.runtime.runtime import Runtime, RuntimeV1_0
 from nemoguardrails.colang.v2_x.runtime.flows import Action, State
 from nemoguardrails.colang.v2_x.runtime.runtime import RuntimeV2_x
@@ -48,6 +49,8 @@ from nemoguardrails.context import (
 from nemoguardrails.embeddings.index import EmbeddingsIndex
 from nemoguardrails.embeddings.providers import register_embedding_provider
 from nemoguardrails.embeddings.providers.base import EmbeddingModel
+from nemoguardrails.embeddings.providers.executor import configure_embeddings_executor
+from nemoguardrails.embeddings.providers.registry import EmbeddingProviderRegistry
 from nemoguardrails.kb.kb import KnowledgeBase
 from nemoguardrails.llm.providers import get_llm_provider, get_llm_provider_names
 from nemoguardrails.logging.explain import ExplainInfo
@@ -56,13 +59,17 @@ from nemoguardrails.logging.stats import LLMStats
 from nemoguardrails.logging.verbose import set_verbose
 from nemoguardrails.patch_asyncio import check_sync_call_from_async_loop
 from nemoguardrails.rails.llm.config import EmbeddingSearchProvider, RailsConfig
+from nemoguardrails.rails.llm.history_cache import EventsHistoryCache
 from nemoguardrails.rails.llm.options import (
     GenerationLog,
     GenerationOptions,
     GenerationResponse,
 )
-from nemoguardrails.rails.llm.utils import get_history_cache_key
-from nemoguardrails.streaming import StreamingHandler
+from nemoguardrails.streaming import (
+    ChunkWindowBuffer,
+    StreamingHandler,
+    StreamingViolationError,
+)
 from nemoguardrails.utils import get_or_create_event_loop, new_event_dict, new_uuid
 
 log = logging.getLogger(__name__)
@@ -101,11 +108,15 @@ class LLMRails:
         # The default embeddings model is using FastEmbed
         self.default_embedding_model = "all-MiniLM-L6-v2"
         self.default_embedding_engine = "FastEmbed"
+        self.default_embedding_params = {}
 
         # We keep a cache of the events history associated with a sequence of user messages.
         # TODO: when we update the interface to allow to return a "state object", this
         #   should be removed
-        self.events_history_cache = {}
+        self.events_history_cache = EventsHistoryCache(
+            max_size_bytes=config.core.events_history_cache.max_size_bytes,
+            ttl=config.core.events_history_cache.ttl,
+        )
 
         # Weather the main LLM supports streaming
         self.main_llm_supports_streaming = False
@@ -205,8 +216,12 @@ class LLMRails:
             if model.type == "embeddings":
                 self.default_embedding_model = model.model
                 self.default_embedding_engine = model.engine
+                self.default_embedding_params = model.parameters or {}
                 break
 
+        # Next, we configure the executor used for computing the embeddings.
+        self._init_embeddings_executor()
+
         # We run some additional checks on the config
         self._validate_config()
 
@@ -377,28 +392,84 @@ class LLMRails:
                         model_name, getattr(self, model_name)
                     )
 
+    def _init_embeddings_executor(self):
+        """Configure the executor for the embeddings, with the models to preload."""
+        models = []
+        for esp_config in [
+            self.config.core.embedding_search_provider,
+            self.config.knowledge_base.embedding_search_provider,
+        ]:
+            if esp_config.name not in ["default", "exact"]:
+                continue
+
+            embedding_engine = esp_config.parameters.get(
+                "embedding_engine", self.default_embedding_engine
+            )
+            embedding_model = esp_config.parameters.get(
+                "embedding_model", self.default_embedding_model
+            )
+            try:
+                model_cls = EmbeddingProviderRegistry().get(embedding_engine)
+            except (KeyError, ValueError):
+                continue
+
+            if (model_cls, embedding_model) not in models:
+                models.append((model_cls, embedding_model))
+
+        configure_embeddings_executor(self.config.core.embeddings_executor, models)
+
     def _get_embeddings_search_provider_instance(
         self, esp_config: Optional[EmbeddingSearchProvider] = None
     ) -> EmbeddingsIndex:
         if esp_config is None:
             esp_config = EmbeddingSearchProvider()
 
-        if esp_config.name == "default":
-            from nemoguardrails.embeddings.basic import BasicEmbeddingsIndex
+        if esp_config.name in ["default", "exact"]:
+            if esp_config.name == "default":
+                from nemoguardrails.embeddings.basic import (
+                    BasicEmbeddingsIndex as index_cls,
+                )
+            else:
+                from nemoguardrails.embeddings.exact import (
+                    ExactEmbeddingsIndex as index_cls,
+                )
 
-            return BasicEmbeddingsIndex(
-                embedding_model=esp_config.parameters.get(
-                    "embedding_model", self.default_embedding_model
-                ),
-                embedding_engine=esp_config.parameters.get(
-                    "embedding_engine", self.default_embedding_engine
-                ),
+            embedding_model = esp_config.parameters.get(
+                "embedding_model", self.default_embedding_model
+            )
+            embedding_engine = esp_config.parameters.get(
+                "embedding_engine", self.default_embedding_engine
+            )
+
+            # The parameters of the embeddings model (e.g., the `api_key`) only apply
+            # when the default embedding model is used.
+            embedding_params = esp_config.parameters.get("embedding_parameters")
+            if embedding_params is None and (embedding_engine, embedding_model) == (
+                self.default_embedding_engine,
+                self.default_embedding_model,
+            ):
+                embedding_params = self.default_embedding_params
+
+            return index_cls(
+                embedding_model=embedding_model,
+                embedding_engine=embedding_engine,
+                embedding_params=embedding_params,
                 cache_config=esp_config.cache,
                 # We make sure we also pass additional relevant params.
                 **{
                     k: v
                     for k, v in esp_config.parameters.items()
-                    if k in ["use_batching", "max_batch_size", "matx_batch_hold"]
+                    if k
+                    in [
+                        "use_batching",
+                        "max_batch_size",
+                        "max_batch_hold",
+                        "max_delta_size",
+                        "n_trees",
+                        "search_k",
+                        "autotune",
+                        "target_recall",
+                    ]
                     and v is not None
                 },
             )
@@ -432,14 +503,11 @@ class LLMRails:
         if self.config.colang_version == "1.0":
             # We try to find the longest prefix of messages for which we have a cache
             # of events.
-            p = len(messages) - 1
-            while p > 0:
-                cache_key = get_history_cache_key(messages[0:p])
-                if cache_key in self.events_history_cache:
-                    events = self.events_history_cache[cache_key].copy()
-                    break
-
-                p -= 1
+            p, cached_events = self.events_history_cache.get_longest_prefix(
+                messages[0:-1]
+            )
+            if cached_events is not None:
+                events = cached_events.copy()
 
             # For the rest of the messages, we transform them directly into events.
             # TODO: Move this to separate function once more types of messages are supported.
@@ -636,6 +704,9 @@ class LLMRails:
         # The array of events corresponding to the provided sequence of messages.
         events = self._get_events_for_messages(messages, state)
 
+        llm_streaming_handler = None
+        output_rails_streaming_task = None
+
         if self.config.colang_version == "1.0":
             # If we had a state object, we also need to prepend the events from the state.
             state_events = []
@@ -643,10 +714,39 @@ class LLMRails:
                 assert isinstance(state, dict)
                 state_events = state["events"]
 
+            # If the output rails must check the streamed chunks, the LLM streams into
+            # an internal handler, and the chunks are forwarded to the provided handler
+            # only after they are checked.
+            if (
+                streaming_handler
+                and self.config.rails.output.streaming.enabled
+                and self.config.rails.output.flows
+            ):
+                llm_streaming_handler = StreamingHandler()
+                output_rails_streaming_task = asyncio.create_task(
+                    self._run_output_rails_in_streaming(
+                        llm_streaming_handler,
+                        streaming_handler,
+                        events=state_events + events,
+                        processing_log=processing_log,
+                    )
+                )
+                streaming_handler_var.set(llm_streaming_handler)
+
             # Compute the new events.
-            new_events = await self.runtime.generate_events(
-                state_events + events, processing_log=processing_log
-            )
+            try:
+                new_events = await self.runtime.generate_events(
+                    state_events + events, processing_log=processing_log
+                )
+            except BaseException:
+                # We stop checking the streamed chunks and close the stream, as the
+                # task may have been cancelled before it started.
+                if output_rails_streaming_task:
+                    output_rails_streaming_task.cancel()
+                    with contextlib.suppress(asyncio.CancelledError):
+                        await output_rails_streaming_task
+                    await streaming_handler.push_chunk(None)
+                raise
             output_state = None
         else:
             # In generation mode, by default the bot response is an instant action.
@@ -711,6 +811,14 @@ class LLMRails:
                     # We just append the event
                     response_events.append(event)
 
+        # If the output rails blocked the streamed message, the response is what was
+        # actually streamed.
+        if output_rails_streaming_task:
+            await llm_streaming_handler.push_chunk(None)
+            blocked, streamed_text = await output_rails_streaming_task
+            if blocked:
+                responses = [streamed_text]
+
         new_message = {"role": "assistant", "content": "\n".join(responses)}
         if response_tool_calls:
             new_message["tool_calls"] = response_tool_calls
@@ -724,8 +832,7 @@ class LLMRails:
             # If a state object is not used, then we use the implicit caching
             if state is None:
                 # Save the new events in the history and update the cache
-                cache_key = get_history_cache_key(messages + [new_message])
-                self.events_history_cache[cache_key] = events
+                self.events_history_cache.set(messages + [new_message], events)
             else:
                 output_state = {"events": events}
 
@@ -758,7 +865,9 @@ class LLMRails:
             if self.config.colang_version == "1.0":
                 # If output variables are specified, we extract their values
                 if options.output_vars:
-                    context = compute_context(events)
+                    context = get_context_snapshot(
+                        events, self.runtime.state_checkpoints
+                    )
                     if isinstance(options.output_vars, list):
                         # If we have only a selection of keys, we filter to only that.
                         res.output_data = {
@@ -847,6 +956,142 @@ class LLMRails:
             else:
                 return new_message
 
+    async def _run_output_rails_in_streaming(
+        self,
+        llm_streaming_handler: StreamingHandler,
+        streaming_handler: StreamingHandler,
+        events: List[dict],
+        processing_log: List[dict],
+    ) -> Tuple[bool, str]:
+        """Checks the streamed chunks with the output rails, before forwarding them.
+
+        The chunks are grouped into windows, and the chunks in a window are forwarded
+        only after the output rails have checked the window. If a window is blocked,
+        the streaming stops, according to the `on_violation` policy. With `error`, a
+        `StreamingViolationError` is raised to the consumer of the stream.
+
+        Args:
+            llm_streaming_handler: The handler in which the LLM streams the chunks.
+            streaming_handler: The handler to which the checked chunks are forwarded.
+            events: The list of events before the generation.
+            processing_log: The processing log of the generation, which records the
+              events as they are processed.
+
+        Returns:
+            Whether the message was blocked, and the text that was forwarded.
+        """
+        streaming_config = self.config.rails.output.streaming
+
+        # The rails themselves must not stream, e.g., the refusal message.
+        streaming_handler_var.set(None)
+
+        rails_events = None
+
+        def _get_rails_events() -> List[dict]:
+            """Gets the events for the output rails, including the user message.
+
+            The chunks are streamed after the input rails, so the user message is the
+            one they produced (e.g., masked), from the last `UserMessage` event.
+            """
+            user_message = None
+            for entry in reversed(processing_log):
+                if entry["type"] == "event" and entry["data"]["type"] == "UserMessage":
+                    user_message = entry["data"]["text"]
+                    break
+            else:
+                for event in reversed(events):
+                    if event["type"] == "UtteranceUserActionFinished":
+                        user_message = event["final_transcript"]
+                        break
+
+            return events + [
+                new_event_dict("ContextUpdate", data={"user_message": user_message})
+            ]
+
+        buffer = ChunkWindowBuffer(
+            window_size=streaming_config.window_size,
+            window_overlap=streaming_config.window_overlap,
+            window_unit=streaming_config.window_unit,
+        )
+        streamed_text = ""
+        violation_error = None
+
+        async def _check_window() -> Optional[str]:
+            """Checks the current window and forwards its chunks, if allowed.
+
+            Returns the text to send instead, if the window was blocked.
+            """
+            nonlocal streamed_text, rails_events, violation_error
+
+            if rails_events is None:
+                rails_events = _get_rails_events()
+
+            window_text = buffer.text
+            result = await self.runtime.run_output_rails(window_text, rails_events)
+
+            triggered_rail = result.context_updates.get("triggered_output_rail")
+            if triggered_rail:
+                log.info(f"The streamed message was blocked by '{triggered_rail}'.")
+
+                if streaming_config.on_violation == "message":
+                    return "".join(
+                        event["script"]
+                        for event in result.events
+                        if event["type"] == "StartUtteranceBotAction"
+                    )
+                elif streaming_config.on_violation == "error":
+                    violation_error = StreamingViolationError(triggered_rail)
+                    return ""
+                else:
+                    return ""
+
+            # If a rail altered the message (e.g., masking), we send the altered text,
+            # without the context, which was already sent.
+            bot_message = result.context_updates.get("bot_message", window_text)
+            if bot_message != window_text:
+                chunks = [buffer.get_rewritten_text(bot_message)]
+                buffer.release()
+            else:
+                chunks = buffer.release()
+
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                streamed_text += chunk
+                await streaming_handler.push_chunk(chunk)
+
+            return None
+
+        blocked = False
+        try:
+            async for chunk in llm_streaming_handler:
+                if buffer.add(chunk):
+                    violation_text = await _check_window()
+                    if violation_text is not None:
+                        blocked = True
+                        break
+
+            # The last window may be incomplete.
+            if not blocked and buffer.chunks:
+                violation_text = await _check_window()
+                blocked = violation_text is not None
+
+            if blocked and violation_text:
+                streamed_text += violation_text
+                await streaming_handler.push_chunk(violation_text)
+
+            if violation_error:
+                await streaming_handler.push_error(violation_error)
+        finally:
+            # The stream is always closed, even if the checking was cancelled.
+            await streaming_handler.push_chunk(None)
+
+        # We consume the rest of the stream, if the message was blocked.
+        if blocked:
+            await llm_streaming_handler.wait()
+
+        return blocked, streamed_text
+
     def stream_async(
         self,
         prompt: Optional[str] = None,
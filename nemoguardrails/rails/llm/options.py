@@ -283,6 +283,14 @@ class GenerationStats(BaseModel):
     llm_calls_total_tokens: Optional[int] = Field(
         default=0, description="The total number of tokens."
     )
+    intent_exact_match_lookups: Optional[int] = Field(
+        default=0,
+        description="The number of user intents looked up in the exact matches of the examples.",
+    )
+    intent_exact_match_hits: Optional[int] = Field(
+        default=0,
+        description="The number of user intents found by an exact match of an example.",
+    )
 
 
 class GenerationLog(BaseModel):
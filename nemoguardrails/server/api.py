@@ -36,7 +36,7 @@ from nemoguardrails.rails.llm.options import (
     GenerationResponse,
 )
 from nemoguardrails.server.datastore.datastore import DataStore
-from nemoguardrails.streaming import StreamingHandler
+from nemoguardrails.streaming import StreamingHandler, StreamingViolationError
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
@@ -272,9 +272,15 @@ def _get_rails(config_ids: List[str]) -> LLMRails:
     llm_rails_instances[configs_cache_key] = llm_rails
 
     # If we have a cache for the events, we restore it
-    llm_rails.events_history_cache = llm_rails_events_history_cache.get(
-        configs_cache_key, {}
-    )
+    if configs_cache_key in llm_rails_events_history_cache:
+        events_history_cache = llm_rails_events_history_cache[configs_cache_key]
+
+        # The limits of the reloaded configuration apply to the restored cache.
+        events_history_cache.max_size_bytes = (
+            llm_rails.events_history_cache.max_size_bytes
+        )
+        events_history_cache.ttl = llm_rails.events_history_cache.ttl
+        llm_rails.events_history_cache = events_history_cache
 
     return llm_rails
 
@@ -371,7 +377,7 @@ async def chat_completion(body: RequestBody, request: Request):
 
             # TODO: Add support for thread_ids in streaming mode
 
-            return StreamingResponse(streaming_handler)
+            return StreamingResponse(_stream_chunks(streaming_handler))
         else:
             res = await llm_rails.generate_async(
                 messages=messages, options=body.options, state=body.state
@@ -406,6 +412,15 @@ async def chat_completion(body: RequestBody, request: Request):
         }
 
 
+async def _stream_chunks(streaming_handler: StreamingHandler):
+    """Streams the chunks, ending the response if an output rail blocked the stream."""
+    try:
+        async for chunk in streaming_handler:
+            yield chunk
+    except StreamingViolationError as ex:
+        log.info(f"The streamed response was stopped: {ex}")
+
+
 # By default, there are no challenges
 challenges = []
 
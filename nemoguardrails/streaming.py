@@ -14,7 +14,9 @@
 # limitations under the License.
 
 import asyncio
+import difflib
 import logging
+import re
 from typing import Any, AsyncIterator, Dict, List, Optional, Union
 from uuid import UUID
 
@@ -28,6 +30,14 @@ from nemoguardrails.utils import new_uuid
 log = logging.getLogger(__name__)
 
 
+class StreamingViolationError(Exception):
+    """Raised to the consumer of a stream blocked by an output rail, with `on_violation: error`."""
+
+    def __init__(self, rail: str):
+        super().__init__(f"Blocked by the '{rail}' output rail.")
+        self.rail = rail
+
+
 class StreamingHandler(AsyncCallbackHandler, AsyncIterator):
     """Streaming async handler.
 
@@ -76,6 +86,9 @@ class StreamingHandler(AsyncCallbackHandler, AsyncIterator):
         # The stop chunks
         self.stop = []
 
+        # The error raised to the consumer at the end of the stream, if any.
+        self.error: Optional[Exception] = None
+
     def set_pattern(self, prefix: Optional[str] = None, suffix: Optional[str] = None):
         """Sets the patter that is expected.
 
@@ -133,6 +146,9 @@ class StreamingHandler(AsyncCallbackHandler, AsyncIterator):
             if "Event loop is closed" not in str(ex):
                 raise ex
         if element is None or element == "":
+            if self.error is not None:
+                error, self.error = self.error, None
+                raise error
             raise StopAsyncIteration
         else:
             return element
@@ -188,6 +204,17 @@ class StreamingHandler(AsyncCallbackHandler, AsyncIterator):
                     self.streaming_finished_event.set()
                     self.top_k_nonempty_lines_event.set()
 
+    async def push_error(self, error: Exception):
+        """Closes the stream with an error.
+
+        The error is raised to the consumer after the chunks pushed before it.
+        """
+        if self.streaming_finished_event.is_set():
+            return
+
+        self.error = error
+        await self.push_chunk(None)
+
     async def push_chunk(
         self, chunk: Union[str, GenerationChunk, AIMessageChunk, None]
     ):
@@ -325,3 +352,107 @@ class StreamingHandler(AsyncCallbackHandler, AsyncIterator):
         # We also reset the prefix/suffix
         self.prefix = None
         self.suffix = None
+
+
+# The end of a sentence, i.e., a punctuation mark followed by whitespace or the end.
+_SENTENCE_END = re.compile(r"[.!?]+(?:\s+|$)")
+
+
+class ChunkWindowBuffer:
+    """Groups the chunks of a stream into windows.
+
+    A window is complete when it contains `window_size` tokens (i.e., streamed chunks)
+    or sentences. When a window is checked, the last `window_overlap` tokens/sentences
+    of the previous windows are also included, as context.
+    """
+
+    def __init__(
+        self,
+        window_size: int = 200,
+        window_overlap: int = 50,
+        window_unit: str = "tokens",
+    ):
+        if window_unit not in ["tokens", "sentences"]:
+            raise ValueError(f"Unsupported window unit: {window_unit}")
+
+        self.window_size = window_size
+        self.window_overlap = window_overlap
+        self.window_unit = window_unit
+
+        # The chunks of the current window.
+        self.chunks: List[str] = []
+
+        # The chunks from the previous windows that are used as context.
+        self.context_chunks: List[str] = []
+
+    def _count(self, chunks: List[str]) -> int:
+        """Counts the number of tokens/sentences in a list of chunks."""
+        if self.window_unit == "tokens":
+            return len(chunks)
+        else:
+            return len(_SENTENCE_END.findall("".join(chunks)))
+
+    @property
+    def context_text(self) -> str:
+        """The text from the previous windows that is used as context."""
+        return "".join(self.context_chunks)
+
+    @property
+    def text(self) -> str:
+        """The text of the current window, including the context."""
+        return "".join(self.context_chunks + self.chunks)
+
+    def get_rewritten_text(self, rewritten_text: str) -> str:
+        """Returns the part of a rewritten window that belongs to the current window.
+
+        When a rail alters the text of a window (e.g., masking), the context part may
+        also be altered. Because the context was already sent with the previous
+        windows, only the part corresponding to the new chunks is returned.
+        """
+        context_text = self.context_text
+        if rewritten_text.startswith(context_text):
+            return rewritten_text[len(context_text) :]
+
+        # Otherwise, we align the rewritten text with the original one.
+        start = len(context_text)
+        matcher = difflib.SequenceMatcher(
+            None, self.text, rewritten_text, autojunk=False
+        )
+        for tag, i1, i2, j1, _ in matcher.get_opcodes():
+            if tag == "equal":
+                if i2 > start:
+                    return rewritten_text[j1 + max(0, start - i1) :]
+            elif i2 > start or (tag == "insert" and i1 == start):
+                return rewritten_text[j1:]
+
+        return ""
+
+    def add(self, chunk: str) -> bool:
+        """Adds a chunk to the current window.
+
+        Returns:
+            True if the window is complete.
+        """
+        self.chunks.append(chunk)
+        return self._count(self.chunks) >= self.window_size
+
+    def release(self) -> List[str]:
+        """Ends the current window and returns its chunks."""
+        chunks = self.chunks
+        self.chunks = []
+
+        # We only keep as context the last `window_overlap` tokens/sentences.
+        self.context_chunks.extend(chunks)
+        if self.window_unit == "tokens":
+            if self.window_overlap > 0:
+                self.context_chunks = self.context_chunks[-self.window_overlap :]
+            else:
+                self.context_chunks = []
+        else:
+            text = "".join(self.context_chunks)
+            ends = [m.end() for m in _SENTENCE_END.finditer(text)]
+            if len(ends) > self.window_overlap:
+                text = text[ends[-self.window_overlap - 1] :]
+            self.context_chunks = [text] if text else []
+
+        return chunks
@@ -15,14 +15,17 @@
 import asyncio
 import dataclasses
 import importlib.resources as pkg_resources
+import itertools
 import json
 import os
 import random
+import threading
+import time
 import uuid
 from collections import namedtuple
 from datetime import datetime, timezone
 from enum import Enum
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, Optional, Tuple
 
 import yaml
 from rich.console import Console
@@ -39,6 +42,9 @@ def init_random_seed(seed: int) -> None:
     random.seed(seed)
     secure_random = random
 
+    # The event uids must also be predictable.
+    _reset_event_uids()
+
 
 def new_uuid() -> str:
     """Helper to generate new UUID v4.
@@ -50,6 +56,71 @@ def new_uuid() -> str:
     return str(uuid.UUID(int=random_bits, version=4))
 
 
+_event_uid_prefix: str = ""
+_event_uid_counter = itertools.count()
+
+
+def _reset_event_uids() -> None:
+    """Picks a new random prefix for the event uids and restarts the counter."""
+    global _event_uid_prefix, _event_uid_counter
+    _event_uid_prefix = new_uuid()[0:23]
+    _event_uid_counter = itertools.count()
+
+
+_reset_event_uids()
+
+# A forked process must not generate the same uids as its parent.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_event_uids)
+
+
+def new_event_uid() -> str:
+    """Helper to generate a new uid for an event.
+
+    The uids have the UUID format, and are made of a random prefix, chosen once per
+    process, and a monotonic counter. This is much cheaper than `new_uuid`, and is
+    used for the events, which are created on the hot path of the runtimes.
+    """
+    return f"{_event_uid_prefix}-{next(_event_uid_counter):012x}"
+
+
+# The date and time part of the current second, cached per thread.
+_timestamp_cache = threading.local()
+
+
+def get_timestamp() -> str:
+    """Returns the current UTC time in ISO format.
+
+    The result is the same as `datetime.now(timezone.utc).isoformat()`, but the date
+    and time part is formatted only once per second, in each thread.
+    """
+    now = time.time()
+    second = int(now)
+    if getattr(_timestamp_cache, "second", None) != second:
+        _timestamp_cache.prefix = datetime.fromtimestamp(second, timezone.utc).strftime(
+            "%Y-%m-%dT%H:%M:%S"
+        )
+        _timestamp_cache.second = second
+    prefix = _timestamp_cache.prefix
+
+    microsecond = int((now - second) * 1_000_000)
+    if microsecond:
+        return f"{prefix}.{microsecond:06d}+00:00"
+    else:
+        return f"{prefix}+00:00"
+
+
+# Whether the events created with `new_event_dict` are validated. This is meant for
+# tests and debugging, and it is enabled through the DEBUG_MODE environment variable.
+_validate_events = bool(os.environ.get("DEBUG_MODE"))
+
+
+def set_event_validation(enabled: bool) -> None:
+    """Enables or disables the validation of the events created with `new_event_dict`."""
+    global _validate_events
+    _validate_events = enabled
+
+
 # Very basic event validation - will be replaced by validation based on pydantic models
 Property = namedtuple("Property", ["name", "type"])
 Validator = namedtuple("Validator", ["description", "function"])
@@ -133,27 +204,44 @@ _action_to_modality_info: Dict[str, Tuple[str, str]] = {
 }
 
 
+# The modality information for each event type, computed on first use.
+_event_type_to_modality_info: Dict[str, Optional[Tuple[str, str]]] = {}
+
+
+def _get_modality_info(event_type: str) -> Optional[Tuple[str, str]]:
+    """Returns the modality information for an event type, if any."""
+    if event_type not in _event_type_to_modality_info:
+        _modality_info = None
+        for action_name, modality_info in _action_to_modality_info.items():
+            if action_name in event_type:
+                _modality_info = modality_info
+
+        _event_type_to_modality_info[event_type] = _modality_info
+
+    return _event_type_to_modality_info[event_type]
+
+
 def _add_modality_info(event_dict: Dict[str, Any]) -> None:
     """Add modality related information to the action event"""
-    for action_name, modality_info in _action_to_modality_info.items():
+    modality_info = _get_modality_info(event_dict["type"])
+    if modality_info:
         modality_name, modality_policy = modality_info
-        if action_name in event_dict["type"]:
-            event_dict["action_info_modality"] = modality_name
-            event_dict["action_info_modality_policy"] = modality_policy
+        event_dict["action_info_modality"] = modality_name
+        event_dict["action_info_modality_policy"] = modality_policy
 
 
 def _update_action_properties(event_dict: Dict[str, Any]) -> None:
     """Update action related even properties and ensure UMIM compliance (very basic)"""
 
     if "Started" in event_dict["type"]:
-        event_dict["action_started_at"] = datetime.now(timezone.utc).isoformat()
+        event_dict["action_started_at"] = get_timestamp()
     elif "Start" in event_dict["type"]:
         if "action_uid" not in event_dict:
-            event_dict["action_uid"] = new_uuid()
+            event_dict["action_uid"] = new_event_uid()
     elif "Updated" in event_dict["type"]:
-        event_dict["action_updated_at"] = datetime.now(timezone.utc).isoformat()
+        event_dict["action_updated_at"] = get_timestamp()
     elif "Finished" in event_dict["type"]:
-        event_dict["action_finished_at"] = datetime.now(timezone.utc).isoformat()
+        event_dict["action_finished_at"] = get_timestamp()
         if (
             "is_success" in event_dict
             and event_dict["is_success"]
@@ -177,22 +265,25 @@ def is_valid_event(event: Dict[str, Any]) -> bool:
 
 
 def new_event_dict(event_type: str, **payload) -> Dict[str, Any]:
-    """Helper to create a generic event structure."""
+    """Helper to create a generic event structure.
 
+    The event is validated only if the validation is enabled, see `set_event_validation`.
+    """
     event: Dict[str, Any] = {
         "type": event_type,
-        "uid": new_uuid(),
-        "event_created_at": datetime.now(timezone.utc).isoformat(),
+        "uid": new_event_uid(),
+        "event_created_at": get_timestamp(),
         "source_uid": "NeMoGuardrails",
     }
-
-    event = {**event, **payload}
+    event.update(payload)
 
     if "Action" in event_type:
         _add_modality_info(event)
         _update_action_properties(event)
 
-    ensure_valid_event(event)
+    if _validate_events:
+        ensure_valid_event(event)
+
     return event
 
 
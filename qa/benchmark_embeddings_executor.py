@@ -0,0 +1,142 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of the throughput of the embeddings executor against the number of workers.
+
+It computes the embeddings of short texts with concurrent requests, using the default
+executor of asyncio, and thread and process pools with an increasing number of workers.
+
+Usage:
+
+    python qa/benchmark_embeddings_executor.py --workers 1 2 4 --num-threads 1
+"""
+import argparse
+import asyncio
+import time
+from typing import List, Optional
+
+from nemoguardrails.embeddings.providers import init_embedding_model
+from nemoguardrails.embeddings.providers.executor import (
+    create_embeddings_executor,
+    set_embeddings_executor,
+    set_num_threads,
+)
+from nemoguardrails.rails.llm.config import EmbeddingsExecutorConfig
+
+
+async def benchmark_executor(
+    model, num_requests: int, batch_size: int, concurrency: int
+) -> float:
+    """Returns the number of texts per second embedded with concurrent requests."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def request(i: int):
+        async with semaphore:
+            texts = [
+                f"request {i} text {j}: how can I help you?" for j in range(batch_size)
+            ]
+            await model.encode_async(texts)
+
+    # Warm-up, e.g., to start the workers and load the model in them.
+    await asyncio.gather(*[request(i) for i in range(concurrency)])
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[request(i) for i in range(num_requests)])
+    return num_requests * batch_size / (time.perf_counter() - t0)
+
+
+async def main(
+    embedding_engine: str,
+    embedding_model: str,
+    workers: List[int],
+    num_threads: Optional[int],
+    num_requests: int,
+    batch_size: int,
+    concurrency: int,
+):
+    set_num_threads(num_threads)
+    model = init_embedding_model(
+        embedding_model=embedding_model, embedding_engine=embedding_engine
+    )
+
+    configs = [EmbeddingsExecutorConfig(type="default", num_threads=num_threads)]
+    for executor_type in ["thread", "process"]:
+        for max_workers in workers:
+            configs.append(
+                EmbeddingsExecutorConfig(
+                    type=executor_type, max_workers=max_workers, num_threads=num_threads
+                )
+            )
+
+    print(f"{'executor':>10} {'workers':>8} {'texts/s':>10}")
+    for config in configs:
+        executor = create_embeddings_executor(
+            config, models=[(type(model), model.embedding_model)]
+        )
+        set_embeddings_executor(executor)
+        try:
+            throughput = await benchmark_executor(
+                model, num_requests, batch_size, concurrency
+            )
+        finally:
+            set_embeddings_executor(None)
+            if executor is not None:
+                executor.shutdown()
+
+        max_workers = config.max_workers if config.type != "default" else "-"
+        print(f"{config.type:>10} {max_workers:>8} {throughput:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--engine", default="FastEmbed", help="The embedding engine.")
+    parser.add_argument(
+        "--model", default="all-MiniLM-L6-v2", help="The embedding model."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4],
+        help="The numbers of workers of the thread and process pools.",
+    )
+    parser.add_argument(
+        "--num-threads",
+        type=int,
+        default=None,
+        help="The number of intra-op threads of the model.",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=200, help="The number of requests to run."
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=8, help="The number of texts per request."
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=16, help="The number of concurrent requests."
+    )
+    args = parser.parse_args()
+
+    asyncio.run(
+        main(
+            args.engine,
+            args.model,
+            args.workers,
+            args.num_threads,
+            args.requests,
+            args.batch_size,
+            args.concurrency,
+        )
+    )
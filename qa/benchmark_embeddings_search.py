@@ -0,0 +1,186 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of the embedding search providers.
+
+It compares the Annoy index (`default`) with the exact search index (`exact`), for
+the build time, the query latency (p50/p99) and the recall@k against exact search.
+The embeddings are synthetic, clustered vectors, so that no embedding model is needed.
+
+With `--autotune`, an Annoy index whose number of trees and `search_k` are chosen to
+meet `--target-recall` is benchmarked as well.
+
+Usage:
+
+    python qa/benchmark_embeddings_search.py --sizes 1000 10000 100000
+    python qa/benchmark_embeddings_search.py --autotune --target-recall 0.95
+"""
+import argparse
+import asyncio
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from nemoguardrails.embeddings.basic import BasicEmbeddingsIndex
+from nemoguardrails.embeddings.exact import ExactEmbeddingsIndex
+from nemoguardrails.embeddings.index import IndexItem
+from nemoguardrails.embeddings.providers.base import EmbeddingModel
+
+
+class PrecomputedEmbeddingModel(EmbeddingModel):
+    """Embedding model returning precomputed vectors, indexed by the text."""
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    async def encode_async(self, documents: List[str]) -> List[List[float]]:
+        return self.encode(documents)
+
+    def encode(self, documents: List[str]) -> List[List[float]]:
+        return [self.vectors[int(doc)].tolist() for doc in documents]
+
+
+def generate_vectors(
+    num_items: int, num_queries: int, dim: int, seed: int = 0
+) -> np.ndarray:
+    """Generates clustered vectors, the last `num_queries` being used as queries."""
+    rng = np.random.default_rng(seed)
+    num_clusters = max(1, num_items // 50)
+    centers = rng.normal(size=(num_clusters, dim))
+    labels = rng.integers(0, num_clusters, size=num_items + num_queries)
+    vectors = centers[labels] + 0.5 * rng.normal(size=(num_items + num_queries, dim))
+    return vectors.astype(np.float32)
+
+
+async def benchmark_index(
+    index, vectors: np.ndarray, num_items: int, k: int
+) -> Dict[str, float]:
+    """Builds the index and runs the queries, returning the stats and the results."""
+    index._model = PrecomputedEmbeddingModel(vectors)
+
+    # The embeddings are computed before, so that only the build is measured.
+    await index.add_items([IndexItem(text=str(i)) for i in range(num_items)])
+
+    t0 = time.perf_counter()
+    await index.build()
+    build_time = time.perf_counter() - t0
+
+    latencies = []
+    results = []
+    for i in range(num_items, len(vectors)):
+        t0 = time.perf_counter()
+        items = await index.search(str(i), max_results=k)
+        latencies.append(time.perf_counter() - t0)
+        results.append({int(item.text) for item in items})
+
+    return {
+        "build_time": build_time,
+        "p50": float(np.percentile(latencies, 50)),
+        "p99": float(np.percentile(latencies, 99)),
+        "results": results,
+    }
+
+
+def compute_recall(results: List[set], expected: List[set]) -> float:
+    """Computes the average recall of the results against the expected results."""
+    return float(np.mean([len(r & e) / len(e) for r, e in zip(results, expected) if e]))
+
+
+async def main(
+    sizes: List[int],
+    num_queries: int,
+    dim: int,
+    k: int,
+    autotune: bool = False,
+    target_recall: float = 0.95,
+):
+    print(
+        f"{'items':>8} {'index':>8} {'build (s)':>10} {'p50 (ms)':>9} "
+        f"{'p99 (ms)':>9} {f'recall@{k}':>10} {'trees':>6} {'search_k':>9}"
+    )
+    for num_items in sizes:
+        vectors = generate_vectors(num_items, num_queries, dim)
+
+        indexes = [
+            ("exact", ExactEmbeddingsIndex()),
+            ("annoy", BasicEmbeddingsIndex()),
+        ]
+        if autotune:
+            indexes.append(
+                (
+                    "tuned",
+                    BasicEmbeddingsIndex(autotune=True, target_recall=target_recall),
+                )
+            )
+
+        all_stats = {}
+        for name, index in indexes:
+            all_stats[name] = await benchmark_index(index, vectors, num_items, k)
+
+        for name, index in indexes:
+            stats = all_stats[name]
+            recall = compute_recall(stats["results"], all_stats["exact"]["results"])
+            n_trees, search_k = (
+                ("-", "-") if name == "exact" else (index.n_trees, index.search_k)
+            )
+            print(
+                f"{num_items:>8} {name:>8} {stats['build_time']:>10.3f} "
+                f"{1000 * stats['p50']:>9.3f} {1000 * stats['p99']:>9.3f} "
+                f"{recall:>10.3f} {n_trees:>6} {search_k:>9}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 100000],
+        help="The number of items in the index.",
+    )
+    parser.add_argument(
+        "--queries", type=int, default=200, help="The number of queries to run."
+    )
+    parser.add_argument(
+        "--dim", type=int, default=384, help="The size of the embeddings."
+    )
+    parser.add_argument(
+        "--k", type=int, default=10, help="The number of results for each query."
+    )
+    parser.add_argument(
+        "--autotune",
+        action="store_true",
+        help="Also benchmark an autotuned Annoy index.",
+    )
+    parser.add_argument(
+        "--target-recall",
+        type=float,
+        default=0.95,
+        help="The target recall of the autotuning.",
+    )
+    args = parser.parse_args()
+
+    asyncio.run(
+        main(
+            args.sizes,
+            args.queries,
+            args.dim,
+            args.k,
+            autotune=args.autotune,
+            target_recall=args.target_recall,
+        )
+    )
@@ -0,0 +1,196 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Micro-benchmark for the creation of events.
+
+It reports the number of events per second for the `new_event_dict` factory alone,
+and for the Colang 1.0 and 2.x runtimes, both with the current event factory and with
+the previous one (random UUIDs, `datetime.isoformat` timestamps and validation of
+every event).
+
+Usage:
+
+    python qa/benchmark_events.py --iterations 1000
+"""
+import argparse
+import asyncio
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from typing import Any, Dict
+
+from langchain_community.llms import FakeListLLM
+
+from nemoguardrails import LLMRails, RailsConfig, utils
+from nemoguardrails.utils import (
+    _action_to_modality_info,
+    ensure_valid_event,
+    new_event_dict,
+    new_uuid,
+)
+
+COLANG_1_0_CONFIG = RailsConfig.from_content(
+    """
+    define user express greeting
+      "hi"
+
+    define flow
+      user express greeting
+      bot express greeting
+      bot ask how are you
+
+    define bot express greeting
+      "Hello!"
+
+    define bot ask how are you
+      "How are you?"
+    """
+)
+
+COLANG_2_X_CONFIG = RailsConfig.from_content(
+    """
+    import core
+
+    flow main
+      user said "hi"
+      bot say "Hello!"
+    """,
+    """
+    colang_version: "2.x"
+    """,
+)
+
+
+def legacy_new_event_dict(event_type: str, **payload) -> Dict[str, Any]:
+    """The event factory before the optimization, used as the baseline."""
+    event: Dict[str, Any] = {
+        "type": event_type,
+        "uid": new_uuid(),
+        "event_created_at": datetime.now(timezone.utc).isoformat(),
+        "source_uid": "NeMoGuardrails",
+    }
+
+    event = {**event, **payload}
+
+    if "Action" in event_type:
+        for action_name, modality_info in _action_to_modality_info.items():
+            modality_name, modality_policy = modality_info
+            if action_name in event["type"]:
+                event["action_info_modality"] = modality_name
+                event["action_info_modality_policy"] = modality_policy
+
+        if "Started" in event_type:
+            event["action_started_at"] = datetime.now(timezone.utc).isoformat()
+        elif "Start" in event_type:
+            if "action_uid" not in event:
+                event["action_uid"] = new_uuid()
+        elif "Updated" in event_type:
+            event["action_updated_at"] = datetime.now(timezone.utc).isoformat()
+        elif "Finished" in event_type:
+            event["action_finished_at"] = datetime.now(timezone.utc).isoformat()
+            if event.get("is_success") and "failure_reason" in event:
+                del event["failure_reason"]
+
+    ensure_valid_event(event)
+    return event
+
+
+@contextmanager
+def legacy_event_factory():
+    """Replaces `new_event_dict` with the legacy factory in all the loaded modules."""
+    patched_modules = [
+        module
+        for name, module in list(sys.modules.items())
+        if name.startswith("nemoguardrails")
+        and getattr(module, "new_event_dict", None) is new_event_dict
+    ]
+    for module in patched_modules:
+        module.new_event_dict = legacy_new_event_dict
+    try:
+        yield
+    finally:
+        for module in patched_modules:
+            module.new_event_dict = new_event_dict
+
+
+def benchmark_factory(iterations: int) -> float:
+    """Returns the number of events per second created by `utils.new_event_dict`."""
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        utils.new_event_dict("UserIntent", intent="express greeting")
+        utils.new_event_dict("StartUtteranceBotAction", script="Hello!")
+    return 2 * iterations / (time.perf_counter() - t0)
+
+
+async def benchmark_colang_1_0(rails: LLMRails, iterations: int) -> float:
+    """Returns the number of events per second generated by the Colang 1.0 runtime."""
+    num_events = 0
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        events = [{"type": "UserIntent", "intent": "express greeting"}]
+        new_events = await rails.runtime.generate_events(events)
+        num_events += len(events) + len(new_events)
+    return num_events / (time.perf_counter() - t0)
+
+
+async def benchmark_colang_2_x(rails: LLMRails, iterations: int) -> float:
+    """Returns the number of events per second processed by the Colang 2.x runtime."""
+    num_events = 0
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        events = [{"type": "UtteranceUserActionFinished", "final_transcript": "hi"}]
+        output_events, _ = await rails.runtime.process_events(
+            events=events, state={}, blocking=True
+        )
+        num_events += len(events) + len(output_events)
+    return num_events / (time.perf_counter() - t0)
+
+
+async def main(iterations: int):
+    llm = FakeListLLM(responses=[""])
+    rails_1_0 = LLMRails(config=COLANG_1_0_CONFIG, llm=llm)
+    rails_2_x = LLMRails(config=COLANG_2_X_CONFIG, llm=llm)
+
+    # Warm-up, e.g., for the caches of the runtimes.
+    await benchmark_colang_1_0(rails_1_0, 10)
+    await benchmark_colang_2_x(rails_2_x, 10)
+
+    results = {}
+    for name, factory in [
+        ("before", legacy_event_factory),
+        ("after", nullcontext),
+    ]:
+        with factory():
+            results[name] = [
+                benchmark_factory(iterations * 10),
+                await benchmark_colang_1_0(rails_1_0, iterations),
+                await benchmark_colang_2_x(rails_2_x, iterations),
+            ]
+
+    print(f"{'':<16}{'before':>14}{'after':>14}{'speedup':>10}")
+    for i, name in enumerate(["new_event_dict", "Colang 1.0", "Colang 2.x"]):
+        before, after = results["before"][i], results["after"][i]
+        print(f"{name:<16}{before:>10.0f} e/s{after:>10.0f} e/s{after / before:>9.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--iterations", type=int, default=1000, help="The number of turns to run."
+    )
+    args = parser.parse_args()
+
+    asyncio.run(main(args.iterations))
@@ -0,0 +1,114 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+import numpy as np
+import pytest
+
+from nemoguardrails.embeddings.autotune import (
+    RecallEvaluator,
+    autotune_annoy_index,
+    build_annoy_index,
+    get_search_k,
+)
+from nemoguardrails.embeddings.basic import BasicEmbeddingsIndex
+from nemoguardrails.embeddings.index import IndexItem
+
+
+def _random_vectors(num_items: int, dim: int = 16):
+    return np.random.default_rng(0).normal(size=(num_items, dim)).tolist()
+
+
+def test_autotune_meets_target_recall():
+    vectors = _random_vectors(2000)
+    positions = list(range(len(vectors)))
+
+    default_recall = RecallEvaluator(positions, vectors).recall(
+        build_annoy_index(positions, vectors, n_trees=10)
+    )
+    index, tuning = autotune_annoy_index(positions, vectors, target_recall=0.99)
+
+    assert tuning.recall >= 0.99 > default_recall
+    assert index.get_n_trees() == tuning.n_trees
+    assert RecallEvaluator(positions, vectors).recall(index, tuning.search_k) >= 0.99
+
+
+def test_get_search_k():
+    assert get_search_k(-1, n_trees=10, max_results=5) == -1
+    assert get_search_k(1000, n_trees=10, max_results=5) == 1000
+    assert get_search_k(1000, n_trees=10, max_results=500) == 5000
+
+
+@pytest.mark.asyncio
+async def test_tuning_is_persisted(tmp_path):
+    vectors = _random_vectors(500)
+
+    index = BasicEmbeddingsIndex(autotune=True, target_recall=0.99)
+    index._embeddings = vectors
+    index._items = [IndexItem(text=str(i)) for i in range(len(vectors))]
+    index._embedding_size = len(vectors[0])
+    await index.build()
+
+    path = str(tmp_path / "index")
+    await index.save(path)
+    with open(f"{path}.tuning.json") as f:
+        assert json.load(f)["search_k"] == index.search_k
+
+    loaded_index = BasicEmbeddingsIndex()
+    assert await loaded_index.load(path)
+    assert (loaded_index.n_trees, loaded_index.search_k) == (
+        index.n_trees,
+        index.search_k,
+    )
+
+
+@pytest.mark.asyncio
+async def test_tuning_is_set_with_merged_index():
+    vectors = _random_vectors(500)
+
+    index = BasicEmbeddingsIndex(autotune=True, target_recall=0.99)
+    index._embeddings = vectors
+    index._items = [IndexItem(text=str(i)) for i in range(len(vectors))]
+    index._embedding_size = len(vectors[0])
+
+    # Building the index, possibly in an executor thread, does not change the index.
+    _, tuning = index._build_index(*index._get_build_input())
+    assert tuning is not None
+    assert index._tuning is None and index.n_trees == 10
+
+    await index.merge()
+    tuning = index._tuning
+    assert (index.n_trees, index.search_k) == (tuning.n_trees, tuning.search_k)
+    assert index.embeddings_index.get_n_trees() == tuning.n_trees
+
+
+@pytest.mark.asyncio
+async def test_stale_tuning_is_removed(tmp_path):
+    vectors = _random_vectors(500)
+    path = str(tmp_path / "index")
+
+    for autotune in [True, False]:
+        index = BasicEmbeddingsIndex(autotune=autotune, target_recall=0.99)
+        index._embeddings = vectors
+        index._items = [IndexItem(text=str(i)) for i in range(len(vectors))]
+        index._embedding_size = len(vectors[0])
+        await index.build()
+        await index.save(path)
+
+    # The tuning of the previous index is not loaded with the new one.
+    loaded_index = BasicEmbeddingsIndex()
+    assert await loaded_index.load(path)
+    assert loaded_index._tuning is None
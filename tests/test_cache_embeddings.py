@@ -13,14 +13,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import gc
+import os
 import tempfile
 import unittest
 from typing import List
-from unittest.mock import MagicMock, Mock, patch
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
 
 import pytest
 
 from nemoguardrails.embeddings.cache import (
+    BinaryCacheStore,
     CacheStore,
     EmbeddingsCache,
     FilesystemCacheStore,
@@ -74,17 +78,263 @@ def test_filesystem_cache_store():
         assert cache.get("key") is None
 
 
+def test_binary_cache_store(tmp_path):
+    cache = BinaryCacheStore(cache_dir=str(tmp_path))
+    cache.set("key", [0.5, 0.25])
+    assert cache.get("key") == [0.5, 0.25]
+    assert cache.get("missing") is None
+
+    # The cache is persisted and reloaded from the data file.
+    cache.mset(["a", "b"], [[1.0, 2.0], [3.0, 4.0]])
+    cache = BinaryCacheStore(cache_dir=str(tmp_path))
+    assert cache.mget(["b", "key", "c"]) == [[3.0, 4.0], [0.5, 0.25], None]
+
+    cache.clear()
+    assert cache.get("key") is None
+    assert BinaryCacheStore(cache_dir=str(tmp_path)).get("a") is None
+
+
+def test_binary_cache_store_float16(tmp_path):
+    cache = BinaryCacheStore(cache_dir=str(tmp_path), dtype="float16")
+    cache.set("key", [0.1, 1.0])
+
+    value = cache.get("key")
+    assert value[1] == 1.0
+    assert abs(value[0] - 0.1) < 1e-3
+
+
+def test_binary_cache_store_compact(tmp_path):
+    cache = BinaryCacheStore(cache_dir=str(tmp_path))
+    for i in range(10):
+        cache.mset(["a", "b"], [[float(i)] * 4, [float(-i)] * 4])
+
+    path = tmp_path / "embeddings.float32.bin"
+    size = path.stat().st_size
+    cache.compact()
+
+    assert path.stat().st_size < size / 5
+    assert cache.mget(["a", "b"]) == [[9.0] * 4, [-9.0] * 4]
+    assert BinaryCacheStore(cache_dir=str(tmp_path)).get("a") == [9.0] * 4
+
+
+def test_binary_cache_store_incomplete_record(tmp_path):
+    cache = BinaryCacheStore(cache_dir=str(tmp_path))
+    cache.mset(["a", "b"], [[1.0, 2.0], [3.0, 4.0]])
+
+    # Simulate a crash in the middle of the last append.
+    path = tmp_path / "embeddings.float32.bin"
+    os.truncate(path, path.stat().st_size - 2)
+
+    cache = BinaryCacheStore(cache_dir=str(tmp_path))
+    assert cache.mget(["a", "b"]) == [[1.0, 2.0], None]
+
+    # The incomplete record is discarded, so new records can be appended.
+    cache.set("c", [5.0])
+    assert BinaryCacheStore(cache_dir=str(tmp_path)).mget(["a", "c"]) == [
+        [1.0, 2.0],
+        [5.0],
+    ]
+
+
+def test_binary_cache_store_shared_data_file(tmp_path):
+    cache_1 = BinaryCacheStore(cache_dir=str(tmp_path))
+    cache_2 = BinaryCacheStore(cache_dir=str(tmp_path))
+
+    cache_1.set("a", [1.0])
+    assert cache_2.get("a") == [1.0]
+
+
+def test_binary_cache_store_append_in_progress(tmp_path):
+    cache = BinaryCacheStore(cache_dir=str(tmp_path))
+    cache.set("a", [1.0])
+
+    # Another process is in the middle of an append.
+    path = tmp_path / "embeddings.float32.bin"
+    records = cache._encode_records(["b"], [[2.0, 3.0]])
+    with open(path, "ab") as file:
+        file.write(records[:-2])
+
+    # The incomplete record is skipped, but not removed.
+    assert cache.mget(["a", "b"]) == [[1.0], None]
+    with open(path, "ab") as file:
+        file.write(records[-2:])
+
+    assert cache.mget(["a", "b"]) == [[1.0], [2.0, 3.0]]
+
+
+def test_binary_cache_store_compacted_by_another_store(tmp_path):
+    cache_1 = BinaryCacheStore(cache_dir=str(tmp_path))
+    cache_2 = BinaryCacheStore(cache_dir=str(tmp_path))
+    cache_1.mset(["a", "a"], [[1.0], [2.0]])
+    assert cache_1.get("a") == [2.0]
+
+    # The compacted data file ends up larger than the one indexed by the first store.
+    cache_2.compact()
+    cache_2.mset(["b", "c"], [[3.0, 4.0], [5.0, 6.0]])
+
+    assert cache_1.mget(["a", "b", "c"]) == [[2.0], [3.0, 4.0], [5.0, 6.0]]
+
+    cache_2.clear()
+    cache_2.set("a", [7.0, 8.0, 9.0, 10.0])
+    assert cache_1.mget(["a", "b"]) == [[7.0, 8.0, 9.0, 10.0], None]
+
+
 def test_redis_cache_store():
     pytest.importorskip("redis")
     mock_redis = MagicMock()
     cache = RedisCacheStore()
     cache._redis = mock_redis
     cache.set("key", "value")
-    mock_redis.set.assert_called_once_with("key", "value")
-    cache.get("key")
-    mock_redis.get.assert_called_once_with("key")
+    mock_redis.set.assert_called_once_with("nemoguardrails:embeddings:key", '"value"')
+    mock_redis.get.return_value = '"value"'
+    assert cache.get("key") == "value"
+    mock_redis.get.assert_called_once_with("nemoguardrails:embeddings:key")
+
+    # Only the keys of the cache are deleted.
+    mock_redis.scan_iter.return_value = iter(["nemoguardrails:embeddings:key"])
     cache.clear()
-    mock_redis.flushall.assert_called_once()
+    mock_redis.scan_iter.assert_called_once_with(
+        match="nemoguardrails:embeddings:*", count=1000
+    )
+    mock_redis.delete.assert_called_once_with("nemoguardrails:embeddings:key")
+    mock_redis.flushall.assert_not_called()
+
+
+def test_redis_cache_store_mget_mset():
+    pytest.importorskip("redis")
+    mock_redis = MagicMock()
+    cache = RedisCacheStore(key_prefix="")
+    cache._redis = mock_redis
+
+    cache.mset(["a", "b"], [[0.1], [0.2]])
+    mock_redis.mset.assert_called_once_with({"a": "[0.1]", "b": "[0.2]"})
+
+    mock_redis.mget.return_value = ["[0.1]", None]
+    assert cache.mget(["a", "c"]) == [[0.1], None]
+    mock_redis.mget.assert_called_once_with(["a", "c"])
+
+
+@pytest.mark.asyncio
+async def test_redis_cache_store_async():
+    pytest.importorskip("redis")
+    mock_redis = MagicMock()
+    mock_redis.mset = AsyncMock()
+    mock_redis.mget = AsyncMock(return_value=["[0.1]", None])
+    cache = RedisCacheStore(key_prefix="test:")
+
+    with patch("redis.asyncio.Redis", return_value=mock_redis) as mock_redis_cls:
+        await cache.mset_async(["a"], [[0.1]])
+        mock_redis.mset.assert_called_once_with({"test:a": "[0.1]"})
+
+        assert await cache.mget_async(["a", "b"]) == [[0.1], None]
+        mock_redis.mget.assert_called_once_with(["test:a", "test:b"])
+
+        # The async client is created once and reused.
+        mock_redis_cls.assert_called_once_with(host="localhost", port=6379, db=0)
+
+
+def test_redis_cache_store_async_client_per_loop():
+    pytest.importorskip("redis")
+    cache = RedisCacheStore()
+
+    async def _get_client():
+        return cache._get_async_redis()
+
+    with patch("redis.asyncio.Redis", side_effect=lambda **kwargs: MagicMock()):
+        loop = asyncio.new_event_loop()
+        client = loop.run_until_complete(_get_client())
+        assert loop.run_until_complete(_get_client()) is client
+
+        # Another event loop gets its own client, and the clients of the event loops
+        # which are gone are dropped.
+        assert asyncio.run(_get_client()) is not client
+        loop.close()
+        del loop
+        gc.collect()
+        assert len(cache._async_redis_clients) == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "store_cls", [InMemoryCacheStore, FilesystemCacheStore, BinaryCacheStore]
+)
+async def test_cache_store_async(store_cls, tmp_path):
+    if store_cls in (FilesystemCacheStore, BinaryCacheStore):
+        cache = store_cls(cache_dir=str(tmp_path))
+    else:
+        cache = store_cls()
+
+    await cache.mset_async(["a", "b"], [[0.5], [0.25]])
+    assert await cache.mget_async(["b", "c", "a"]) == [[0.25], None, [0.5]]
+
+    await cache.clear_async()
+    assert await cache.mget_async(["a", "b"]) == [None, None]
+
+
+@pytest.mark.parametrize(
+    "store_cls", [InMemoryCacheStore, FilesystemCacheStore, BinaryCacheStore]
+)
+def test_cache_store_mget_mset(store_cls, tmp_path):
+    if store_cls in (FilesystemCacheStore, BinaryCacheStore):
+        cache = store_cls(cache_dir=str(tmp_path))
+    else:
+        cache = store_cls()
+
+    cache.mset(["a", "b"], [[0.5, 0.25], [0.125, 1.0]])
+
+    assert cache.mget(["b", "c", "a"]) == [[0.125, 1.0], None, [0.5, 0.25]]
+    assert cache.mget([]) == []
+
+
+def test_embeddings_cache_batched_operations():
+    cache_store = InMemoryCacheStore()
+    cache_store.mget = Mock(wraps=cache_store.mget)
+    cache_store.mset = Mock(wraps=cache_store.mset)
+    cache = EmbeddingsCache(key_generator=MD5KeyGenerator(), cache_store=cache_store)
+
+    cache.set(["a", "b"], [[0.1], [0.2]])
+    cache_store.mset.assert_called_once()
+
+    assert cache.get(["a", "c", "b", "a"]) == {"a": [0.1], "b": [0.2]}
+
+    # The duplicate texts are fetched once, in a single call.
+    cache_store.mget.assert_called_once()
+    assert len(cache_store.mget.call_args[0][0]) == 3
+
+
+def test_embeddings_cache_hit_rate(caplog):
+    cache = EmbeddingsCache(
+        key_generator=MD5KeyGenerator(), cache_store=InMemoryCacheStore()
+    )
+    cache.set(["a"], [[0.1]])
+
+    with caplog.at_level("INFO", logger="nemoguardrails.embeddings.cache"):
+        cache.get(["a", "a", "a", "b"])
+
+    # The hit rate is computed over the unique texts.
+    assert "Cache hit rate: 0.5" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_cache_embeddings_creates_cache_once():
+    class Index:
+        cache_config = EmbeddingsCacheConfig(enabled=True, store="in_memory")
+        num_computed = 0
+
+        @cache_embeddings
+        async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+            self.num_computed += len(texts)
+            return [[float(len(text))] for text in texts]
+
+    index = Index()
+    with patch.object(
+        EmbeddingsCache, "from_config", wraps=EmbeddingsCache.from_config
+    ) as mock_from_config:
+        assert await index.get_embeddings(["a", "bb"]) == [[1.0], [2.0]]
+        assert await index.get_embeddings(["bb", "ccc"]) == [[2.0], [3.0]]
+
+    mock_from_config.assert_called_once()
+    assert index.num_computed == 3
 
 
 class TestEmbeddingsCache(unittest.TestCase):
@@ -0,0 +1,214 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from typing import List
+
+import pytest
+
+from nemoguardrails.embeddings.basic import BasicEmbeddingsIndex
+from nemoguardrails.embeddings.batcher import EmbeddingBatcher, get_embedding_batcher
+from nemoguardrails.embeddings.index import IndexItem
+from nemoguardrails.embeddings.providers import register_embedding_provider
+from nemoguardrails.embeddings.providers.base import EmbeddingModel
+
+
+class RecordingEmbeddingModel(EmbeddingModel):
+    """Embedding model that records the batches it computes."""
+
+    engine_name = "recording"
+
+    def __init__(self, embedding_model: str = "test"):
+        self.embedding_model = embedding_model
+        self.batches = []
+
+    async def encode_async(self, documents: List[str]) -> List[List[float]]:
+        return self.encode(documents)
+
+    def encode(self, documents: List[str]) -> List[List[float]]:
+        self.batches.append(list(documents))
+        return [[float(len(doc)), 1.0] for doc in documents]
+
+
+register_embedding_provider(RecordingEmbeddingModel)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_a_batch():
+    model = RecordingEmbeddingModel()
+    batcher = EmbeddingBatcher(model, max_batch_size=10, max_batch_hold=0.01)
+
+    results = await asyncio.gather(
+        batcher.encode_async(["a"]),
+        batcher.encode_async(["bb", "a"]),
+        batcher.encode_async(["ccc"]),
+    )
+
+    assert results == [[[1.0, 1.0]], [[2.0, 1.0], [1.0, 1.0]], [[3.0, 1.0]]]
+
+    # A single batch, where the identical texts are computed once.
+    assert model.batches == [["a", "bb", "ccc"]]
+
+    stats = batcher.get_stats()
+    assert stats["num_batches"] == 1
+    assert stats["num_requested_texts"] == 4
+    assert stats["num_computed_texts"] == 3
+    assert stats["avg_batch_fill_ratio"] == pytest.approx(0.3)
+    assert 0 < stats["avg_queue_delay"] <= stats["max_queue_delay"]
+
+
+@pytest.mark.asyncio
+async def test_full_batches_are_not_held():
+    model = RecordingEmbeddingModel()
+    batcher = EmbeddingBatcher(model, max_batch_size=2, max_batch_hold=10)
+
+    texts = ["a", "b", "c", "d"]
+    results = await asyncio.wait_for(batcher.encode_async(texts), timeout=1)
+
+    assert results == [[1.0, 1.0]] * 4
+    assert model.batches == [["a", "b"], ["c", "d"]]
+    assert batcher.get_stats()["avg_batch_fill_ratio"] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_errors_are_propagated():
+    class FailingEmbeddingModel(RecordingEmbeddingModel):
+        def encode(self, documents: List[str]) -> List[List[float]]:
+            raise RuntimeError("Embedding failed.")
+
+    batcher = EmbeddingBatcher(FailingEmbeddingModel(), max_batch_hold=0.001)
+
+    with pytest.raises(RuntimeError):
+        await batcher.encode_async(["a"])
+
+
+@pytest.mark.asyncio
+async def test_missing_embeddings_are_errors():
+    class TruncatingEmbeddingModel(RecordingEmbeddingModel):
+        def encode(self, documents: List[str]) -> List[List[float]]:
+            return super().encode(documents)[:-1]
+
+    batcher = EmbeddingBatcher(TruncatingEmbeddingModel(), max_batch_hold=0.001)
+
+    with pytest.raises(ValueError):
+        await asyncio.wait_for(batcher.encode_async(["a", "b"]), timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_batch_does_not_hang_the_requests():
+    class SlowEmbeddingModel(RecordingEmbeddingModel):
+        async def encode_async(self, documents: List[str]) -> List[List[float]]:
+            await asyncio.sleep(5)
+            return self.encode(documents)
+
+    batcher = EmbeddingBatcher(SlowEmbeddingModel(), max_batch_hold=0.001)
+
+    request = asyncio.ensure_future(batcher.encode_async(["a"]))
+    await asyncio.sleep(0.01)
+    for task in asyncio.all_tasks():
+        if task.get_coro().__name__ == "_run_batch":
+            task.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await asyncio.wait_for(request, timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_request_does_not_cancel_the_others():
+    class SlowEmbeddingModel(RecordingEmbeddingModel):
+        async def encode_async(self, documents: List[str]) -> List[List[float]]:
+            await asyncio.sleep(0.05)
+            return self.encode(documents)
+
+    batcher = EmbeddingBatcher(SlowEmbeddingModel(), max_batch_hold=0.001)
+
+    cancelled = asyncio.ensure_future(batcher.encode_async(["a", "b"]))
+    other = asyncio.ensure_future(batcher.encode_async(["a"]))
+    await asyncio.sleep(0.01)
+    cancelled.cancel()
+
+    # The other request, which shares the embedding of "a", still gets it.
+    assert await other == [[1.0, 1.0]]
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+
+
+@pytest.mark.asyncio
+async def test_index_and_batcher_share_the_model():
+    index = BasicEmbeddingsIndex(
+        embedding_model="reused",
+        embedding_engine="recording",
+        use_batching=True,
+        max_batch_hold=0.01,
+    )
+    await index.add_items([IndexItem(text="hello")])
+    await index.build()
+    await index.search("hey", max_results=1)
+
+    batcher = get_embedding_batcher(
+        embedding_model="reused", embedding_engine="recording"
+    )
+    assert batcher.model is index._model
+    assert batcher.model.batches == [["hello"], ["hey"]]
+
+
+@pytest.mark.asyncio
+async def test_indexes_share_the_batcher():
+    indexes = []
+    for texts in [["hello", "hi"], ["bye"]]:
+        index = BasicEmbeddingsIndex(
+            embedding_model="shared",
+            embedding_engine="recording",
+            use_batching=True,
+            max_batch_hold=0.01,
+        )
+        await index.add_items([IndexItem(text=text) for text in texts])
+        await index.build()
+        indexes.append(index)
+
+    batcher = get_embedding_batcher(
+        embedding_model="shared", embedding_engine="recording"
+    )
+    assert batcher is get_embedding_batcher(
+        embedding_model="shared", embedding_engine="recording"
+    )
+
+    results = await asyncio.gather(
+        indexes[0].search("hey", max_results=1),
+        indexes[1].search("ciao", max_results=1),
+    )
+
+    assert [len(items) for items in results] == [1, 1]
+    assert results[1][0].text == "bye"
+
+    # The queries of the two indexes are computed in the same batch.
+    assert batcher._model.batches[-1] == ["hey", "ciao"]
+
+
+def test_batcher_with_unhashable_params():
+    model = RecordingEmbeddingModel()
+    params = {"headers": {"X-Deployment": "a"}, "scopes": ["embed"]}
+
+    batcher = get_embedding_batcher(
+        embedding_model="params",
+        embedding_engine="recording",
+        model=model,
+        embedding_params=params,
+    )
+    assert batcher is get_embedding_batcher(
+        embedding_model="params",
+        embedding_engine="recording",
+        embedding_params=dict(reversed(list(params.items()))),
+    )
@@ -0,0 +1,147 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List
+
+import pytest
+
+from nemoguardrails import LLMRails, RailsConfig
+from nemoguardrails.embeddings.providers import executor, register_embedding_provider
+from nemoguardrails.embeddings.providers.base import EmbeddingModel
+from nemoguardrails.embeddings.providers.executor import (
+    configure_embeddings_executor,
+    encode_in_executor,
+    get_embeddings_executor,
+    get_num_threads,
+)
+from nemoguardrails.rails.llm.config import EmbeddingsExecutorConfig
+from tests.utils import FakeLLM
+
+
+class WorkerInfoEmbeddingModel(EmbeddingModel):
+    """Embedding model returning the process and thread where it is run."""
+
+    engine_name = "worker_info"
+
+    def __init__(self, embedding_model: str):
+        self.embedding_model = embedding_model
+
+    async def encode_async(self, documents: List[str]) -> List[List[float]]:
+        return await encode_in_executor(self, documents)
+
+    def encode(self, documents: List[str]) -> List[List[float]]:
+        return [
+            [
+                float(os.getpid()),
+                float(threading.current_thread().name.startswith("embeddings")),
+            ]
+            for _ in documents
+        ]
+
+
+register_embedding_provider(WorkerInfoEmbeddingModel)
+
+
+@pytest.fixture(autouse=True)
+def reset_executor(monkeypatch):
+    monkeypatch.delenv("OMP_NUM_THREADS", raising=False)
+    yield
+
+    current_executor = get_embeddings_executor()
+    if current_executor is not None:
+        current_executor.shutdown()
+
+    executor.set_embeddings_executor(None)
+    executor.set_num_threads(None)
+    executor._executor_config = None
+
+
+@pytest.mark.asyncio
+async def test_thread_executor():
+    configure_embeddings_executor(
+        EmbeddingsExecutorConfig(type="thread", max_workers=2, num_threads=1)
+    )
+
+    assert isinstance(get_embeddings_executor(), ThreadPoolExecutor)
+    assert get_num_threads() == 1
+    assert os.environ["OMP_NUM_THREADS"] == "1"
+
+    result = await encode_in_executor(WorkerInfoEmbeddingModel("test"), ["a", "b"])
+    assert result == [[float(os.getpid()), 1.0]] * 2
+
+
+@pytest.mark.asyncio
+async def test_process_executor():
+    configure_embeddings_executor(
+        EmbeddingsExecutorConfig(type="process", max_workers=1),
+        models=[(WorkerInfoEmbeddingModel, "test")],
+    )
+    assert isinstance(get_embeddings_executor(), ProcessPoolExecutor)
+
+    result = await encode_in_executor(WorkerInfoEmbeddingModel("test"), ["a"])
+    assert result[0][0] != float(os.getpid())
+
+
+def test_worker_models_are_loaded():
+    class LazyEmbeddingModel(WorkerInfoEmbeddingModel):
+        loaded = False
+
+        def load(self):
+            self.loaded = True
+
+    # In a worker process, the models are loaded as soon as they are created.
+    assert executor._get_worker_model(LazyEmbeddingModel, "lazy").loaded
+
+
+def test_executor_is_configured_once():
+    configure_embeddings_executor(EmbeddingsExecutorConfig(type="thread"))
+    thread_executor = get_embeddings_executor()
+
+    configure_embeddings_executor(
+        EmbeddingsExecutorConfig(type="thread", max_workers=4)
+    )
+    assert get_embeddings_executor() is thread_executor
+
+
+def test_executor_from_config():
+    config = RailsConfig.from_content(
+        config={
+            "models": [],
+            "core": {
+                "embedding_search_provider": {
+                    "parameters": {
+                        "embedding_engine": "worker_info",
+                        "embedding_model": "test",
+                    }
+                },
+                "embeddings_executor": {"type": "thread", "max_workers": 2},
+            },
+        }
+    )
+    LLMRails(config=config, llm=FakeLLM(responses=[]))
+
+    current_executor = get_embeddings_executor()
+    assert isinstance(current_executor, ThreadPoolExecutor)
+    assert current_executor._max_workers == 2
+
+
+def test_default_executor():
+    config = RailsConfig.from_content(config={"models": []})
+    LLMRails(config=config, llm=FakeLLM(responses=[]))
+
+    assert get_embeddings_executor() is None
@@ -13,8 +13,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import fastembed
 import pytest
 
+from nemoguardrails import LLMRails, RailsConfig
+from nemoguardrails.embeddings.providers import init_embedding_model
 from nemoguardrails.embeddings.providers.fastembed import FastEmbedEmbeddingModel
 
 
@@ -33,3 +36,57 @@ async def test_async_embeddings():
     result = await model.encode_async(["test"])
 
     assert len(result[0]) == 384
+
+
+def test_model_is_loaded_lazily(monkeypatch):
+    loaded = []
+    text_embedding_cls = fastembed.TextEmbedding
+
+    def text_embedding(model_name, **kwargs):
+        loaded.append(model_name)
+        return text_embedding_cls(model_name, **kwargs)
+
+    monkeypatch.setattr(fastembed, "TextEmbedding", text_embedding)
+
+    # The model is not loaded until the embeddings are computed, e.g., in the main
+    # process when a process pool is used.
+    model = FastEmbedEmbeddingModel("all-MiniLM-L6-v2")
+    assert loaded == []
+
+    model.encode(["test"])
+    model.encode(["test"])
+    assert loaded == ["sentence-transformers/all-MiniLM-L6-v2"]
+
+
+def test_unsupported_params_are_ignored():
+    model = init_embedding_model(
+        "all-MiniLM-L6-v2", "FastEmbed", embedding_params={"device": "cpu"}
+    )
+
+    assert isinstance(model, FastEmbedEmbeddingModel)
+
+
+def test_embeddings_model_with_parameters():
+    # The parameters of the embeddings model are not supported by FastEmbed, which
+    # must still be usable.
+    config = RailsConfig.from_content(
+        """
+        define user express greeting
+          "hi"
+        """,
+        config={
+            "models": [
+                {
+                    "type": "embeddings",
+                    "engine": "FastEmbed",
+                    "model": "all-MiniLM-L6-v2",
+                    "parameters": {"device": "cpu"},
+                }
+            ]
+        },
+    )
+    app = LLMRails(config)
+
+    assert isinstance(
+        app.llm_generation_actions.user_message_index._model, FastEmbedEmbeddingModel
+    )
@@ -16,7 +16,10 @@
 import pytest
 
 from nemoguardrails import RailsConfig
+from nemoguardrails.actions.llm.generation import LLMGenerationActions
 from nemoguardrails.actions.llm.utils import LLMCallException
+from nemoguardrails.embeddings.index import IndexItem
+from nemoguardrails.rails.llm.config import UserMessagesConfig
 from tests.utils import TestChat
 
 config = RailsConfig.from_content(
@@ -61,3 +64,83 @@ def test_2():
     with pytest.raises(LLMCallException):
         chat >> "hello"
         chat << "Hello!"
+
+
+def _threshold_config(**user_messages_config):
+    return RailsConfig.from_content(
+        """
+        define user express greeting
+          "hi"
+
+        define user ask about the weather
+          "how is the weather today?"
+
+        define bot express greeting
+          "Hello!"
+
+        define flow
+          user express greeting
+          bot express greeting
+        """,
+        config={
+            "models": [],
+            "rails": {
+                "dialog": {
+                    "user_messages": {
+                        "embeddings_only": True,
+                        "embeddings_only_similarity_threshold": 0.9,
+                        **user_messages_config,
+                    }
+                }
+            },
+        },
+    )
+
+
+def test_similarity_threshold_met():
+    chat = TestChat(_threshold_config(), llm_completions=[])
+
+    chat >> "hi"
+    chat << "Hello!"
+
+
+def test_similarity_threshold_not_met_uses_llm():
+    chat = TestChat(_threshold_config(), llm_completions=["  express greeting"])
+
+    chat >> "good morning to you, my friend"
+    chat << "Hello!"
+
+
+def test_similarity_threshold_not_met_uses_fallback_intent():
+    chat = TestChat(
+        _threshold_config(embeddings_only_fallback_intent="express greeting"),
+        llm_completions=[],
+    )
+
+    chat >> "good morning to you, my friend"
+    chat << "Hello!"
+
+
+def test_similarity_margin():
+    user_messages_config = UserMessagesConfig(
+        embeddings_only=True,
+        embeddings_only_similarity_threshold=0.5,
+        embeddings_only_similarity_margin=0.1,
+    )
+    greeting = IndexItem(text="hi", meta={"intent": "express greeting"})
+    other_greeting = IndexItem(text="hello", meta={"intent": "express greeting"})
+    weather = IndexItem(text="weather?", meta={"intent": "ask about the weather"})
+
+    is_confident = LLMGenerationActions._is_confident_intent_match
+    assert is_confident([(greeting, 0.9), (weather, 0.7)], user_messages_config)
+
+    # The examples with the same intent are not runners-up.
+    assert is_confident(
+        [(greeting, 0.9), (other_greeting, 0.85), (weather, 0.7)],
+        user_messages_config,
+    )
+    assert not is_confident([(greeting, 0.9), (weather, 0.85)], user_messages_config)
+    assert not is_confident([(greeting, 0.4)], user_messages_config)
+
+    # The indexes which do not compute scores are never confident.
+    assert not is_confident([(greeting, None)], user_messages_config)
@@ -0,0 +1,204 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the remote embedding providers against a local fake embeddings API."""
+import asyncio
+import json
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+import pytest
+
+from nemoguardrails.embeddings.providers.remote import encode_in_batches
+
+
+class FakeEmbeddingsServer:
+    """OpenAI-compatible embeddings API, recording the requests it receives."""
+
+    def __init__(self):
+        self.requests = []
+        self.authorizations = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server.lock:
+                    server.requests.append(body)
+                    server.authorizations.append(self.headers["Authorization"])
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+
+                # Simulate the latency of the model.
+                time.sleep(0.05)
+
+                # The records are returned in reverse order, with their index.
+                data = [
+                    {"object": "embedding", "index": i, "embedding": [len(text), 1.0]}
+                    for i, text in enumerate(body["input"])
+                ][::-1]
+                response = json.dumps(
+                    {
+                        "object": "list",
+                        "data": data,
+                        "model": body["model"],
+                        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                    }
+                ).encode()
+
+                with server.lock:
+                    server.in_flight -= 1
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    with FakeEmbeddingsServer() as server:
+        yield server
+
+
+@pytest.mark.asyncio
+async def test_encode_in_batches():
+    in_flight = 0
+    max_in_flight = 0
+
+    async def encode_batch(documents: List[str]) -> List[List[float]]:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return [[float(doc)] for doc in documents]
+
+    documents = [str(i) for i in range(25)]
+    result = await encode_in_batches(
+        encode_batch, documents, max_batch_size=4, max_concurrency=3
+    )
+
+    assert result == [[float(i)] for i in range(25)]
+    assert max_in_flight == 3
+
+
+@pytest.fixture
+def nim_server(server, monkeypatch):
+    # The sync requests still go through `langchain-nvidia-ai-endpoints`, which is
+    # not needed for the async ones.
+    fake_module = types.ModuleType("langchain_nvidia_ai_endpoints")
+    fake_module.NVIDIAEmbeddings = lambda model, **kwargs: types.SimpleNamespace(
+        base_url=None
+    )
+    monkeypatch.setitem(sys.modules, "langchain_nvidia_ai_endpoints", fake_module)
+    monkeypatch.setenv("NVIDIA_BASE_URL", server.base_url)
+
+    return server
+
+
+@pytest.mark.asyncio
+async def test_nim_embeddings(nim_server):
+    server = nim_server
+
+    from nemoguardrails.embeddings.providers.nim import NIMEmbeddingModel
+
+    model = NIMEmbeddingModel("nvidia/nv-embedqa-e5-v5")
+    model.max_batch_size = 10
+    model.max_concurrency = 2
+
+    documents = ["x" * i for i in range(45)]
+    result = await model.encode_async(documents)
+
+    assert result == [[float(i), 1.0] for i in range(45)]
+    assert sorted(len(request["input"]) for request in server.requests) == [
+        5,
+        10,
+        10,
+        10,
+        10,
+    ]
+    assert server.max_in_flight == 2
+    assert all(request["input_type"] == "passage" for request in server.requests)
+
+    # The same client, i.e., connection pool, is used by the following requests.
+    client = model.async_client.get()
+    await model.encode_async(["hello"])
+    assert model.async_client.get() is client
+
+
+@pytest.mark.asyncio
+async def test_nim_embeddings_api_key(nim_server, monkeypatch):
+    monkeypatch.setenv("NVIDIA_API_KEY", "env-key")
+
+    from nemoguardrails.embeddings.providers import init_embedding_model
+    from nemoguardrails.embeddings.providers.nim import NIMEmbeddingModel
+
+    # The API key from the parameters takes precedence over the environment variable.
+    model = init_embedding_model(
+        "nvidia/nv-embedqa-e5-v5", "nim", embedding_params={"api_key": "param-key"}
+    )
+    await model.encode_async(["hello"])
+
+    model = NIMEmbeddingModel("nvidia/nv-embedqa-e5-v5")
+    await model.encode_async(["hello"])
+
+    assert nim_server.authorizations == ["Bearer param-key", "Bearer env-key"]
+
+
+@pytest.mark.asyncio
+async def test_openai_embeddings(server, monkeypatch):
+    pytest.importorskip("openai")
+    monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+    monkeypatch.setenv("OPENAI_API_KEY", "fake-key")
+
+    from nemoguardrails.embeddings.providers.openai import OpenAIEmbeddingModel
+
+    model = OpenAIEmbeddingModel("text-embedding-3-small")
+    model.max_batch_size = 10
+    model.max_concurrency = 2
+
+    documents = ["x" * i for i in range(25)]
+    assert await model.encode_async(documents) == [[float(i), 1.0] for i in range(25)]
+    assert len(server.requests) == 3
+    assert server.max_in_flight == 2
+
+    assert model.encode(documents) == [[float(i), 1.0] for i in range(25)]
@@ -0,0 +1,79 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from nemoguardrails.colang.v1_0.runtime import eval as eval_v1
+from nemoguardrails.colang.v2_x.runtime import eval as eval_v2
+from nemoguardrails.colang.v2_x.runtime.errors import ColangValueError
+
+
+def test_v1_compiled_expressions_are_reused():
+    eval_v1.compile_expression.cache_clear()
+
+    for i in range(3):
+        context = {"i": i, "input_flows": ["a", "b"]}
+        assert eval_v1.eval_expression("$i < len($input_flows)", context) == (i < 2)
+
+    cache_info = eval_v1.compile_expression.cache_info()
+    assert cache_info.misses == 1
+    assert cache_info.hits == 2
+
+
+def test_v1_dict_values():
+    context = {"speaker": {"name": "John"}}
+    assert eval_v1.eval_expression("$speaker.name", context) == "John"
+
+
+def test_v1_invalid_expressions_are_not_cached():
+    eval_v1.compile_expression.cache_clear()
+
+    for _ in range(2):
+        with pytest.raises(Exception, match="Error evaluating"):
+            eval_v1.eval_expression("$i <", {"i": 1})
+
+    assert eval_v1.compile_expression.cache_info().currsize == 0
+
+
+def test_v2_compiled_expressions_are_reused():
+    eval_v2.compile_expression.cache_clear()
+
+    for i in range(3):
+        assert eval_v2.eval_expression("$i + 1", {"i": i}) == i + 1
+
+    cache_info = eval_v2.compile_expression.cache_info()
+    assert cache_info.misses == 1
+    assert cache_info.hits == 2
+
+
+def test_v2_string_interpolation():
+    eval_v2.compile_expression.cache_clear()
+
+    for name in ["John", "Mary"]:
+        assert (
+            eval_v2.eval_expression('"Hello {$name}! {{x}}"', {"name": name})
+            == f"Hello {name}! {{x}}"
+        )
+
+    # Only the inner expression is cached, as the interpolated expression
+    # depends on the values.
+    assert eval_v2.compile_expression.cache_info().currsize == 1
+
+    assert eval_v2.eval_expression("'no interpolation'", {}) == "no interpolation"
+
+
+def test_v2_invalid_expression():
+    with pytest.raises(ColangValueError):
+        eval_v2.eval_expression("$i <", {"i": 1})
@@ -0,0 +1,123 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import List
+
+import numpy as np
+import pytest
+
+from nemoguardrails import LLMRails, RailsConfig
+from nemoguardrails.embeddings.basic import BasicEmbeddingsIndex
+from nemoguardrails.embeddings.exact import ExactEmbeddingsIndex
+from nemoguardrails.embeddings.index import IndexItem
+from nemoguardrails.embeddings.providers.base import EmbeddingModel
+
+
+class FakeEmbeddingModel(EmbeddingModel):
+    """Embedding model using a fixed vector for each text."""
+
+    def __init__(self, vectors: dict):
+        self.vectors = vectors
+
+    async def encode_async(self, documents: List[str]) -> List[List[float]]:
+        return self.encode(documents)
+
+    def encode(self, documents: List[str]) -> List[List[float]]:
+        return [self.vectors[doc] for doc in documents]
+
+
+async def _build_index(vectors: dict) -> ExactEmbeddingsIndex:
+    index = ExactEmbeddingsIndex()
+    index._model = FakeEmbeddingModel(vectors)
+    await index.add_items([IndexItem(text=text) for text in vectors if text != "q"])
+    await index.build()
+
+    return index
+
+
+@pytest.mark.asyncio
+async def test_exact_search():
+    rng = np.random.default_rng(0)
+    vectors = {str(i): rng.normal(size=16).tolist() for i in range(200)}
+    vectors["q"] = rng.normal(size=16).tolist()
+    index = await _build_index(vectors)
+
+    results = await index.search_with_scores("q", max_results=5)
+
+    # The results must be the same as a brute-force search.
+    matrix = np.array([vectors[str(i)] for i in range(200)])
+    query = np.array(vectors["q"])
+    scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query))
+    expected = np.argsort(-scores)[0:5]
+
+    assert [item.text for item, _ in results] == [str(i) for i in expected]
+    assert np.allclose([score for _, score in results], scores[expected], atol=1e-5)
+
+    assert [item.text for item in await index.search("q", max_results=5)] == [
+        str(i) for i in expected
+    ]
+
+
+@pytest.mark.asyncio
+async def test_exact_search_few_items():
+    index = await _build_index(
+        {"a": [1.0, 0.0], "b": [0.0, 1.0], "c": [0.0, 0.0], "q": [1.0, 1.0]}
+    )
+
+    results = await index.search_with_scores("q", max_results=20)
+
+    assert [item.text for item, _ in results] == ["a", "b", "c"]
+    assert results[0][1] == pytest.approx(np.sqrt(0.5))
+    assert results[2][1] == 0
+
+
+@pytest.mark.asyncio
+async def test_annoy_search_scores():
+    rng = np.random.default_rng(0)
+    vectors = {str(i): rng.normal(size=16).tolist() for i in range(50)}
+    vectors["q"] = rng.normal(size=16).tolist()
+    exact_index = await _build_index(vectors)
+
+    annoy_index = BasicEmbeddingsIndex()
+    annoy_index._model = FakeEmbeddingModel(vectors)
+    await annoy_index.add_items([IndexItem(text=str(i)) for i in range(50)])
+    await annoy_index.build()
+
+    # The Annoy distances are converted to the same cosine similarities.
+    expected = {
+        item.text: score
+        for item, score in await exact_index.search_with_scores("q", max_results=50)
+    }
+    results = await annoy_index.search_with_scores("q", max_results=5)
+    assert len(results) == 5
+    for item, score in results:
+        assert score == pytest.approx(expected[item.text], abs=1e-4)
+
+
+def test_exact_search_provider():
+    config = RailsConfig.from_content(
+        colang_content="""
+        define flow
+          user express greeting
+          bot express greeting
+        """,
+        config={
+            "models": [],
+            "core": {"embedding_search_provider": {"name": "exact"}},
+        },
+    )
+    app = LLMRails(config)
+
+    assert isinstance(app.llm_generation_actions.flows_index, ExactEmbeddingsIndex)
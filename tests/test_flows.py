@@ -16,6 +16,8 @@
 """Test the flows engine."""
 from nemoguardrails.colang.v1_0.runtime.flows import (
     FlowConfig,
+    FlowConfigs,
+    FlowsIndex,
     State,
     compute_next_state,
 )
@@ -316,3 +318,127 @@ def test_flow_interruption():
         },
     )
     assert state.next_step is None
+
+
+def test_flows_index_candidates():
+    """Test that only the flows that can start on an event are considered."""
+    flow_configs = FlowConfigs(FLOW_CONFIGS)
+    flow_configs["conditional"] = FlowConfig(
+        id="conditional",
+        elements=[
+            {"_type": "if", "expression": "$enabled", "_next_else": 2},
+            {"_type": "UserIntent", "intent_name": "express greeting"},
+        ],
+    )
+    flow_configs["any intent"] = FlowConfig(
+        id="any intent",
+        elements=[{"_type": "UserIntent", "intent_name": "..."}],
+    )
+
+    flows_index = FlowsIndex()
+
+    candidates = flows_index.get_candidate_flow_configs(
+        flow_configs, {"type": "UserIntent", "intent": "ask math question"}
+    )
+    assert [flow_config.id for flow_config in candidates] == [
+        "math",
+        "conditional",
+        "any intent",
+    ]
+
+    candidates = flows_index.get_candidate_flow_configs(
+        flow_configs, {"type": "BotIntent", "intent": "express greeting"}
+    )
+    assert [flow_config.id for flow_config in candidates] == ["conditional"]
+
+    # Flows added later are also indexed.
+    flow_configs["bot greeting"] = FlowConfig(
+        id="bot greeting",
+        elements=[
+            {
+                "_type": "run_action",
+                "action_name": "utter",
+                "action_params": {"value": "express greeting"},
+            }
+        ],
+    )
+    candidates = flows_index.get_candidate_flow_configs(
+        flow_configs, {"type": "BotIntent", "intent": "express greeting"}
+    )
+    assert [flow_config.id for flow_config in candidates] == [
+        "conditional",
+        "bot greeting",
+    ]
+    assert len(flows_index) == len(flow_configs)
+
+    # Flows replaced under the same id are indexed again.
+    flow_configs["math"] = FlowConfig(
+        id="math",
+        elements=[{"_type": "UserIntent", "intent_name": "ask about benefits"}],
+    )
+    candidates = flows_index.get_candidate_flow_configs(
+        flow_configs, {"type": "UserIntent", "intent": "ask math question"}
+    )
+    assert [flow_config.id for flow_config in candidates] == [
+        "conditional",
+        "any intent",
+    ]
+    candidates = flows_index.get_candidate_flow_configs(
+        flow_configs, {"type": "UserIntent", "intent": "ask about benefits"}
+    )
+    assert "math" in [flow_config.id for flow_config in candidates]
+
+
+def test_flow_configs_version():
+    """Test that the changes of the flow configurations are tracked."""
+    flow_configs = FlowConfigs(FLOW_CONFIGS)
+    assert (flow_configs.version, flow_configs.num_replaced) == (len(FLOW_CONFIGS), 0)
+
+    # Setting the same flow configuration again is not a change.
+    flow_configs["greeting"] = flow_configs["greeting"]
+    assert (flow_configs.version, flow_configs.num_replaced) == (len(FLOW_CONFIGS), 0)
+
+    flow_configs["greeting"] = FlowConfig(id="greeting", elements=[])
+    assert (flow_configs.version, flow_configs.num_replaced) == (
+        len(FLOW_CONFIGS) + 1,
+        1,
+    )
+
+    flow_configs.pop("greeting")
+    assert (flow_configs.version, flow_configs.num_replaced) == (
+        len(FLOW_CONFIGS) + 2,
+        2,
+    )
+
+
+def test_flows_index_same_next_steps():
+    """Test that using the index results in the same next steps."""
+    events = [
+        {"type": "UserIntent", "intent": "ask about benefits"},
+        {"type": "BotIntent", "intent": "respond about benefits"},
+        {"type": "UserIntent", "intent": "ask math question"},
+        {
+            "type": "InternalSystemActionFinished",
+            "action_name": "wolfram alpha request",
+            "status": "success",
+        },
+        {"type": "BotIntent", "intent": "respond to math question"},
+        {"type": "UserIntent", "intent": "express greeting"},
+    ]
+
+    state = State(context={}, flow_states=[], flow_configs=FLOW_CONFIGS)
+    indexed_state = State(
+        context={},
+        flow_states=[],
+        flow_configs=FLOW_CONFIGS,
+        flows_index=FlowsIndex(),
+    )
+
+    for event in events:
+        state = compute_next_state(state, event)
+        indexed_state = compute_next_state(indexed_state, event)
+
+        assert indexed_state.next_step == state.next_step
+        assert [fs.flow_id for fs in indexed_state.flow_states] == [
+            fs.flow_id for fs in state.flow_states
+        ]
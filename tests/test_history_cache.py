@@ -0,0 +1,148 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import time
+
+from nemoguardrails import RailsConfig
+from nemoguardrails.rails.llm.history_cache import EventsHistoryCache
+from tests.utils import TestChat
+
+MESSAGES = [
+    {"role": "context", "content": {"user_name": "John"}},
+    {"role": "user", "content": "hi"},
+    {"role": "assistant", "content": "Hello!"},
+    {"role": "user", "content": "How are you?"},
+    {"role": "assistant", "content": "Good!"},
+]
+
+
+def test_longest_prefix():
+    cache = EventsHistoryCache()
+    cache.set(MESSAGES[0:3], [{"type": "A"}])
+    cache.set(MESSAGES[0:5], [{"type": "B"}])
+
+    assert cache.get_longest_prefix(MESSAGES[0:4]) == (3, [{"type": "A"}])
+    assert cache.get_longest_prefix(MESSAGES) == (5, [{"type": "B"}])
+    assert cache.get_longest_prefix(MESSAGES[0:2]) == (0, None)
+
+    assert cache.get(MESSAGES[0:3]) == [{"type": "A"}]
+    assert cache.get(MESSAGES[0:4]) is None
+
+
+def test_roles_are_part_of_the_key():
+    cache = EventsHistoryCache()
+    cache.set([{"role": "user", "content": "hi"}], [{"type": "A"}])
+
+    assert cache.get([{"role": "assistant", "content": "hi"}]) is None
+
+    # Joining the content of two messages should not result in the same key.
+    cache.set(
+        [{"role": "user", "content": "a"}, {"role": "user", "content": "b"}],
+        [{"type": "B"}],
+    )
+    assert cache.get([{"role": "user", "content": "a:b"}]) is None
+
+
+def test_messages_without_content():
+    cache = EventsHistoryCache()
+    messages = [{"role": "user", "content": "hi"}, {"role": "tool"}]
+    cache.set(messages, [{"type": "A"}])
+
+    assert cache.get(messages) == [{"type": "A"}]
+
+
+def test_size_of_extended_history():
+    events = [{"type": "UserMessage", "text": f"message {i}"} for i in range(4)]
+    cache = EventsHistoryCache()
+    cache.set(MESSAGES[0:3], events[0:2])
+    cache.set(MESSAGES[0:5], events)
+
+    # The size of the second entry is estimated from the size of the first one,
+    # and the size of the new events.
+    sizes = [entry.size_bytes for entry in cache._entries.values()]
+    assert sizes[1] == sizes[0] + len(json.dumps(events[2:]))
+
+
+def test_size_budget_eviction():
+    events = [{"type": "UserMessage", "text": "x" * 100}]
+    cache = EventsHistoryCache(max_size_bytes=300)
+
+    for i in range(5):
+        cache.set([{"role": "user", "content": f"message {i}"}], events)
+
+    stats = cache.get_stats()
+    assert stats["size"] == 2
+    assert stats["evictions"] == 3
+    assert stats["size_bytes"] <= 300
+
+    # The least recently used entries are evicted first.
+    assert cache.get([{"role": "user", "content": "message 0"}]) is None
+    assert cache.get([{"role": "user", "content": "message 4"}]) == events
+
+
+def test_ttl_eviction():
+    cache = EventsHistoryCache(ttl=0.05)
+    cache.set(MESSAGES, [{"type": "A"}])
+    assert cache.get(MESSAGES) == [{"type": "A"}]
+
+    time.sleep(0.1)
+    assert cache.get(MESSAGES) is None
+    assert len(cache) == 0
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_llm_rails_uses_the_cache():
+    config = RailsConfig.from_content(
+        """
+        define user express greeting
+          "hello"
+
+        define flow
+          user express greeting
+          bot express greeting
+
+        define bot express greeting
+          "Hello there!"
+        """
+    )
+    chat = TestChat(
+        config,
+        llm_completions=["  express greeting", "  express greeting"],
+    )
+
+    chat >> "hello"
+    chat << "Hello there!"
+    chat >> "hello again"
+    chat << "Hello there!"
+
+    stats = chat.app.events_history_cache.get_stats()
+    assert stats["size"] == 2
+    assert stats["hits"] == 1
+
+
+def test_llm_rails_cache_config():
+    config = RailsConfig.from_content(
+        yaml_content="""
+        core:
+          events_history_cache:
+            max_size_bytes: 1000
+            ttl: 60
+        """
+    )
+    chat = TestChat(config, llm_completions=[])
+
+    assert chat.app.events_history_cache.max_size_bytes == 1000
+    assert chat.app.events_history_cache.ttl == 60
@@ -0,0 +1,215 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import List
+
+import pytest
+
+from nemoguardrails.embeddings.basic import BasicEmbeddingsIndex
+from nemoguardrails.embeddings.exact import ExactEmbeddingsIndex
+from nemoguardrails.embeddings.index import IndexItem
+from nemoguardrails.embeddings.providers import register_embedding_provider
+from nemoguardrails.embeddings.providers.base import EmbeddingModel
+
+# The texts are embedded along their own axis, and the queries "<text>?" close to it.
+TEXTS = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta"]
+
+
+class AxisEmbeddingModel(EmbeddingModel):
+    """Embedding model with one axis per known text, counting the computed texts."""
+
+    engine_name = "axis"
+    num_computed = 0
+
+    def __init__(self, embedding_model: str = "test"):
+        self.embedding_model = embedding_model
+
+    async def encode_async(self, documents: List[str]) -> List[List[float]]:
+        return self.encode(documents)
+
+    def encode(self, documents: List[str]) -> List[List[float]]:
+        AxisEmbeddingModel.num_computed += len(documents)
+
+        embeddings = []
+        for doc in documents:
+            embedding = [0.1] * len(TEXTS)
+            embedding[TEXTS.index(doc.rstrip("?"))] = 1.0
+            embeddings.append(embedding)
+
+        return embeddings
+
+
+register_embedding_provider(AxisEmbeddingModel)
+
+
+async def _create_index(index_cls, texts: List[str], **kwargs):
+    index = index_cls(embedding_model="test", embedding_engine="axis", **kwargs)
+    await index.add_items([IndexItem(text=text) for text in texts])
+    await index.build()
+    return index
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("index_cls", [BasicEmbeddingsIndex, ExactEmbeddingsIndex])
+async def test_add_after_build(index_cls):
+    index = await _create_index(index_cls, TEXTS[:6])
+    built_index = index.embeddings_index
+
+    AxisEmbeddingModel.num_computed = 0
+    await index.add_item(IndexItem(text="eta"))
+
+    # Only the new item is embedded, and the index is not rebuilt.
+    assert AxisEmbeddingModel.num_computed == 1
+    assert index.embeddings_index is built_index
+
+    results = await index.search("eta?", max_results=2)
+    assert [item.text for item in results][0] == "eta"
+
+    results = await index.search("beta?", max_results=1)
+    assert [item.text for item in results] == ["beta"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("index_cls", [BasicEmbeddingsIndex, ExactEmbeddingsIndex])
+async def test_remove_items(index_cls):
+    index = await _create_index(index_cls, TEXTS[:6])
+    await index.add_item(IndexItem(text="eta"))
+
+    assert await index.remove_items([IndexItem(text="beta"), IndexItem(text="eta")])
+    assert await index.remove_item(IndexItem(text="unknown")) == 0
+
+    results = await index.search("beta?", max_results=10)
+    assert sorted(item.text for item in results) == sorted(
+        ["alpha", "gamma", "delta", "epsilon", "zeta"]
+    )
+
+    results = await index.search("eta?", max_results=1)
+    assert results[0].text != "eta"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("index_cls", [BasicEmbeddingsIndex, ExactEmbeddingsIndex])
+async def test_remove_items_with_meta(index_cls):
+    index = await _create_index(index_cls, [])
+    await index.add_items(
+        [IndexItem(text="alpha", meta={"id": i}) for i in range(3)]
+        + [IndexItem(text="beta")]
+    )
+
+    # Only the items equal to the removed ones, including the meta, are removed.
+    assert (
+        await index.remove_items(
+            [IndexItem(text="alpha", meta={"id": 1}), IndexItem(text="beta", meta={})]
+        )
+        == 2
+    )
+
+    results = await index.search("alpha?", max_results=10)
+    assert [item.meta for item in results] == [{"id": 0}, {"id": 2}]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("index_cls", [BasicEmbeddingsIndex, ExactEmbeddingsIndex])
+async def test_merge(index_cls):
+    index = await _create_index(index_cls, TEXTS[:4], max_delta_size=3)
+    await index.remove_item(IndexItem(text="alpha"))
+    await index.add_items([IndexItem(text="epsilon"), IndexItem(text="zeta")])
+
+    # The third pending change starts a merge in the background.
+    assert index._merge_task is not None
+    await index._merge_task
+
+    # The slot of the removed item is dropped.
+    assert index._num_indexed == 5
+    assert index._num_removed_indexed == 0
+    assert len(index._items) == len(index._embeddings) == 5
+
+    results = await index.search("zeta?", max_results=10)
+    assert [item.text for item in results][0] == "zeta"
+    assert "alpha" not in [item.text for item in results]
+    assert len(results) == 5
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("index_cls", [BasicEmbeddingsIndex, ExactEmbeddingsIndex])
+async def test_merge_compacts_removed_items(index_cls):
+    index = await _create_index(index_cls, TEXTS[:4])
+
+    for _ in range(3):
+        await index.remove_items([IndexItem(text="alpha"), IndexItem(text="beta")])
+        await index.add_items([IndexItem(text="alpha"), IndexItem(text="beta")])
+        await index.merge()
+        assert len(index._items) == len(index._embeddings) == 4
+
+    results = await index.search("beta?", max_results=10)
+    assert [item.text for item in results][0] == "beta"
+    assert sorted(item.text for item in results) == sorted(TEXTS[:4])
+
+    await index.remove_items([IndexItem(text=text) for text in TEXTS[:4]])
+    await index.merge()
+    assert index._items == []
+    assert await index.search("beta?", max_results=10) == []
+
+
+@pytest.mark.asyncio
+async def test_failed_merge_is_logged(caplog):
+    index = await _create_index(BasicEmbeddingsIndex, TEXTS[:4], max_delta_size=1)
+
+    def _build_index(*args):
+        raise RuntimeError("build failed")
+
+    index._build_index = _build_index
+    await index.add_items([IndexItem(text="epsilon")])
+    with pytest.raises(RuntimeError):
+        await index._merge_task
+
+    assert "The background merge of the embeddings index failed." in caplog.text
+
+    # The searches keep using the current index and the delta segment.
+    results = await index.search("epsilon?", max_results=1)
+    assert results[0].text == "epsilon"
+
+
+@pytest.mark.asyncio
+async def test_load_and_add(tmp_path):
+    index = await _create_index(ExactEmbeddingsIndex, TEXTS[:4])
+    await index.save(str(tmp_path / "index"))
+
+    loaded_index = ExactEmbeddingsIndex(embedding_model="test", embedding_engine="axis")
+    assert await loaded_index.load(str(tmp_path / "index"))
+
+    # The items of the saved index are not embedded again, only the new one.
+    AxisEmbeddingModel.num_computed = 0
+    await loaded_index.add_items([IndexItem(text=text) for text in TEXTS[:5]])
+    assert AxisEmbeddingModel.num_computed == 1
+
+    results = await loaded_index.search("epsilon?", max_results=1)
+    assert results[0].text == "epsilon"
+
+    await loaded_index.merge()
+    results = await loaded_index.search("gamma?", max_results=1)
+    assert results[0].text == "gamma"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("use_batching", [False, True])
+async def test_get_embeddings(use_batching):
+    index = BasicEmbeddingsIndex(
+        embedding_model="test", embedding_engine="axis", use_batching=use_batching
+    )
+
+    assert await index.get_embeddings(["alpha", "beta"]) == AxisEmbeddingModel().encode(
+        ["alpha", "beta"]
+    )
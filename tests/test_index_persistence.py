@@ -0,0 +1,145 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the persistence of the user messages, bot messages and flows indexes."""
+import os
+from typing import List
+
+import pytest
+
+from nemoguardrails import LLMRails, RailsConfig
+from nemoguardrails.embeddings.providers import register_embedding_provider
+from nemoguardrails.embeddings.providers.base import EmbeddingModel
+
+COLANG_CONTENT = """
+define user express greeting
+  "hi"
+  "hello"
+
+define user ask capabilities
+  "what can you do?"
+
+define flow
+  user express greeting
+  bot express greeting
+
+define bot express greeting
+  "Hello there!"
+"""
+
+
+class CountingEmbeddingModel(EmbeddingModel):
+    """Embedding model that counts the number of embedded documents."""
+
+    engine_name = "counting"
+    num_documents = 0
+
+    def __init__(self, embedding_model: str):
+        self.embedding_model = embedding_model
+
+    async def encode_async(self, documents: List[str]) -> List[List[float]]:
+        return self.encode(documents)
+
+    def encode(self, documents: List[str]) -> List[List[float]]:
+        CountingEmbeddingModel.num_documents += len(documents)
+        return [
+            [float(len(doc)), float(doc.count(" ")), 1.0 + (sum(map(ord, doc)) % 7)]
+            for doc in documents
+        ]
+
+
+register_embedding_provider(CountingEmbeddingModel)
+
+
+def _get_config(
+    cache_dir: str, name: str = "default", model: str = "test", **parameters
+):
+    return RailsConfig.from_content(
+        COLANG_CONTENT,
+        config={
+            "models": [],
+            "core": {
+                "embedding_search_provider": {
+                    "name": name,
+                    "parameters": {
+                        "embedding_engine": "counting",
+                        "embedding_model": model,
+                        **parameters,
+                    },
+                    "persistence": {"enabled": True, "cache_dir": cache_dir},
+                }
+            },
+        },
+    )
+
+
+async def _search(app: LLMRails):
+    actions = app.llm_generation_actions
+    return [
+        [item.text for item in await index.search("hi", max_results=3)]
+        for index in [
+            actions.user_message_index,
+            actions.bot_message_index,
+            actions.flows_index,
+        ]
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", ["default", "exact"])
+async def test_warm_restart(tmp_path, name):
+    cache_dir = str(tmp_path / "cache")
+
+    CountingEmbeddingModel.num_documents = 0
+    app = LLMRails(_get_config(cache_dir, name))
+    assert CountingEmbeddingModel.num_documents > 0
+    assert len(os.listdir(cache_dir)) > 0
+    results = await _search(app)
+
+    # On a warm restart, only the search queries are embedded.
+    CountingEmbeddingModel.num_documents = 0
+    app = LLMRails(_get_config(cache_dir, name))
+    assert CountingEmbeddingModel.num_documents == 0
+    assert await _search(app) == results
+
+    # The temporary files are not left behind.
+    assert not [f for f in os.listdir(cache_dir) if f.endswith(".tmp")]
+
+
+def test_model_change_invalidates_cache(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    LLMRails(_get_config(cache_dir))
+
+    CountingEmbeddingModel.num_documents = 0
+    LLMRails(_get_config(cache_dir, model="other"))
+    assert CountingEmbeddingModel.num_documents > 0
+
+
+def test_index_settings_change_invalidates_cache(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    LLMRails(_get_config(cache_dir))
+
+    CountingEmbeddingModel.num_documents = 0
+    LLMRails(_get_config(cache_dir, n_trees=20))
+    assert CountingEmbeddingModel.num_documents > 0
+
+    CountingEmbeddingModel.num_documents = 0
+    LLMRails(_get_config(cache_dir, autotune=True))
+    assert CountingEmbeddingModel.num_documents > 0
+
+    # The same settings reuse the index.
+    CountingEmbeddingModel.num_documents = 0
+    LLMRails(_get_config(cache_dir, n_trees=20))
+    assert CountingEmbeddingModel.num_documents == 0
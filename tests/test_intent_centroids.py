@@ -0,0 +1,138 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+
+from nemoguardrails import RailsConfig
+from nemoguardrails.embeddings.centroids import IntentCentroidClassifier
+from tests.utils import TestChat
+
+
+def _clustered_examples(rng, centers: dict, num_examples: dict):
+    intents, embeddings = [], []
+    for intent, center in centers.items():
+        for _ in range(num_examples[intent]):
+            intents.append(intent)
+            embeddings.append(center + 0.1 * rng.normal(size=len(center)))
+    return intents, embeddings
+
+
+def test_classify():
+    rng = np.random.default_rng(0)
+    centers = {"a": rng.normal(size=16), "b": rng.normal(size=16)}
+    intents, embeddings = _clustered_examples(rng, centers, {"a": 5, "b": 50})
+
+    classifier = IntentCentroidClassifier().fit(intents, embeddings)
+
+    results = classifier.classify(centers["a"] + 0.1 * rng.normal(size=16))
+    assert [intent for intent, _ in results] == ["a", "b"]
+    assert sum(score for _, score in results) == pytest.approx(1.0)
+    assert results[0][1] > 0.9
+
+
+def test_multiple_centroids_per_intent():
+    rng = np.random.default_rng(0)
+    centers = {
+        "a1": rng.normal(size=16),
+        "a2": rng.normal(size=16),
+        "b": rng.normal(size=16),
+    }
+    intents, embeddings = _clustered_examples(rng, centers, {"a1": 5, "a2": 5, "b": 5})
+
+    # The intent "a" has two distinct groups of examples.
+    intents = [intent[0] for intent in intents]
+    classifier = IntentCentroidClassifier(centroids_per_intent=2).fit(
+        intents, embeddings
+    )
+    assert classifier._centroids.shape == (4, 16)
+
+    for center in [centers["a1"], centers["a2"]]:
+        assert classifier.classify(center, max_results=1)[0][0] == "a"
+    assert classifier.classify(centers["b"], max_results=1)[0][0] == "b"
+
+
+COLANG_CONTENT = """
+define user express greeting
+  "hi"
+  "hello"
+
+define user ask about the weather
+  "how is the weather"
+  "will it rain"
+
+define bot express greeting
+  "Hello!"
+
+define flow
+  user express greeting
+  bot express greeting
+"""
+
+
+def _get_config(centroids_min_score: float):
+    return RailsConfig.from_content(
+        COLANG_CONTENT,
+        config={
+            "models": [],
+            "rails": {
+                "dialog": {
+                    "user_messages": {
+                        "intent_detector": "centroids",
+                        "centroids_min_score": centroids_min_score,
+                    }
+                }
+            },
+        },
+    )
+
+
+def test_centroids_intent_detector():
+    chat = TestChat(_get_config(0.0), llm_completions=[])
+
+    assert chat.app.llm_generation_actions.user_intent_classifier.intents == [
+        "express greeting",
+        "ask about the weather",
+    ]
+
+    chat >> "hi"
+    chat << "Hello!"
+
+
+def test_centroids_intent_detector_fallback():
+    chat = TestChat(_get_config(0.5), llm_completions=["  express greeting"])
+
+    # The most likely intent is not likely enough, so the LLM is used.
+    classifier = chat.app.llm_generation_actions.user_intent_classifier
+    classifier.classify = lambda embedding, max_results: [
+        ("ask about the weather", 0.4)
+    ]
+
+    chat >> "hi"
+    chat << "Hello!"
+    assert chat.llm.i == 1
+
+
+def test_unknown_intent_detector():
+    config = RailsConfig.from_content(
+        COLANG_CONTENT,
+        config={
+            "models": [],
+            "rails": {"dialog": {"user_messages": {"intent_detector": "unknown"}}},
+        },
+    )
+
+    with pytest.raises(ValueError):
+        TestChat(config, llm_completions=[])
@@ -0,0 +1,139 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+from typing import List
+
+import pytest
+
+from nemoguardrails.embeddings.basic import BasicEmbeddingsIndex
+from nemoguardrails.embeddings.providers import register_embedding_provider
+from nemoguardrails.embeddings.providers.base import EmbeddingModel
+from nemoguardrails.kb import kb as kb_module
+from nemoguardrails.kb.kb import KnowledgeBase
+from nemoguardrails.rails.llm.config import EmbeddingSearchProvider, KnowledgeBaseConfig
+
+
+class HashEmbeddingModel(EmbeddingModel):
+    """Embedding model deriving the embeddings from the md5 of the texts, counting them."""
+
+    engine_name = "kb_hash"
+    num_computed = 0
+
+    def __init__(self, embedding_model: str = "test"):
+        self.embedding_model = embedding_model
+
+    async def encode_async(self, documents: List[str]) -> List[List[float]]:
+        return self.encode(documents)
+
+    def encode(self, documents: List[str]) -> List[List[float]]:
+        HashEmbeddingModel.num_computed += len(documents)
+
+        return [
+            [b / 255 for b in hashlib.md5(doc.encode("utf-8")).digest()]
+            for doc in documents
+        ]
+
+
+register_embedding_provider(HashEmbeddingModel)
+
+DOCUMENTS = [
+    f"# Topic {i}\n\nThe first paragraph of topic {i}.\n\n"
+    f"## Details\n\nThe details of topic {i}."
+    for i in range(5)
+]
+
+
+@pytest.fixture(autouse=True)
+def cache_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(kb_module, "CACHE_FOLDER", str(tmp_path))
+
+
+async def _build_kb(
+    documents: List[str], default_embedding_model: str = "test"
+) -> KnowledgeBase:
+    # The engine and the model are not set in the parameters of the provider, so the
+    # default embedding model is used, like in `LLMRails`.
+    kb = KnowledgeBase(
+        documents=documents,
+        config=KnowledgeBaseConfig(embedding_search_provider=EmbeddingSearchProvider()),
+        get_embedding_search_provider_instance=lambda config: BasicEmbeddingsIndex(
+            embedding_engine="kb_hash",
+            embedding_model=default_embedding_model,
+            **config.parameters,
+        ),
+    )
+    kb.init()
+
+    HashEmbeddingModel.num_computed = 0
+    await kb.build()
+
+    return kb
+
+
+@pytest.mark.asyncio
+async def test_unchanged_kb_is_loaded():
+    await _build_kb(DOCUMENTS)
+    assert HashEmbeddingModel.num_computed == 10
+
+    kb = await _build_kb(DOCUMENTS)
+    assert HashEmbeddingModel.num_computed == 0
+
+    chunk = kb.chunks[4]
+    results = await kb.search_relevant_chunks(
+        f"# {chunk['title']}\n\n{chunk['body']}", max_results=1
+    )
+    assert results == [chunk]
+
+
+@pytest.mark.asyncio
+async def test_only_changed_chunks_are_embedded():
+    await _build_kb(DOCUMENTS)
+
+    # One paragraph is edited, and one document is added.
+    documents = DOCUMENTS.copy()
+    documents[2] = documents[2].replace("The details", "More details")
+    documents.append("# Topic 5\n\nThe only paragraph of topic 5.")
+
+    kb = await _build_kb(documents)
+    assert HashEmbeddingModel.num_computed == 2
+
+    for chunk in [kb.chunks[5], kb.chunks[10]]:
+        results = await kb.search_relevant_chunks(
+            f"# {chunk['title']}\n\n{chunk['body']}", max_results=1
+        )
+        assert results == [chunk]
+
+
+@pytest.mark.asyncio
+async def test_removed_chunks_are_not_kept():
+    await _build_kb(DOCUMENTS)
+    await _build_kb(DOCUMENTS[:4])
+
+    # The chunks of the last document were removed by the previous build.
+    await _build_kb(DOCUMENTS[1:])
+    assert HashEmbeddingModel.num_computed == 2
+
+
+@pytest.mark.asyncio
+async def test_default_embedding_model_change_invalidates_chunks():
+    await _build_kb(DOCUMENTS)
+
+    documents = DOCUMENTS.copy()
+    documents[2] = documents[2].replace("The details", "More details")
+
+    # None of the chunk embeddings of the previous model are reused.
+    await _build_kb(documents, default_embedding_model="other")
+    assert HashEmbeddingModel.num_computed == 10
@@ -0,0 +1,106 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the lookup of the next step in the flows, without calling the LLM."""
+from typing import Optional
+
+from nemoguardrails import RailsConfig
+from nemoguardrails.actions.llm.generation import LLMGenerationActions
+from tests.utils import TestChat
+
+COLANG_CONTENT = """
+define user express greeting
+  "hi"
+
+define user ask about pricing
+  "how much is it?"
+
+define bot express greeting
+  "Hello!"
+
+define bot inform pricing
+  "It's ten dollars per month."
+
+define bot offer help
+  "How can I help?"
+
+define flow
+  user express greeting
+  bot express greeting
+  user ask about pricing
+  bot inform pricing
+
+define flow
+  user express greeting
+  bot offer help
+
+define flow
+  user ask about refunds
+  execute check_refund
+"""
+
+
+def _get_config(lookup_similarity_threshold: Optional[float] = 0.9):
+    return RailsConfig.from_content(
+        COLANG_CONTENT,
+        config={
+            "models": [],
+            "rails": {
+                "dialog": {
+                    "next_steps": {
+                        "lookup": True,
+                        "lookup_similarity_threshold": lookup_similarity_threshold,
+                    }
+                }
+            },
+        },
+    )
+
+
+def test_build_next_step_lookup():
+    lookup = LLMGenerationActions._build_next_step_lookup(_get_config().flows)
+
+    # The greeting is followed by different bot intents, and the question about the
+    # refunds by an action.
+    assert lookup == {"ask about pricing": "inform pricing"}
+
+
+def test_next_step_from_lookup():
+    # The question about the pricing does not start a flow, so the next step is
+    # generated, using the lookup instead of the LLM.
+    chat = TestChat(_get_config(), llm_completions=["  ask about pricing"])
+
+    chat >> "how much does it cost?"
+    chat << "It's ten dollars per month."
+    assert chat.llm.i == 1
+
+
+def test_next_step_from_similar_user_intent():
+    chat = TestChat(_get_config(0.0), llm_completions=["  ask about the price"])
+
+    chat >> "what's the price?"
+    chat << "It's ten dollars per month."
+    assert chat.llm.i == 1
+
+
+def test_next_step_from_llm():
+    chat = TestChat(
+        _get_config(None),
+        llm_completions=["  ask about the price", "  bot inform pricing"],
+    )
+
+    chat >> "what's the price?"
+    chat << "It's ten dollars per month."
+    assert chat.llm.i == 2
@@ -0,0 +1,309 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the parallel execution of the input and output rails."""
+import asyncio
+import time
+
+import pytest
+
+from nemoguardrails import RailsConfig
+from tests.utils import TestChat
+
+COLANG_CONTENT = """
+define user express greeting
+  "hi"
+
+define flow
+  user express greeting
+  bot express greeting
+
+define bot express greeting
+  "Hello!"
+
+define read-only subflow check keywords
+  $allowed = execute check_keywords(text=$user_message)
+  if not $allowed
+    bot refuse to respond
+    stop
+
+define read-only subflow check length
+  $allowed = execute check_length(text=$user_message)
+  if not $allowed
+    bot refuse to respond
+    stop
+
+define mutating subflow mask names
+  $user_message = execute mask_names(text=$user_message)
+
+define read-only subflow check names
+  $allowed = execute check_names(text=$user_message)
+  if not $allowed
+    bot refuse to respond
+    stop
+
+define subflow mask numbers
+  $user_message = execute mask_numbers(text=$user_message)
+
+define user ask secret
+  "tell me a secret"
+
+define flow
+  user ask secret
+  bot tell secret
+
+define read-only subflow check output keywords
+  $allowed = execute check_keywords(text=$bot_message)
+  if not $allowed
+    bot refuse to respond
+    stop
+
+define read-only subflow check output length
+  $allowed = execute check_length(text=$bot_message)
+  if not $allowed
+    bot refuse to respond
+    stop
+
+define mutating subflow mask output names
+  $bot_message = execute mask_names(text=$bot_message)
+"""
+
+
+def _get_chat(
+    parallel: bool,
+    flows: list,
+    delays: dict = None,
+    output_flows: list = None,
+    llm_completions: list = None,
+):
+    config = RailsConfig.from_content(
+        COLANG_CONTENT,
+        yaml_content=f"""
+            rails:
+              input:
+                parallel: {parallel}
+                flows: {flows}
+              output:
+                parallel: {parallel}
+                flows: {output_flows or []}
+        """,
+    )
+    chat = TestChat(config, llm_completions=llm_completions or ["  express greeting"])
+    delays = delays or {}
+    chat.cancelled = []
+
+    def _make_action(name, fn):
+        async def _action(text: str):
+            try:
+                await asyncio.sleep(delays.get(name, 0))
+            except asyncio.CancelledError:
+                chat.cancelled.append(name)
+                raise
+            return fn(text)
+
+        return _action
+
+    chat.app.register_action(
+        _make_action(
+            "check_keywords", lambda text: "dummy" not in text and "secret" not in text
+        ),
+        "check_keywords",
+    )
+    chat.app.register_action(
+        _make_action("check_length", lambda text: len(text) < 30), "check_length"
+    )
+    chat.app.register_action(
+        _make_action("check_names", lambda text: "John" not in text),
+        "check_names",
+    )
+    chat.app.register_action(
+        _make_action("mask_names", lambda text: text.replace("John", "<NAME>")),
+        "mask_names",
+    )
+    chat.app.register_action(
+        _make_action("mask_numbers", lambda text: "<MASKED>"),
+        "mask_numbers",
+    )
+
+    return chat
+
+
+def _summarize(activated_rails):
+    return [
+        (rail.type, rail.name, rail.decisions, rail.stop)
+        for rail in activated_rails
+        if rail.type in ["input", "output"]
+    ]
+
+
+@pytest.mark.parametrize(
+    "message,response",
+    [
+        ("hi", "Hello!"),
+        ("hi dummy", "I'm sorry, I can't respond to that."),
+        ("hi, this is a very long message", "I'm sorry, I can't respond to that."),
+    ],
+)
+def test_parallel_matches_sequential(message, response):
+    flows = ["check keywords", "check length"]
+
+    results = []
+    for parallel in [False, True]:
+        chat = _get_chat(parallel, flows)
+        res = chat.app.generate(message, options={"log": {"activated_rails": True}})
+
+        assert res.response == response
+        results.append(_summarize(res.log.activated_rails))
+
+    assert results[0] == results[1]
+
+
+def test_parallel_rails_run_concurrently():
+    chat = _get_chat(
+        True,
+        ["check keywords", "check length"],
+        delays={"check_keywords": 0.5, "check_length": 0.5},
+    )
+
+    start = time.time()
+    chat >> "hi"
+    chat << "Hello!"
+
+    assert time.time() - start < 0.9
+
+
+def test_parallel_rails_cancelled_on_stop():
+    chat = _get_chat(
+        True,
+        ["check keywords", "check length"],
+        delays={"check_keywords": 5},
+    )
+
+    start = time.time()
+    res = chat.app.generate(
+        "hi, this is a very long message",
+        options={"log": {"activated_rails": True}, "output_vars": True},
+    )
+
+    assert res.response == "I'm sorry, I can't respond to that."
+    assert time.time() - start < 2
+    assert chat.cancelled == ["check_keywords"]
+    assert res.output_data["triggered_input_rail"] == "check length"
+
+    # The rail that was cancelled is not reported as activated.
+    activated_rails = [rail for rail in res.log.activated_rails if rail.type == "input"]
+    assert len(activated_rails) == 1
+    assert activated_rails[0].name == "check length"
+    assert activated_rails[0].stop
+
+
+def test_parallel_rails_user_message_alteration_order():
+    # The alterations are applied in the order of the rails, regardless of which
+    # rail finishes first.
+    for delays in [{"mask_names": 0.2}, {"mask_numbers": 0.2}]:
+        chat = _get_chat(True, ["mask names", "mask numbers"], delays=delays)
+        res = chat.app.generate("hi John", options={"output_vars": True})
+
+        assert res.output_data["user_message"] == "<MASKED>"
+        assert res.output_data["triggered_input_rail"] is None
+
+
+def test_parallel_rails_mutating_rails_are_ordered():
+    # The check must see the message masked by the previous rail.
+    chat = _get_chat(True, ["mask names", "check names"], delays={"mask_names": 0.2})
+    res = chat.app.generate("hi John", options={"output_vars": True})
+
+    assert res.response == "Hello!"
+    assert res.output_data["user_message"] == "hi <NAME>"
+
+
+def test_parallel_rails_unmarked_rails_are_mutating():
+    # The rails which are not declared as read-only may alter the message, so the
+    # check must see the message masked by the previous rail.
+    chat = _get_chat(
+        True, ["mask numbers", "check names"], delays={"mask_numbers": 0.2}
+    )
+    res = chat.app.generate("hi John", options={"output_vars": True})
+
+    assert res.response == "Hello!"
+    assert res.output_data["user_message"] == "<MASKED>"
+
+
+@pytest.mark.parametrize(
+    "output_flows,response",
+    [
+        (["check output length", "mask output names"], "The secret of <NAME> is 42."),
+        (
+            ["mask output names", "check output keywords", "check output length"],
+            "I'm sorry, I can't respond to that.",
+        ),
+    ],
+)
+def test_parallel_output_rails_match_sequential(output_flows, response):
+    results = []
+    for parallel in [False, True]:
+        chat = _get_chat(
+            parallel,
+            [],
+            output_flows=output_flows,
+            llm_completions=["  ask secret", '  "The secret of John is 42."'],
+        )
+        res = chat.app.generate(
+            "tell me a secret", options={"log": {"activated_rails": True}}
+        )
+
+        assert res.response == response
+        results.append(_summarize(res.log.activated_rails))
+
+    assert results[0] == results[1]
+
+
+def test_parallel_output_rails_run_concurrently():
+    chat = _get_chat(
+        True,
+        [],
+        delays={"check_keywords": 0.5, "check_length": 0.5},
+        output_flows=["check output keywords", "check output length"],
+        llm_completions=["  ask secret", '  "Hello there."'],
+    )
+
+    start = time.time()
+    chat >> "tell me a secret"
+    chat << "Hello there."
+
+    assert time.time() - start < 0.9
+
+
+@pytest.mark.parametrize(
+    "message",
+    ["hi", "hi, this is a very long message"],
+)
+def test_parallel_rails_events_match_sequential(message):
+    flows = ["check keywords", "check length"]
+
+    results = []
+    for parallel in [False, True]:
+        chat = _get_chat(parallel, flows)
+        res = chat.app.generate(message, options={"log": {"internal_events": True}})
+
+        results.append(
+            [
+                (event["type"], event.get("flow_id"))
+                for event in res.log.internal_events
+                if event["type"] in ["StartInputRail", "InputRailFinished"]
+            ]
+        )
+
+    assert results[0] == results[1]
@@ -0,0 +1,68 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from time import time
+
+import pytest
+
+from nemoguardrails import RailsConfig
+from nemoguardrails.colang.v1_0.runtime.flows import FlowsIndex, compute_next_steps
+from nemoguardrails.colang.v1_0.runtime.runtime import RuntimeV1_0
+
+
+def _get_runtime(num_flows: int) -> RuntimeV1_0:
+    colang_content = ""
+    for i in range(num_flows):
+        colang_content += f"""
+define flow flow_{i}
+  user intent_{i}
+  bot response_{i}
+"""
+    config = RailsConfig.from_content(colang_content=colang_content)
+    return RuntimeV1_0(config=config)
+
+
+def _measure(runtime: RuntimeV1_0, flows_index, num_iterations: int = 100) -> float:
+    events = [
+        {"type": "UtteranceUserActionFinished", "final_transcript": "hi"},
+        {"type": "UserIntent", "intent": "intent_0"},
+    ]
+
+    t0 = time()
+    for _ in range(num_iterations):
+        next_steps = compute_next_steps(
+            events,
+            runtime.flow_configs,
+            rails_config=runtime.config,
+            processing_log=[],
+            flows_index=flows_index,
+        )
+        assert next_steps[0]["intent"] == "response_0"
+
+    return (time() - t0) / num_iterations
+
+
+@pytest.mark.skip(reason="Run manually.")
+def test_flows_index_scaling():
+    for num_flows in [50, 500, 5000]:
+        runtime = _get_runtime(num_flows)
+
+        without_index = _measure(runtime, flows_index=None)
+        with_index = _measure(runtime, flows_index=FlowsIndex())
+
+        print(
+            f"\n{num_flows} flows: {without_index * 1000:.3f} ms without index, "
+            f"{with_index * 1000:.3f} ms with index"
+        )
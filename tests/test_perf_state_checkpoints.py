@@ -0,0 +1,72 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from time import time
+
+import pytest
+
+from nemoguardrails import LLMRails, RailsConfig
+from tests.utils import FakeLLM
+
+COLANG_CONTENT = """
+define user express greeting
+  "hello"
+
+define flow
+  user express greeting
+  bot express greeting
+
+define bot express greeting
+  "Hello World!"
+"""
+
+
+async def _measure_turn_latencies(num_turns: int, use_checkpoints: bool):
+    config = RailsConfig.from_content(colang_content=COLANG_CONTENT)
+    llm = FakeLLM(responses=["  express greeting"] * num_turns)
+    rails = LLMRails(config, llm=llm)
+
+    if not use_checkpoints:
+        rails.runtime.state_checkpoints = None
+
+    messages = []
+    latencies = []
+    for i in range(num_turns):
+        messages.append({"role": "user", "content": f"hello {i}"})
+
+        t0 = time()
+        response = await rails.generate_async(messages=messages)
+        latencies.append(time() - t0)
+
+        assert response["content"] == "Hello World!"
+        messages.append(response)
+
+    return latencies
+
+
+@pytest.mark.skip(reason="Run manually.")
+@pytest.mark.asyncio
+async def test_turn_latency_with_history_length():
+    num_turns = 200
+
+    for use_checkpoints in [False, True]:
+        latencies = await _measure_turn_latencies(num_turns, use_checkpoints)
+
+        print(f"\nState checkpoints: {use_checkpoints}")
+        for turn in [1, 10, 50, 100, 200]:
+            # We average over a small window to reduce the noise.
+            window = latencies[max(0, turn - 5) : turn]
+            avg = sum(window) / len(window)
+            print(f"Turn {turn}: {avg * 1000:.2f} ms")
@@ -0,0 +1,169 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the speculative generation of the bot message during the input rails."""
+import asyncio
+import time
+
+import pytest
+
+from nemoguardrails import RailsConfig
+from nemoguardrails.context import llm_stats_var
+from tests.utils import TestChat
+
+COLANG_CONTENT = """
+define subflow check keywords
+  $allowed = execute check_keywords(text=$user_message)
+  if not $allowed
+    bot refuse to respond
+    stop
+
+define mutating subflow mask names
+  $user_message = execute mask_names(text=$user_message)
+
+define subflow retrieve chunks
+  $relevant_chunks = execute retrieve_chunks(text=$user_message)
+
+define bot refuse to respond
+  "I'm sorry, I can't respond to that."
+"""
+
+
+def _get_chat(speculative_generation: bool, flows: list, delay: float = 0.5):
+    config = RailsConfig.from_content(
+        COLANG_CONTENT,
+        yaml_content=f"""
+            passthrough: True
+            rails:
+              input:
+                speculative_generation: {speculative_generation}
+                flows: {flows}
+        """,
+    )
+    chat = TestChat(config)
+    chat.prompts = []
+
+    async def check_keywords(text: str):
+        await asyncio.sleep(delay)
+        return "dummy" not in text
+
+    async def mask_names(text: str):
+        await asyncio.sleep(delay)
+        return text.replace("John", "<NAME>")
+
+    async def retrieve_chunks(text: str):
+        await asyncio.sleep(delay)
+        return "Some chunks."
+
+    async def passthrough_fn(context: dict, events: list):
+        chat.prompts.append(context["user_message"])
+        await asyncio.sleep(delay)
+        if context.get("relevant_chunks"):
+            return f"Echo: {context['user_message']} ({context['relevant_chunks']})"
+        return f"Echo: {context['user_message']}"
+
+    chat.app.register_action(check_keywords, "check_keywords")
+    chat.app.register_action(mask_names, "mask_names")
+    chat.app.register_action(retrieve_chunks, "retrieve_chunks")
+    chat.app.llm_generation_actions.passthrough_fn = passthrough_fn
+
+    return chat
+
+
+async def _generate(chat, message: str):
+    start = time.time()
+    response = await chat.app.generate_async(
+        messages=[{"role": "user", "content": message}]
+    )
+
+    return response["content"], time.time() - start, llm_stats_var.get()
+
+
+@pytest.mark.asyncio
+async def test_speculative_generation_allowed():
+    for speculative_generation in [False, True]:
+        chat = _get_chat(speculative_generation, ["check keywords"])
+        content, duration, _ = await _generate(chat, "hi")
+
+        assert content == "Echo: hi"
+        assert chat.prompts == ["hi"]
+
+        # The generation and the input rails run concurrently.
+        if speculative_generation:
+            assert duration < 0.9
+        else:
+            assert duration >= 1
+
+
+@pytest.mark.asyncio
+async def test_speculative_generation_blocked():
+    chat = _get_chat(True, ["check keywords"], delay=0.2)
+    content, _, llm_stats = await _generate(chat, "hi dummy")
+
+    assert content == "I'm sorry, I can't respond to that."
+    assert llm_stats.get_stat("speculative_generations") == 1
+    assert llm_stats.get_stat("speculative_wasted_generations") == 1
+
+
+@pytest.mark.asyncio
+async def test_speculative_generation_altered_input():
+    chat = _get_chat(True, ["mask names"], delay=0.2)
+    content, _, llm_stats = await _generate(chat, "hi John")
+
+    # The generation is done again for the altered message.
+    assert content == "Echo: hi <NAME>"
+    assert chat.prompts == ["hi John", "hi <NAME>"]
+    assert llm_stats.get_stat("speculative_wasted_generations") == 1
+
+
+@pytest.mark.asyncio
+async def test_speculative_generation_altered_context():
+    chat = _get_chat(True, ["retrieve chunks"], delay=0.2)
+    content, _, llm_stats = await _generate(chat, "hi")
+
+    # The generation read the relevant chunks, which were set by the input rails.
+    assert content == "Echo: hi (Some chunks.)"
+    assert chat.prompts == ["hi", "hi"]
+    assert llm_stats.get_stat("speculative_wasted_generations") == 1
+
+
+@pytest.mark.asyncio
+async def test_speculative_generation_unread_context():
+    chat = _get_chat(True, ["check keywords"], delay=0.2)
+    _, _, llm_stats = await _generate(chat, "hi")
+
+    # The `$allowed` variable is set by the input rails, but not read by the generation.
+    assert llm_stats.get_stat("speculative_generations") == 1
+    assert llm_stats.get_stat("speculative_wasted_generations") == 0
+
+
+@pytest.mark.asyncio
+async def test_speculative_generation_processing_log():
+    chat = _get_chat(True, ["check keywords"], delay=0)
+    res = await chat.app.generate_async(
+        messages=[{"role": "user", "content": "hi"}],
+        options={"log": {"internal_events": True}},
+    )
+
+    assert res.response[0]["content"] == "Echo: hi"
+
+    # The generation is reported as a regular action.
+    finished = [
+        event
+        for event in res.log.internal_events
+        if event["type"] == "InternalSystemActionFinished"
+        and event["action_name"] == "generate_user_intent"
+    ]
+    assert len(finished) == 1
@@ -0,0 +1,279 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the incremental processing of the history using state checkpoints."""
+import copy
+
+from nemoguardrails import RailsConfig
+from nemoguardrails.colang.v1_0.runtime.flows import (
+    StateCheckpoints,
+    compute_context,
+    compute_next_steps,
+    get_context_snapshot,
+)
+from tests.utils import TestChat
+
+COLANG_CONTENT = """
+define user express greeting
+  "hello"
+
+define user ask capabilities
+  "what can you do?"
+
+define flow greeting
+  user express greeting
+  bot express greeting
+  do offer help
+
+define subflow offer help
+  bot offer to help
+
+define flow capabilities
+  user ask capabilities
+  $count = 1
+  bot inform capabilities
+  if $count == 1
+    bot ask if anything else
+
+define bot express greeting
+  "Hello there!"
+
+define bot offer to help
+  "How can I help you?"
+
+define bot inform capabilities
+  "I can help with many things."
+
+define bot ask if anything else
+  "Anything else?"
+"""
+
+
+def _strip_volatile(next_steps):
+    """Removes the fields that are different for each generated event."""
+    return [
+        {
+            k: v
+            for k, v in step.items()
+            if k not in ["uid", "event_created_at", "action_uid"]
+        }
+        for step in next_steps
+    ]
+
+
+def _run_conversation():
+    config = RailsConfig.from_content(COLANG_CONTENT)
+    chat = TestChat(
+        config,
+        llm_completions=[
+            "  express greeting",
+            "  ask capabilities",
+            "  express greeting",
+        ],
+    )
+
+    chat >> "hello"
+    chat << "Hello there!\nHow can I help you?"
+    chat >> "what can you do?"
+    chat << "I can help with many things.\nAnything else?"
+    chat >> "hello"
+    chat << "Hello there!\nHow can I help you?"
+
+    return chat
+
+
+def test_checkpoints_are_used_across_turns():
+    chat = _run_conversation()
+
+    # The runtime should have recorded checkpoints for the processed histories.
+    assert len(chat.app.runtime.state_checkpoints) > 0
+
+
+def test_incremental_matches_full_replay():
+    chat = _run_conversation()
+    runtime = chat.app.runtime
+
+    # We take the full history of the last turn and compare, for every prefix,
+    # the next steps computed incrementally with the ones from a full replay.
+    events = chat.app.events_history_cache.get(chat.history)
+
+    state_checkpoints = StateCheckpoints()
+    for i in range(1, len(events) + 1):
+        incremental = compute_next_steps(
+            events[0:i],
+            runtime.flow_configs,
+            rails_config=runtime.config,
+            processing_log=[],
+            state_checkpoints=state_checkpoints,
+        )
+        full = compute_next_steps(
+            events[0:i],
+            runtime.flow_configs,
+            rails_config=runtime.config,
+            processing_log=[],
+        )
+
+        assert _strip_volatile(incremental) == _strip_volatile(full)
+
+
+def test_branching_histories_do_not_share_state():
+    chat = _run_conversation()
+    runtime = chat.app.runtime
+    events = chat.app.events_history_cache.get(chat.history)
+
+    state_checkpoints = StateCheckpoints()
+    prefix = events[0:5]
+    compute_next_steps(
+        prefix,
+        runtime.flow_configs,
+        rails_config=runtime.config,
+        processing_log=[],
+        state_checkpoints=state_checkpoints,
+    )
+
+    # Two histories branching from the same prefix should resume from the same
+    # checkpoint without affecting each other. The second branch uses copies of
+    # the events, so it can only match the checkpoint for the prefix.
+    branches = [
+        events,
+        prefix + [dict(event) for event in events[5:]],
+    ]
+    for history in branches:
+        incremental = compute_next_steps(
+            history,
+            runtime.flow_configs,
+            rails_config=runtime.config,
+            processing_log=[],
+            state_checkpoints=state_checkpoints,
+        )
+        full = compute_next_steps(
+            history,
+            runtime.flow_configs,
+            rails_config=runtime.config,
+            processing_log=[],
+        )
+        assert _strip_volatile(incremental) == _strip_volatile(full)
+
+
+def test_checkpoints_max_size():
+    chat = _run_conversation()
+    runtime = chat.app.runtime
+    events = chat.app.events_history_cache.get(chat.history)
+
+    state_checkpoints = StateCheckpoints(max_size=3)
+    for i in range(1, len(events) + 1):
+        compute_next_steps(
+            events[0:i],
+            runtime.flow_configs,
+            rails_config=runtime.config,
+            processing_log=[],
+            state_checkpoints=state_checkpoints,
+        )
+
+    assert len(state_checkpoints) == 3
+
+
+def test_checkpoints_max_size_config():
+    config = RailsConfig.from_content(
+        COLANG_CONTENT, config={"core": {"state_checkpoints": {"max_size": 3}}}
+    )
+    chat = TestChat(config, llm_completions=["  express greeting"])
+
+    assert chat.app.runtime.state_checkpoints.max_size == 3
+
+
+def test_checkpoints_invalidated_by_replaced_flow():
+    chat = _run_conversation()
+    runtime = chat.app.runtime
+    events = chat.app.events_history_cache.get(chat.history)
+
+    state_checkpoints = StateCheckpoints()
+    compute_next_steps(
+        events,
+        runtime.flow_configs,
+        rails_config=runtime.config,
+        processing_log=[],
+        state_checkpoints=state_checkpoints,
+    )
+    assert state_checkpoints.find(events, runtime.flow_configs) is not None
+
+    # The number of flows is the same, but one of them was replaced.
+    runtime.flow_configs["greeting"] = copy.copy(runtime.flow_configs["greeting"])
+    assert state_checkpoints.find(events, runtime.flow_configs) is None
+
+
+def test_context_snapshot_matches_compute_context():
+    chat = _run_conversation()
+    runtime = chat.app.runtime
+    events = chat.app.events_history_cache.get(chat.history)
+
+    # We add a context update to make sure it's also tracked incrementally.
+    events = events + [{"type": "ContextUpdate", "data": {"user_name": "John"}}]
+
+    state_checkpoints = StateCheckpoints()
+    for i in range(1, len(events) + 1):
+        compute_next_steps(
+            events[0:i],
+            runtime.flow_configs,
+            rails_config=runtime.config,
+            processing_log=[],
+            state_checkpoints=state_checkpoints,
+        )
+
+        # The snapshot for the history with one more event is computed from
+        # the checkpoint of the current one.
+        for history in [events[0:i], events[0 : i + 1]]:
+            snapshot = get_context_snapshot(history, state_checkpoints)
+            assert dict(snapshot) == compute_context(history)
+
+    assert snapshot["user_name"] == "John"
+
+
+def test_context_snapshot_is_a_copy():
+    chat = _run_conversation()
+    events = chat.app.events_history_cache.get(chat.history)
+
+    snapshot = get_context_snapshot(events, chat.app.runtime.state_checkpoints)
+    assert snapshot["last_bot_message"] == "How can I help you?"
+
+    # Altering the snapshot does not alter the context of the checkpoints.
+    snapshot["last_bot_message"] = "Something else"
+    snapshot = get_context_snapshot(events, chat.app.runtime.state_checkpoints)
+    assert snapshot["last_bot_message"] == "How can I help you?"
+
+
+def test_actions_can_alter_the_context():
+    config = RailsConfig.from_content(
+        """
+        define user express greeting
+          "hello"
+
+        define flow
+          user express greeting
+          $result = execute alter_context
+          bot $result
+        """
+    )
+    chat = TestChat(config, llm_completions=["  express greeting"])
+
+    def alter_context(context: dict):
+        # The context passed to the actions is a regular dict.
+        context["user_message"] = "altered"
+        return copy.deepcopy(context)["user_message"]
+
+    chat.app.register_action(alter_context)
+
+    chat >> "hello"
+    chat << "altered"
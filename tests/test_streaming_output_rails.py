@@ -0,0 +1,366 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the output rails on the streamed chunks."""
+import asyncio
+
+import pytest
+
+from nemoguardrails import RailsConfig
+from nemoguardrails.streaming import (
+    ChunkWindowBuffer,
+    StreamingHandler,
+    StreamingViolationError,
+)
+from tests.utils import TestChat
+
+COLANG_CONTENT = """
+define user express greeting
+  "hi"
+
+define flow
+  user express greeting
+  bot express greeting
+
+define subflow check output keywords
+  $allowed = execute check_keywords(text=$bot_message)
+  if not $allowed
+    bot refuse to respond
+    stop
+
+define bot refuse to respond
+  "I'm sorry, I can't respond to that."
+"""
+
+
+def test_chunk_window_buffer_tokens():
+    buffer = ChunkWindowBuffer(window_size=3, window_overlap=1)
+
+    assert not buffer.add("a ")
+    assert not buffer.add("b ")
+    assert buffer.add("c ")
+    assert buffer.text == "a b c "
+
+    assert buffer.release() == ["a ", "b ", "c "]
+    assert buffer.context_text == "c "
+
+    buffer.add("d ")
+    assert buffer.text == "c d "
+
+
+def test_chunk_window_buffer_sentences():
+    buffer = ChunkWindowBuffer(window_size=2, window_overlap=1, window_unit="sentences")
+
+    for chunk in ["Hi ", "there. ", "How ", "are "]:
+        assert not buffer.add(chunk)
+    assert buffer.add("you? ")
+
+    buffer.release()
+    assert buffer.context_text == "How are you? "
+
+
+def test_chunk_window_buffer_unknown_unit():
+    with pytest.raises(ValueError):
+        ChunkWindowBuffer(window_unit="words")
+
+
+def _get_chat(on_violation: str = "message", window_size: int = 2):
+    config = RailsConfig.from_content(
+        COLANG_CONTENT,
+        config={
+            "models": [],
+            "streaming": True,
+            "rails": {
+                "output": {
+                    "flows": ["check output keywords"],
+                    "streaming": {
+                        "enabled": True,
+                        "window_size": window_size,
+                        "window_overlap": 1,
+                        "on_violation": on_violation,
+                    },
+                }
+            },
+        },
+    )
+    chat = TestChat(
+        config,
+        llm_completions=["  express greeting", '  "Hello there! This is a secret."'],
+        streaming=True,
+    )
+    chat.checked = []
+
+    def check_keywords(text: str):
+        chat.checked.append(text)
+        return "secret" not in text
+
+    chat.app.register_action(check_keywords, "check_keywords")
+
+    return chat
+
+
+async def _stream(chat):
+    return [
+        chunk
+        async for chunk in chat.app.stream_async(
+            messages=[{"role": "user", "content": "hi"}]
+        )
+    ]
+
+
+@pytest.mark.asyncio
+async def test_streaming_output_rails_allowed():
+    chat = _get_chat()
+    chat.app.register_action(lambda text: True, "check_keywords")
+
+    chunks = await _stream(chat)
+
+    assert "".join(chunks) == "Hello there! This is a secret."
+
+
+@pytest.mark.asyncio
+async def test_streaming_output_rails_windows():
+    chat = _get_chat()
+
+    chunks = await _stream(chat)
+
+    # The windows before the violation are streamed, and the overlap is checked again.
+    assert chunks == [
+        "Hello ",
+        "there! ",
+        "This ",
+        "is ",
+        "I'm sorry, I can't respond to that.",
+    ]
+    assert chat.checked == [
+        "Hello there! ",
+        "there! This is ",
+        "is a secret.",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_streaming_output_rails_error():
+    chat = _get_chat(on_violation="error", window_size=2)
+
+    chunks = []
+    with pytest.raises(StreamingViolationError) as exc_info:
+        async for chunk in chat.app.stream_async(
+            messages=[{"role": "user", "content": "hi"}]
+        ):
+            chunks.append(chunk)
+
+    # The error is raised after the allowed chunks, and is not part of the text.
+    assert chunks == ["Hello ", "there! ", "This ", "is "]
+    assert exc_info.value.rail == "check output keywords"
+
+
+@pytest.mark.asyncio
+async def test_streaming_output_rails_stop():
+    chat = _get_chat(on_violation="stop", window_size=10)
+
+    chunks = await _stream(chat)
+
+    assert chunks == []
+
+
+@pytest.mark.asyncio
+async def test_streaming_output_rails_response():
+    chat = _get_chat()
+
+    response = await chat.app.generate_async(
+        messages=[{"role": "user", "content": "hi"}],
+        streaming_handler=StreamingHandler(),
+    )
+
+    # The response is what was actually streamed.
+    assert (
+        response["content"]
+        == "Hello there! This is I'm sorry, I can't respond to that."
+    )
+
+
+def test_chunk_window_buffer_rewritten_context():
+    buffer = ChunkWindowBuffer(window_size=2, window_overlap=1)
+    buffer.add("Hello ")
+    buffer.add("there! ")
+    buffer.release()
+    buffer.add("This ")
+    buffer.add("is ")
+
+    # Only the part of the new chunks is returned, even if the context was altered.
+    assert buffer.get_rewritten_text("there! This is ") == "This is "
+    assert buffer.get_rewritten_text("XXXX! This is ") == "This is "
+    assert buffer.get_rewritten_text("XXXX! XXXX is ") == "XXXX is "
+    assert buffer.get_rewritten_text("XXXX!") == ""
+
+
+def test_streaming_output_rails_invalid_config():
+    with pytest.raises(ValueError):
+        RailsConfig.from_content(
+            COLANG_CONTENT,
+            config={
+                "models": [],
+                "rails": {"output": {"streaming": {"on_violation": "drop"}}},
+            },
+        )
+
+    with pytest.raises(ValueError):
+        RailsConfig.from_content(
+            COLANG_CONTENT,
+            config={
+                "models": [],
+                "rails": {"output": {"streaming": {"window_unit": "words"}}},
+            },
+        )
+
+
+@pytest.mark.asyncio
+async def test_streaming_output_rails_masking():
+    chat = _get_chat()
+
+    def check_keywords(text: str):
+        chat.checked.append(text)
+        return True
+
+    chat.app.register_action(check_keywords, "check_keywords")
+
+    # A rail that masks a word, which is also in the context of the next window.
+    original_run_output_rails = chat.app.runtime.run_output_rails
+
+    async def run_output_rails(bot_message, events):
+        result = await original_run_output_rails(bot_message, events)
+        result.context_updates["bot_message"] = bot_message.replace("there", "XXXX")
+        return result
+
+    chat.app.runtime.run_output_rails = run_output_rails
+
+    chunks = await _stream(chat)
+
+    assert "".join(chunks) == "Hello XXXX! This is a secret."
+
+
+@pytest.mark.asyncio
+async def test_streaming_output_rails_generation_error():
+    chat = _get_chat()
+
+    async def generate_events(events, processing_log=None):
+        raise RuntimeError("Generation failed.")
+
+    chat.app.runtime.generate_events = generate_events
+
+    streaming_handler = StreamingHandler()
+    with pytest.raises(RuntimeError):
+        await chat.app.generate_async(
+            messages=[{"role": "user", "content": "hi"}],
+            streaming_handler=streaming_handler,
+        )
+
+    # The stream is closed.
+    chunks = await asyncio.wait_for(_collect(streaming_handler), timeout=5)
+    assert chunks == []
+
+
+async def _collect(streaming_handler):
+    return [chunk async for chunk in streaming_handler]
+
+
+@pytest.mark.asyncio
+async def test_streaming_output_rails_passthrough():
+    # Without user messages, the passthrough generation happens with the user intent.
+    config = RailsConfig.from_content(
+        COLANG_CONTENT.replace('define user express greeting\n  "hi"\n', ""),
+        config={
+            "models": [],
+            "streaming": True,
+            "passthrough": True,
+            "rails": {
+                "output": {
+                    "flows": ["check output keywords"],
+                    "streaming": {
+                        "enabled": True,
+                        "window_size": 2,
+                        "window_overlap": 1,
+                    },
+                }
+            },
+        },
+    )
+    chat = TestChat(config, llm_completions=["Hello there!"], streaming=True)
+    checked = []
+
+    def check_keywords(text: str):
+        checked.append(text)
+        return True
+
+    chat.app.register_action(check_keywords, "check_keywords")
+
+    streaming_handler = StreamingHandler()
+    response = await chat.app.generate_async(
+        messages=[{"role": "user", "content": "hi"}],
+        streaming_handler=streaming_handler,
+    )
+
+    # The output rails are not run again on the full message.
+    assert response["content"] == "Hello there!"
+    assert "".join(await _collect(streaming_handler)) == "Hello there!"
+    assert checked == ["Hello there!"]
+
+
+@pytest.mark.asyncio
+async def test_streaming_output_rails_masked_user_message():
+    config = RailsConfig.from_content(
+        COLANG_CONTENT
+        + """
+define subflow mask user message
+  $user_message = execute mask_names(text=$user_message)
+
+define subflow check output user message
+  execute record_user_message(text=$user_message)
+""",
+        config={
+            "models": [],
+            "streaming": True,
+            "rails": {
+                "input": {"flows": ["mask user message"]},
+                "output": {
+                    "flows": ["check output user message"],
+                    "streaming": {"enabled": True, "window_size": 2},
+                },
+            },
+        },
+    )
+    chat = TestChat(
+        config,
+        llm_completions=["  express greeting", '  "Hello there!"'],
+        streaming=True,
+    )
+    user_messages = []
+
+    chat.app.register_action(lambda text: text.replace("John", "<NAME>"), "mask_names")
+    chat.app.register_action(
+        lambda text: user_messages.append(text), "record_user_message"
+    )
+
+    chunks = [
+        chunk
+        async for chunk in chat.app.stream_async(
+            messages=[{"role": "user", "content": "hi John"}]
+        )
+    ]
+
+    # The output rails see the user message after the input rails.
+    assert "".join(chunks) == "Hello there!"
+    assert user_messages and set(user_messages) == {"hi <NAME>"}
@@ -0,0 +1,107 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the exact matching of the user message examples."""
+import pytest
+
+from nemoguardrails import RailsConfig
+from nemoguardrails.actions.llm.generation import LLMGenerationActions
+from nemoguardrails.actions.llm.utils import normalize_user_message
+from nemoguardrails.context import llm_stats_var
+from nemoguardrails.embeddings.index import IndexItem
+from tests.utils import TestChat
+
+config = RailsConfig.from_content(
+    """
+    define user express greeting
+      "hi"
+      "Hello there!"
+
+    define user ask about the weather
+      "how is the weather today?"
+
+    define bot express greeting
+      "Hello!"
+
+    define bot express weather
+      "It's sunny."
+
+    define flow
+      user express greeting
+      bot express greeting
+
+    define flow
+      user ask about the weather
+      bot express weather
+    """,
+    """
+    rails:
+        dialog:
+            user_messages:
+                exact_match: True
+    """,
+)
+
+
+def test_normalize_user_message():
+    assert normalize_user_message("  Hello   There! ") == "hello there"
+    assert normalize_user_message("How is the weather today?") == (
+        "how is the weather today"
+    )
+
+
+def test_ambiguous_examples_are_not_matched():
+    lookup = LLMGenerationActions._build_user_message_lookup(
+        [
+            IndexItem(text="hi", meta={"intent": "express greeting"}),
+            IndexItem(text="Hi!", meta={"intent": "express greeting"}),
+            IndexItem(text="ok", meta={"intent": "express agreement"}),
+            IndexItem(text="OK.", meta={"intent": "express understanding"}),
+        ]
+    )
+
+    assert lookup == {"hi": "express greeting"}
+
+
+def test_exact_match_skips_the_llm():
+    # No LLM completions, so the user intents must come from the exact matches.
+    chat = TestChat(config, llm_completions=[])
+
+    chat >> "hello there"
+    chat << "Hello!"
+    chat >> "How is the WEATHER today"
+    chat << "It's sunny."
+
+
+@pytest.mark.asyncio
+async def test_exact_match_stats():
+    chat = TestChat(config, llm_completions=["  ask about the weather"])
+
+    res = await chat.app.generate_async(
+        messages=[{"role": "user", "content": "Hi!"}],
+        options={"log": {"activated_rails": True}},
+    )
+    assert res.response[0]["content"] == "Hello!"
+    assert res.log.stats.intent_exact_match_lookups == 1
+    assert res.log.stats.intent_exact_match_hits == 1
+    assert res.log.stats.llm_calls_count == 0
+
+    await chat.app.generate_async(
+        messages=[{"role": "user", "content": "will it rain tomorrow?"}]
+    )
+    llm_stats = llm_stats_var.get()
+    assert llm_stats.get_stat("intent_exact_match_lookups") == 1
+    assert llm_stats.get_stat("intent_exact_match_hits") == 0
+    assert llm_stats.get_intent_exact_match_hit_rate() == 0.0
@@ -13,9 +13,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
 import pytest
 
-from nemoguardrails.utils import new_event_dict
+from nemoguardrails.utils import get_timestamp, new_event_dict, set_event_validation
 
 
 def test_event_generation():
@@ -119,3 +123,40 @@ def test_wrong_property_type():
             event_type,
             script=script,
         )
+
+
+def test_event_validation_disabled():
+    set_event_validation(False)
+    try:
+        e = new_event_dict("StartUtteranceBotAction", script=1)
+        assert e["script"] == 1
+    finally:
+        set_event_validation(True)
+
+
+def test_event_uids():
+    uids = [new_event_dict("UserIntent", intent="greet")["uid"] for _ in range(3)]
+
+    assert len(set(uids)) == 3
+    assert uids == sorted(uids)
+    for uid in uids:
+        uuid.UUID(uid)
+
+
+def test_timestamp_format():
+    timestamp = get_timestamp()
+
+    assert datetime.fromisoformat(timestamp).tzinfo == timezone.utc
+    assert timestamp <= datetime.now(timezone.utc).isoformat()
+
+
+def test_timestamp_threads():
+    def _check_timestamps():
+        for _ in range(1000):
+            before = datetime.now(timezone.utc)
+            timestamp = datetime.fromisoformat(get_timestamp())
+            assert before <= timestamp <= datetime.now(timezone.utc)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for future in [executor.submit(_check_timestamps) for _ in range(4)]:
+            future.result()